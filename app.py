@@ -4,26 +4,61 @@ Run with: python app.py
 """
 
 import os
+import click
 from website import create_app, db
-from website.models import User, Prediction
+from website.jobs import importing_main
+from website.models import User, Prediction, PredictionHistory
 
-# Create Flask application
-app = create_app(os.getenv('FLASK_ENV', 'development'))
+def register_commands(app):
+    """Shell context and CLI commands of the application"""
+    
+    @app.shell_context_processor
+    def make_shell_context():
+        """Create shell context for flask shell"""
+        return {
+            'db': db,
+            'User': User,
+            'Prediction': Prediction
+        }
+
+    @app.cli.command()
+    def init_db():
+        """Initialize the database"""
+        db.create_all()
+        print('✓ Database initialized')
+
+    @app.cli.command()
+    def rebuild_stats():
+        """Rebuild the per-user prediction counters from the predictions table"""
+        PredictionHistory.upgrade_schema()
+        rows = PredictionHistory.rebuild()
+        print(f'✓ Rebuilt {rows} prediction counters')
 
-@app.shell_context_processor
-def make_shell_context():
-    """Create shell context for flask shell"""
-    return {
-        'db': db,
-        'User': User,
-        'Prediction': Prediction
-    }
+    @app.cli.command()
+    @click.argument('types', nargs=-1)
+    @click.option('--new-trees', default=10, show_default=True, help='trees fitted on each window')
+    @click.option('--max-trees', type=int, default=None, help='retire the oldest trees beyond this many')
+    @click.option('--min-rows', default=10, show_default=True, help='outcomes needed before updating')
+    def update_models(types, new_trees, max_trees, min_rows):
+        """Add trees fitted on newly recorded outcomes to the served models"""
+        from website.ml_models import MODEL_ARTIFACTS
+        from website.updates import update_from_predictions
+        for prediction_type in types or MODEL_ARTIFACTS:
+            entry = update_from_predictions(prediction_type, app.config['MODELS_DIR'], new_trees, max_trees,
+                                            min_rows)
+            if entry is None:
+                print(f'- {prediction_type}: fewer than {min_rows} new outcomes, skipped')
+                continue
+            print(f"✓ {prediction_type}: {entry['rows']} rows, +{entry['trees_added']}/-{entry['trees_retired']} trees "
+                  f"({entry['n_estimators']} total) in {entry['seconds']:.2f}s; "
+                  f"holdout {entry['before']} -> {entry['after']}, drift {entry['drift']}")
 
-@app.cli.command()
-def init_db():
-    """Initialize the database"""
-    db.create_all()
-    print('✓ Database initialized')
+# Create Flask application; a spawned scoring-job worker re-importing this
+# module skips it and builds only its own database and model context
+# (see website/jobs.py)
+app = None if importing_main() else create_app(os.getenv('FLASK_ENV', 'development'))
+if app is not None:
+    register_commands(app)
 
 if __name__ == '__main__':
     # Create necessary directories
@@ -1,33 +1,369 @@
-from fastapi import FastAPI
-import joblib
+from contextlib import asynccontextmanager
 
-app = FastAPI(title="Smart City ML Platform")
+import asyncio
+
+import numpy as np
+from fastapi import Body, FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 
 import os
+import sys
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MODELS_DIR = os.path.join(BASE_DIR, '..', 'models')
 
-# Load models
-air_model = joblib.load(os.path.join(MODELS_DIR, "air_quality_random_forest.pkl"))
-energy_model = joblib.load(os.path.join(MODELS_DIR, "energy_random_forest.pkl"))
-traffic_model = joblib.load(os.path.join(MODELS_DIR, "traffic_random_forest.pkl"))
+sys.path.insert(0, os.path.dirname(BASE_DIR))
+from inference.executor import BoundedExecutor, QueueFull
+from inference.live import LivePublisher
+from inference.core import get_core
+from inference.forecast import ARTIFACT as FORECAST_MODEL, EnergyForecaster, reading_time
+from inference.payloads import PayloadError, RecordDecoder, dumps, loads
+
+# Models are loaded (and compiled) on first use by the inference core shared
+# with the other frontends; least recently used ones are evicted when
+# MODEL_MEMORY_BUDGET_MB is set and exceeded
+MEMORY_BUDGET_MB = os.environ.get("MODEL_MEMORY_BUDGET_MB")
+core = get_core(MODELS_DIR, memory_budget=int(MEMORY_BUDGET_MB) * 1024 * 1024 if MEMORY_BUDGET_MB else None)
+registry = core.registry
+
+# Changed artifacts in MODELS_DIR are reloaded in the background (0 = off)
+RELOAD_INTERVAL = float(os.environ.get("MODEL_RELOAD_INTERVAL", 5.0))
+
+# Inference runs on a dedicated pool ("thread" or "process") so the event loop
+# only accepts and answers requests; beyond INFERENCE_MAX_QUEUE waiting calls
+# requests are rejected with 503 instead of queueing without bound
+INFERENCE_EXECUTOR = os.environ.get("INFERENCE_EXECUTOR", "thread")
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", os.cpu_count() or 1))
+INFERENCE_MAX_QUEUE = int(os.environ.get("INFERENCE_MAX_QUEUE", 32))
+executor = BoundedExecutor(INFERENCE_EXECUTOR, max_workers=INFERENCE_WORKERS, max_queue=INFERENCE_MAX_QUEUE)
+
+# Streaming endpoints score at most STREAM_BATCH_SIZE rows per executor call
+STREAM_BATCH_SIZE = int(os.environ.get("STREAM_BATCH_SIZE", 256))
+
+# Stream kind -> (model, result field, result type)
+STREAMS = {
+    "air": ("air_quality_random_forest", "Predicted_CO", float),
+    "energy": ("energy_random_forest", "Predicted_Energy", float),
+    "traffic": ("traffic_random_forest", "Traffic_Level", int)
+}
+
+# Validating decoders of request rows (feature arrays or objects) per model
+DECODERS = {name: RecordDecoder(core.schema(name)) for name, _, _ in STREAMS.values()}
+
+# Latest sensor readings per stream kind, pushed by gateways to
+# /live/readings/{kind}; the live feed scores them every LIVE_INTERVAL seconds
+LIVE_INTERVAL = float(os.environ.get("LIVE_INTERVAL", 5.0))
+live_readings = {}
+
+async def _live_predictions():
+    """One vectorized pass per model over the latest readings"""
+    payload = {}
+    for kind, rows in list(live_readings.items()):
+        name, field, cast = STREAMS[kind]
+        if not rows or name not in registry:
+            continue
+        results = await executor.run(_predict_rows, name, rows)
+        payload[kind] = [{field: cast(value)} if error is None else {"error": error}
+                         for value, error in results]
+    return payload
+
+live = LivePublisher(_live_predictions, LIVE_INTERVAL)
+
+# Meter readings posted to /energy/readings keep each meter's lag and
+# rolling-window features up to date in constant time per reading;
+# /energy/forecast scores every meter's next readings in one call
+# FORECAST_METERS (comma-separated ids) restricts the meters accepted;
+# at most FORECAST_MAX_METERS are tracked, least recently updated dropped first
+FORECAST_METERS = os.environ.get("FORECAST_METERS")
+forecaster = EnergyForecaster(int(os.environ.get("FORECAST_MAX_METERS", 10000)),
+                              FORECAST_METERS.split(",") if FORECAST_METERS else None)
+
+@asynccontextmanager
+async def lifespan(app):
+    if RELOAD_INTERVAL:
+        registry.start_watcher(RELOAD_INTERVAL)
+    live.start()
+    yield
+    await live.stop()
+    registry.stop_watcher()
+    executor.shutdown(wait=False)
+
+app = FastAPI(title="Smart City ML Platform", lifespan=lifespan)
+
+def _predict(name, body):
+    """
+    Decode and score one JSON request body (a feature array or object)
+
+    Runs in the executor; worker processes use their own core over
+    MODELS_DIR. Raises PayloadError for a body that is not a valid row.
+    """
+    features = DECODERS[name].decode_one(loads(body))
+    return core.predict(name, features[None, :])[0]
+
+def _predict_rows(name, rows):
+    """
+    Score a micro-batch in one vectorized call
+
+    Rows are feature arrays or feature objects (see inference/payloads.py).
+    Returns one (prediction, error) pair per row; rows that fail validation
+    only fail themselves.
+    """
+    features, errors = DECODERS[name].decode(rows)
+    if not errors:
+        return [(value, None) for value in core.predict(name, features).tolist()]
+
+    valid = np.ones(len(rows), dtype=bool)
+    valid[list(errors)] = False
+    values = iter(core.predict(name, features[valid]).tolist() if valid.any() else [])
+    return [(next(values), None) if ok else (None, errors[i]) for i, ok in enumerate(valid)]
+
+async def predict(name, data):
+    if name not in registry:
+        raise HTTPException(status_code=503, detail=f"Model {name} is not available")
+    try:
+        return await executor.run(_predict, name, data)
+    except QueueFull:
+        raise HTTPException(status_code=503, detail="Inference queue is full, retry later",
+                            headers={"Retry-After": "1"})
+    except KeyError:
+        raise HTTPException(status_code=503, detail=f"Model {name} is not available")
+    except PayloadError as e:
+        raise HTTPException(status_code=422, detail=str(e))
 
 @app.get("/")
 def home():
     return {"message": "Smart City ML API is running"}
 
+@app.get("/models/stats")
+def model_stats():
+    return registry.stats()
+
+@app.get("/models/status")
+def model_status():
+    return registry.versions()
+
+@app.get("/executor/stats")
+def executor_stats():
+    return executor.stats()
+
 @app.post("/air/predict")
-def predict_air(data: list):
-    prediction = air_model.predict([data])[0]
-    return {"Predicted_CO": prediction}
+async def predict_air(request: Request):
+    prediction = await predict("air_quality_random_forest", await request.body())
+    return {"Predicted_CO": float(prediction)}
 
 @app.post("/energy/predict")
-def predict_energy(data: list):
-    prediction = energy_model.predict([data])[0]
-    return {"Predicted_Energy": prediction}
+async def predict_energy(request: Request):
+    prediction = await predict("energy_random_forest", await request.body())
+    return {"Predicted_Energy": float(prediction)}
 
 @app.post("/traffic/predict")
-def predict_traffic(data: list):
-    prediction = traffic_model.predict([data])[0]
+async def predict_traffic(request: Request):
+    prediction = await predict("traffic_random_forest", await request.body())
     return {"Traffic_Level": int(prediction)}
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    Streams a response while the request body is still being read
+
+    StreamingResponse normally watches receive() for a disconnect, which
+    would steal the body messages from the handler; here the handler reads
+    the body itself and request.stream() notices a disconnect.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+async def _score_stream(request, name, field, cast):
+    """Read NDJSON rows as they arrive and yield NDJSON predictions in order"""
+    pending = b""
+    line_no = 0
+    batch = []
+
+    async def flush():
+        # A full queue pauses reading instead of failing the stream, which
+        # pushes back on the sender through TCP flow control
+        while True:
+            try:
+                return await executor.run(_predict_rows, name, [row for _, _, row in batch])
+            except QueueFull:
+                await asyncio.sleep(0.01)
+
+    async def score():
+        results = await flush() if batch else []
+        lines = []
+        for (line, row_id, _), (value, error) in zip(batch, results):
+            result = {"line": line} if row_id is None else {"line": line, "id": row_id}
+            if error is None:
+                result[field] = cast(value)
+            else:
+                result["error"] = error
+            lines.append(dumps(result).decode())
+        batch.clear()
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def parse(raw):
+        nonlocal line_no
+        line_no += 1
+        try:
+            item = loads(raw)
+            if isinstance(item, dict):
+                return None, (line_no, item.get("id"), item["data"])
+            if isinstance(item, list):
+                return None, (line_no, None, item)
+            raise ValueError("expected a JSON array or an object with 'data'")
+        except (ValueError, KeyError) as e:
+            return dumps({"line": line_no, "error": f"invalid row: {e}"}).decode() + "\n", None
+
+    async for chunk in request.stream():
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for raw in lines:
+            if not raw.strip():
+                continue
+            error, row = parse(raw)
+            if error is not None:
+                # Keep output in input order
+                output = await score()
+                yield output + error
+                continue
+            batch.append(row)
+            if len(batch) >= STREAM_BATCH_SIZE:
+                yield await score()
+        # Score what has arrived before waiting for more, so a slow gateway
+        # still gets its predictions promptly
+        if batch:
+            yield await score()
+
+    if pending.strip():
+        error, row = parse(pending)
+        if error is not None:
+            yield (await score()) + error
+        else:
+            batch.append(row)
+    if batch:
+        yield await score()
+
+def _forecast(features):
+    """Every horizon step of every meter row (runs in the executor)"""
+    return core.predict(FORECAST_MODEL, features)
+
+@app.post("/energy/readings")
+async def energy_readings(request: Request):
+    """
+    Add meter readings: one object or a list of them, each with
+    `Consumption` and `TxnDate`/`TxnTime` as in the meter CSVs (or an ISO
+    `timestamp`), and optionally a `meter` id. Readings older than their
+    meter's latest are dropped and counted as late.
+    """
+    try:
+        records = loads(await request.body())
+        if isinstance(records, dict):
+            records = [records]
+        if not isinstance(records, list):
+            raise PayloadError("Expected a reading or a list of readings")
+        # Every reading is checked before any is applied
+        readings = []
+        for i, record in enumerate(records):
+            try:
+                readings.append((str(record.get("meter", "default")), reading_time(record),
+                                 float(record["Consumption"])))
+            except (AttributeError, KeyError, TypeError, ValueError) as e:
+                raise PayloadError(f"Reading {i}: invalid or missing {e}")
+            if not forecaster.accepts(readings[-1][0]):
+                raise PayloadError(f"Reading {i}: unknown meter {readings[-1][0]}")
+    except PayloadError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    accepted = sum(forecaster.update(meter, timestamp, value) for meter, timestamp, value in readings)
+    return {"accepted": accepted, "late": len(readings) - accepted, "meters": len(forecaster.meters)}
+
+@app.get("/energy/forecast")
+async def energy_forecast(meter: str = None):
+    """Next readings of one meter, or of every meter with enough history"""
+    if FORECAST_MODEL not in registry:
+        raise HTTPException(status_code=503, detail=f"Model {FORECAST_MODEL} is not available")
+    meters, features = forecaster.matrix([meter] if meter is not None else None)
+    if meter is not None and not meters:
+        raise HTTPException(status_code=409, detail=f"Meter {meter} needs {forecaster.pending(meter)} more readings")
+    if not meters:
+        return {"forecasts": {}}
+    try:
+        values = await executor.run(_forecast, features)
+    except QueueFull:
+        raise HTTPException(status_code=503, detail="Inference queue is full, retry later",
+                            headers={"Retry-After": "1"})
+    values = values.reshape(len(meters), -1)
+    return {"horizon": values.shape[1], "forecasts": dict(zip(meters, values.tolist()))}
+
+@app.post("/{kind}/predict/stream")
+async def predict_stream(kind: str, request: Request):
+    """
+    Score a chunked NDJSON request body on a single connection
+
+    Each request line is a feature array or {"id": ..., "data": [...]}
+    (`data` may also be an object of named features);
+    each response line carries the input line number, the id if given, and
+    the prediction or an error.
+    """
+    if kind not in STREAMS:
+        raise HTTPException(status_code=404, detail=f"Unknown model {kind}")
+    name, field, cast = STREAMS[kind]
+    if name not in registry:
+        raise HTTPException(status_code=503, detail=f"Model {name} is not available")
+    if executor.queue_depth >= executor.max_queue:
+        raise HTTPException(status_code=503, detail="Inference queue is full, retry later",
+                            headers={"Retry-After": "1"})
+
+    return DuplexStreamingResponse(_score_stream(request, name, field, cast), media_type="application/x-ndjson")
+
+@app.post("/live/readings/{kind}")
+def update_live_readings(kind: str, rows: list = Body(...)):
+    """Replace the readings (one feature array per sensor) scored by the live feed"""
+    if kind not in STREAMS:
+        raise HTTPException(status_code=404, detail=f"Unknown model {kind}")
+    live_readings[kind] = rows
+    return {"kind": kind, "sensors": len(rows)}
+
+@app.get("/live/stats")
+def live_stats():
+    return live.stats()
+
+@app.get("/live/sse")
+async def live_sse(limit: int = 0):
+    """Server-Sent Events feed of the live predictions (`limit` > 0 closes after that many events)"""
+    subscription = live.subscribe()
+
+    async def events():
+        try:
+            sent = 0
+            async for message in subscription:
+                yield f"data: {message}\n\n"
+                sent += 1
+                if limit and sent >= limit:
+                    break
+        finally:
+            subscription.close()
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.websocket("/live/ws")
+async def live_ws(websocket: WebSocket):
+    """WebSocket feed of the live predictions"""
+    await websocket.accept()
+    subscription = live.subscribe()
+
+    async def forward():
+        async for message in subscription:
+            await websocket.send_text(message)
+
+    sender = asyncio.create_task(forward())
+    try:
+        # Messages from the client are ignored; this returns on disconnect
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        subscription.close()
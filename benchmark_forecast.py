@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Forecast Benchmark - streaming windows and one-pass horizons
+
+1. Per-reading cost of keeping a meter's features current as its history
+   grows: EnergyForecaster.update (ring buffer and running sums) against
+   recomputing the features from the whole history on every reading.
+2. Forecasting the next readings of many meters: the multi-output model
+   in one predict call against one call per meter.
+
+The forecaster is trained on the blower meter CSVs (datasets/energy).
+
+Usage: python benchmark_forecast.py
+"""
+
+import time
+
+import numpy as np
+
+from inference.forecast import DEFAULT_HORIZON, EnergyForecaster, history_features
+from inference.forest import compile_forest
+from training.datasets import load_dataset
+from training.pipelines import PIPELINES
+
+HISTORY_SIZES = [1000, 10000, 100000]
+METER_COUNTS = [1, 100, 1000]
+READINGS_TIMED = 1000
+
+
+def series(n, rng):
+    seconds = np.cumsum(rng.integers(600, 1800, n))
+    return np.datetime64('2022-01-01T00:00:00') + seconds.astype('timedelta64[s]'), rng.uniform(0.5, 5.0, n)
+
+
+def update_cost(timestamps, values, history):
+    """Mean µs per update after `history` readings, streaming and recomputed"""
+    forecaster = EnergyForecaster()
+    for timestamp, value in zip(timestamps[:history], values[:history]):
+        forecaster.update('meter', timestamp, value)
+
+    started = time.perf_counter()
+    for timestamp, value in zip(timestamps[history:history + READINGS_TIMED],
+                                values[history:history + READINGS_TIMED]):
+        forecaster.update('meter', timestamp, value)
+    streaming = (time.perf_counter() - started) / READINGS_TIMED * 1e6
+
+    repeats = 20
+    started = time.perf_counter()
+    for end in range(history, history + repeats):
+        history_features(timestamps[:end + 1], values[:end + 1])
+    recomputed = (time.perf_counter() - started) / repeats * 1e6
+    return streaming, recomputed
+
+
+def main():
+    rng = np.random.default_rng(42)
+    pipeline = PIPELINES['energy_forecast']
+    X, y = pipeline.load(load_dataset(pipeline.dataset))
+    model = pipeline.estimator(**{**pipeline.params, 'n_estimators': 50}, random_state=42).fit(X, y)
+    forest = compile_forest(model)
+
+    print("=" * 72)
+    print("FORECAST BENCHMARK - streaming energy features and horizons")
+    print("=" * 72)
+
+    timestamps, values = series(max(HISTORY_SIZES) + READINGS_TIMED + 20, rng)
+    print("\nPer-reading feature update")
+    print(f"  {'history':>10} {'streaming µs':>14} {'recompute µs':>14}")
+    for history in HISTORY_SIZES:
+        streaming, recomputed = update_cost(timestamps, values, history)
+        print(f"  {history:>10} {streaming:>14.2f} {recomputed:>14.1f}")
+
+    print(f"\nForecast of the next {DEFAULT_HORIZON} readings (50 trees, compiled)")
+    print(f"  {'meters':>10} {'one call ms':>14} {'per meter ms':>14}")
+    for n_meters in METER_COUNTS:
+        forecaster = EnergyForecaster()
+        for meter in range(n_meters):
+            meter_times, meter_values = series(100, rng)
+            for timestamp, value in zip(meter_times, meter_values):
+                forecaster.update(meter, timestamp, value)
+
+        started = time.perf_counter()
+        batched = forecaster.forecast(forest.predict)
+        one_call = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        for meter in range(n_meters):
+            single = forecaster.forecast(forest.predict, [meter])
+        per_meter = (time.perf_counter() - started) * 1000
+        assert np.allclose(single[n_meters - 1], batched[n_meters - 1])
+        print(f"  {n_meters:>10} {one_call:>14.2f} {per_meter:>14.2f}")
+
+    print("\n" + "=" * 72)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+"""
+Frontend Layout Benchmark - per-frontend model copies vs the shared inference core
+
+Runs the Flask website, FastAPI backend and Streamlit dashboard model sets
+as three processes on one host, like the full stack, and reports memory
+(from /proc/self/smaps_rollup, Linux only) and prediction latency for:
+
+  separate  every frontend unpickles its own models and calls sklearn
+            (the layout before inference/core.py)
+  core      every frontend uses get_core() over exported `.forest`
+            artifacts, so the model arrays are shared through the page cache
+
+plus `core-1p`: all three frontends in a single process sharing one core.
+
+Usage: python benchmark_frontends.py [--repeat 200] [models_dir]
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import warnings
+
+import joblib
+import numpy as np
+
+from benchmark_workers import MB, memory_usage
+from inference.artifacts import export_models
+from inference.core import get_core
+
+warnings.filterwarnings('ignore')
+
+# Models each frontend serves
+FRONTENDS = {
+    'flask': ['traffic_model', 'air_quality_model', 'energy_model'],
+    'fastapi': ['traffic_random_forest', 'air_quality_random_forest', 'energy_random_forest'],
+    'streamlit': ['traffic_random_forest', 'air_quality_random_forest']
+}
+
+
+def latency(predict, n_features, rows, repeat):
+    """Median seconds per call"""
+    X = np.random.default_rng(0).uniform(0, 100, (rows, n_features))
+    predict(X)
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        predict(X)
+        times.append(time.perf_counter() - started)
+    return float(np.median(times))
+
+
+def serve(layout, names, models_dir, repeat):
+    """Load a frontend's models and time 1-row and 100-row predictions"""
+    timings = {1: [], 100: []}
+    if layout == 'separate':
+        models = {name: joblib.load(os.path.join(models_dir, name + '.pkl')) for name in names}
+        for model in models.values():
+            for rows in timings:
+                timings[rows].append(latency(model.predict, model.n_features_in_, rows, repeat))
+    else:
+        core = get_core(models_dir)
+        for name in names:
+            model = core.registry.get(name)['compiled']
+            # Touch every page, as a long-running server eventually does
+            for array in (model.feature, model.threshold, model.children, model.value):
+                array.sum()
+            for rows in timings:
+                timings[rows].append(latency(lambda X: core.predict(name, X), model.n_features_in_,
+                                             rows, repeat))
+    return {rows: float(np.mean(values)) for rows, values in timings.items()}
+
+
+def worker(layout, frontends, models_dir, repeat, barrier, results):
+    """One host process serving `frontends` (a list of model name lists)"""
+    # Import sklearn up front so only model memory is measured
+    import sklearn.ensemble  # noqa: F401
+    before = memory_usage()
+    timings = [serve(layout, names, models_dir, repeat) for names in frontends]
+
+    # Measure while all processes hold their models so sharing is visible
+    barrier.wait()
+    after = memory_usage()
+    results.put({
+        'memory': {key: after[key] - before[key] for key in after},
+        'latency': {rows: float(np.mean([t[rows] for t in timings])) for rows in (1, 100)}
+    })
+    barrier.wait()
+
+
+def run(layout, processes, models_dir, repeat):
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(len(processes))
+    results = context.Queue()
+    workers = [context.Process(target=worker, args=(layout, frontends, models_dir, repeat, barrier, results))
+               for frontends in processes]
+    for process in workers:
+        process.start()
+    usage = [results.get() for _ in workers]
+    for process in workers:
+        process.join()
+    return usage
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('models_dir', nargs='?', default='models')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("FRONTEND LAYOUT BENCHMARK - separate copies vs shared inference core")
+    print("=" * 70)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for frontend, names in FRONTENDS.items():
+            FRONTENDS[frontend] = [name for name in names
+                                   if os.path.isfile(os.path.join(args.models_dir, name + '.pkl'))]
+            print(f"  {frontend:<10} {', '.join(FRONTENDS[frontend]) or '(no models)'}")
+        for name in set(sum(FRONTENDS.values(), [])):
+            shutil.copy(os.path.join(args.models_dir, name + '.pkl'), workdir)
+        export_models(workdir)
+
+        separate = [[names] for names in FRONTENDS.values()]
+        print(f"\n  {'layout':<9} {'processes':>9} {'host RSS':>10} {'host PSS':>10} {'private':>10} "
+              f"{'1 row':>9} {'100 rows':>9}")
+        for layout, processes, models_dir in (('separate', separate, args.models_dir),
+                                              ('core', separate, workdir),
+                                              ('core-1p', [list(FRONTENDS.values())], workdir)):
+            usage = run('separate' if layout == 'separate' else 'core', processes, models_dir, args.repeat)
+            total = {key: sum(u['memory'][key] for u in usage) / MB for key in ('rss', 'pss', 'private')}
+            one, hundred = (np.mean([u['latency'][rows] for u in usage]) * 1000 for rows in (1, 100))
+            print(f"  {layout:<9} {len(processes):>9} {total['rss']:>8.1f}MB {total['pss']:>8.1f}MB "
+                  f"{total['private']:>8.1f}MB {one:>7.2f}ms {hundred:>7.2f}ms")
+
+    print("\n" + "=" * 70)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+Inference Benchmark - sklearn forests vs compiled flat-array forests
+
+Checks that the compiled forests reproduce sklearn's outputs and compares
+prediction latency for 1, 100 and 100,000 rows.
+
+Usage: python benchmark_inference.py [models_dir]
+"""
+
+import os
+import sys
+import time
+import warnings
+
+import joblib
+import numpy as np
+
+from inference.forest import compile_forest
+
+warnings.filterwarnings('ignore')
+
+BATCH_SIZES = [1, 100, 100000]
+
+
+def best_time(fn, X, repeats):
+    """Best wall-clock time of `repeats` calls, in milliseconds"""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(X)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000.0
+
+
+def reference_output(model, X):
+    """sklearn output the compiled forest must reproduce"""
+    if not hasattr(model, 'classes_'):
+        return model.predict(X)
+    
+    # Per-tree probabilities normalized the way sklearn 1.3 does, so that
+    # pickles with raw class counts compare correctly on newer sklearn
+    proba = np.zeros((len(X), len(model.classes_)))
+    for tree in model.estimators_:
+        tree_proba = tree.predict_proba(X).copy()
+        normalizer = tree_proba.sum(axis=1)[:, np.newaxis]
+        if (normalizer > 1.0 + 1e-9).any():
+            normalizer[normalizer == 0.0] = 1.0
+            tree_proba /= normalizer
+        proba += tree_proba
+    return proba / len(model.estimators_)
+
+
+def benchmark_model(path, rng):
+    """Verify and time one pickled forest"""
+    model = joblib.load(path)
+    model.n_jobs = None  # deterministic accumulation order
+    
+    start = time.perf_counter()
+    compiled = compile_forest(model)
+    compile_ms = (time.perf_counter() - start) * 1000.0
+    
+    X = rng.uniform(0, 500, (20000, model.n_features_in_))
+    compiled_output = compiled.predict_proba(X) if compiled.is_classifier else compiled.predict(X)
+    exact = np.array_equal(reference_output(model, X), compiled_output)
+    
+    timings = []
+    for n_rows in BATCH_SIZES:
+        X = rng.uniform(0, 500, (n_rows, model.n_features_in_))
+        repeats = 20 if n_rows <= 100 else 3
+        timings.append((n_rows,
+                        best_time(model.predict, X, repeats),
+                        best_time(compiled.predict, X, repeats)))
+    
+    return compile_ms, exact, timings
+
+
+def main():
+    models_dir = sys.argv[1] if len(sys.argv) > 1 else 'models'
+    rng = np.random.default_rng(42)
+    
+    print("=" * 70)
+    print("INFERENCE BENCHMARK - sklearn vs compiled forest")
+    print("=" * 70)
+    
+    for filename in sorted(os.listdir(models_dir)):
+        if not filename.endswith('.pkl'):
+            continue
+        
+        compile_ms, exact, timings = benchmark_model(os.path.join(models_dir, filename), rng)
+        
+        print(f"\n{filename}  (compile {compile_ms:.1f} ms, "
+              f"{'bit-exact' if exact else 'MISMATCH'})")
+        print(f"  {'rows':>8} {'sklearn ms':>12} {'compiled ms':>12} {'speedup':>8}")
+        for n_rows, sklearn_ms, compiled_ms in timings:
+            print(f"  {n_rows:>8} {sklearn_ms:>12.3f} {compiled_ms:>12.3f} "
+                  f"{sklearn_ms / compiled_ms:>7.1f}x")
+    
+    print("\n" + "=" * 70)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+Payload Benchmark - dict walking vs the decoding layer
+
+Times turning a JSON request body into the traffic model's feature matrix
+and encoding the results, for a single-record body (as the single
+prediction routes receive) and a 10,000-row batch:
+
+- dict walking: `json.loads`, a required-fields check per record, then a
+  per-row fill of a float64 matrix; results encoded with `json.dumps`
+  (what the routes did before inference/payloads.py)
+- decoder: `loads` and RecordDecoder (types, required fields and ranges),
+  results encoded with `dumps` - once with orjson, once with the standard
+  library fallback
+
+Usage: python benchmark_payloads.py
+"""
+
+import json
+import time
+
+import numpy as np
+
+from inference import payloads
+from inference.features import SCHEMAS
+from inference.payloads import RecordDecoder
+
+ROW_COUNTS = [1, 10000]
+
+SCHEMA = SCHEMAS['traffic_model']
+
+
+def best_time(fn, repeats):
+    """Best wall-clock time of `repeats` calls, in milliseconds"""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000.0
+
+
+def make_body(n_rows, rng):
+    """A batch body, or a single record's body when n_rows is 1"""
+    records = [{'hour': int(rng.integers(0, 24)), 'day_of_week': int(rng.integers(0, 7)),
+                'vehicle_count': int(rng.integers(0, 500)), 'avg_speed': float(rng.uniform(5, 80)),
+                'weather': int(rng.integers(0, 3))} for _ in range(n_rows)]
+    return json.dumps(records if n_rows > 1 else records[0]).encode()
+
+
+def make_results(n_rows, rng):
+    return {'predictions': [{'prediction': int(p), 'label': ['Low', 'Medium', 'High'][p], 'confidence': float(c)}
+                            for p, c in zip(rng.integers(0, 3, n_rows), rng.uniform(0.3, 1, n_rows))],
+            'count': n_rows, 'status': 'success'}
+
+
+def dict_walking(body):
+    """The per-record checks and fill the routes used before"""
+    records = json.loads(body)
+    if isinstance(records, dict):
+        records = [records]
+    invalid = [i for i, record in enumerate(records)
+               if not isinstance(record, dict) or not all(field in record for field in SCHEMA.names)]
+    features = np.empty((len(records), len(SCHEMA)), dtype=np.float64)
+    for i, record in enumerate(records):
+        features[i] = [record.get(name, 0) for name in SCHEMA.names]
+    return features, invalid
+
+
+def decode(decoder, body):
+    """The decoding layer as the routes use it: decode_one for a single record"""
+    records = payloads.loads(body)
+    if isinstance(records, dict):
+        return decoder.decode_one(records)[None, :], {}
+    return decoder.decode(records)
+
+
+def main():
+    rng = np.random.default_rng(42)
+    decoder = RecordDecoder(SCHEMA, SCHEMA.names)
+    orjson = payloads.orjson
+
+    print("=" * 78)
+    print("PAYLOAD BENCHMARK - traffic records in, results out")
+    print("=" * 78)
+    print(f"  {'rows':>6} {'stage':<8} {'dict walking ms':>16} {'stdlib ms':>11} {'orjson ms':>11} {'speedup':>8}")
+
+    for n_rows in ROW_COUNTS:
+        body, results = make_body(n_rows, rng), make_results(n_rows, rng)
+        repeats = 2000 if n_rows == 1 else 10
+        reference, _ = dict_walking(body)
+
+        timings = {}
+        for label, module in (('stdlib', None), ('orjson', orjson)):
+            if label == 'orjson' and module is None:
+                continue
+            payloads.orjson = module
+            features, errors = decode(decoder, body)
+            assert not errors and np.array_equal(features, reference.astype(np.float32))
+            timings[label] = (best_time(lambda: decode(decoder, body), repeats),
+                              best_time(lambda: payloads.dumps(results), repeats))
+        payloads.orjson = orjson
+
+        baseline = (best_time(lambda: dict_walking(body), repeats), best_time(lambda: json.dumps(results), repeats))
+        for stage, k in (('decode', 0), ('encode', 1)):
+            fastest = min(t[k] for t in timings.values())
+            print(f"  {n_rows:>6} {stage:<8} {baseline[k]:>16.3f} {timings['stdlib'][k]:>11.3f} "
+                  f"{timings['orjson'][k] if 'orjson' in timings else float('nan'):>11.3f} "
+                  f"{baseline[k] / fastest:>7.1f}x")
+
+    print("\n" + "=" * 78)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+"""
+Worker Memory Benchmark - pickled models vs memory-mapped artifacts
+
+Starts N worker processes (like `uvicorn --workers N`) that each load every
+model, touch all of its memory and then report their RSS, PSS and private
+memory from /proc/self/smaps_rollup (Linux only). With pickles every worker
+holds a private copy; with `.forest` artifacts the arrays are mapped from
+the page cache and shared.
+
+`--zones` duplicates each model to simulate per-zone deployments.
+
+Usage: python benchmark_workers.py [--workers 4 16] [--zones 10] [models_dir]
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import tempfile
+import warnings
+
+import joblib
+import numpy as np
+
+from inference.artifacts import export_models, load_artifact
+
+warnings.filterwarnings('ignore')
+
+MB = 1024 * 1024
+
+
+def memory_usage():
+    """RSS, PSS and private memory of this process in bytes"""
+    usage = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                usage[parts[0][:-1]] = int(parts[1]) * 1024
+    return {
+        'rss': usage.get('Rss', 0),
+        'pss': usage.get('Pss', 0),
+        'private': usage.get('Private_Clean', 0) + usage.get('Private_Dirty', 0)
+    }
+
+
+def worker(layout, paths, barrier, results):
+    """Load every model, touch its memory, then report usage"""
+    # Import sklearn up front so only model memory is measured
+    import sklearn.ensemble  # noqa: F401
+    before = memory_usage()
+    models = []
+    for path in paths:
+        if layout == 'pickle':
+            model = joblib.load(path)
+            model.predict(np.zeros((1, model.n_features_in_)))
+        else:
+            model = load_artifact(path)
+            # Touch every page, as a long-running server eventually does
+            for array in (model.feature, model.threshold, model.children, model.value):
+                array.sum()
+        models.append(model)
+
+    # Measure while all workers hold their models so sharing is visible
+    barrier.wait()
+    after = memory_usage()
+    results.put({key: after[key] - before[key] for key in after})
+    barrier.wait()
+
+
+def run(layout, paths, n_workers):
+    """Start `n_workers` processes and collect their memory deltas"""
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(n_workers)
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(layout, paths, barrier, results))
+                 for _ in range(n_workers)]
+    for process in processes:
+        process.start()
+    usage = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return usage
+
+
+def prepare(models_dir, zones, workdir):
+    """Copy each pickle `zones` times and export matching artifacts"""
+    for filename in sorted(os.listdir(models_dir)):
+        source = os.path.join(models_dir, filename)
+        if filename.endswith('.pkl') and os.path.getsize(source) > 0:
+            for zone in range(zones):
+                shutil.copy(source, os.path.join(workdir, f'{filename[:-4]}_zone{zone}.pkl'))
+
+    pickles = sorted(os.path.join(workdir, f) for f in os.listdir(workdir) if f.endswith('.pkl'))
+    artifacts = export_models(workdir)
+    return pickles, artifacts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('models_dir', nargs='?', default='models')
+    parser.add_argument('--workers', type=int, nargs='+', default=[4, 16])
+    parser.add_argument('--zones', type=int, default=10)
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("WORKER MEMORY BENCHMARK - pickle vs memory-mapped artifacts")
+    print("=" * 70)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        pickles, artifacts = prepare(args.models_dir, args.zones, workdir)
+        print(f"\n{len(pickles)} models ({args.zones} zones x "
+              f"{len(pickles) // args.zones} forests)")
+        print(f"\n  {'layout':<8} {'workers':>7} {'RSS/worker':>11} {'PSS/worker':>11} "
+              f"{'private/worker':>15} {'host total (PSS)':>17}")
+
+        for n_workers in args.workers:
+            for layout, paths in (('pickle', pickles), ('mmap', artifacts)):
+                usage = run(layout, paths, n_workers)
+                rss = np.mean([u['rss'] for u in usage]) / MB
+                pss = np.mean([u['pss'] for u in usage]) / MB
+                private = np.mean([u['private'] for u in usage]) / MB
+                total = sum(u['pss'] for u in usage) / MB
+                print(f"  {layout:<8} {n_workers:>7} {rss:>9.1f}MB {pss:>9.1f}MB "
+                      f"{private:>13.1f}MB {total:>15.1f}MB")
+
+    print("\n" + "=" * 70)
+
+
+if __name__ == '__main__':
+    main()
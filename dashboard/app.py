@@ -1,15 +1,23 @@
 import streamlit as st
-import joblib
-import numpy as np
 
 import os
+import sys
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MODELS_DIR = os.path.join(BASE_DIR, '..', 'models')
 
-# Load trained models
-air_model = joblib.load(os.path.join(MODELS_DIR, "air_quality_random_forest.pkl"))
-traffic_model = joblib.load(os.path.join(MODELS_DIR, "traffic_random_forest.pkl"))
+sys.path.insert(0, os.path.dirname(BASE_DIR))
+from inference.core import get_core
+
+
+@st.cache_resource
+def get_inference_core():
+    """The lazily loading inference core, shared by all dashboard sessions"""
+    budget_mb = os.environ.get("MODEL_MEMORY_BUDGET_MB")
+    return get_core(MODELS_DIR, memory_budget=int(budget_mb) * 1024 * 1024 if budget_mb else None)
+
+
+core = get_inference_core()
 
 # Page settings
 st.set_page_config(
@@ -70,14 +78,13 @@ elif page == "🚦 Traffic Control":
     bus = col3.number_input("🚌 Bus Count", value=10)
     truck = col4.number_input("🚚 Truck Count", value=5)
 
-    total = car + bike + bus + truck
-
     if st.button("🔍 Analyze Traffic"):
-        traffic_sample = np.array([[car, bike, bus, truck, total]])
-        result = traffic_model.predict(traffic_sample)[0]
+        # The schema derives Total from the counts
+        traffic_sample = core.matrix("traffic_random_forest",
+                                     [{"CarCount": car, "BikeCount": bike, "BusCount": bus, "TruckCount": truck}])
+        result = core.predict("traffic_random_forest", traffic_sample)[0]
 
-        levels = ["Low", "Medium", "High", "Very High"]
-        level = levels[int(result)]
+        level = core.labels("traffic_random_forest")[int(result)]
 
         if level in ["High", "Very High"]:
             st.error(f"🚨 Traffic Level: **{level}**")
@@ -110,9 +117,12 @@ elif page == "🌫️ Air Quality Monitor":
         AH = st.number_input("Absolute Humidity", value=0.7578)
 
     if st.button("🔍 Analyze Air Quality"):
-        sample = np.array([[PT08_S1, NMHC, C6H6, PT08_S2, NOx,
-                             PT08_S3, NO2, PT08_S4, PT08_S5, T, RH, AH]])
-        result = air_model.predict(sample)[0]
+        sample = core.matrix("air_quality_random_forest", [{
+            "PT08.S1(CO)": PT08_S1, "NMHC(GT)": NMHC, "C6H6(GT)": C6H6, "PT08.S2(NMHC)": PT08_S2,
+            "NOx(GT)": NOx, "PT08.S3(NOx)": PT08_S3, "NO2(GT)": NO2, "PT08.S4(NO2)": PT08_S4,
+            "PT08.S5(O3)": PT08_S5, "T": T, "RH": RH, "AH": AH
+        }])
+        result = core.predict("air_quality_random_forest", sample)[0]
 
         st.metric("Predicted CO(GT)", f"{result:.2f}")
 
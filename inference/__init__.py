@@ -0,0 +1,27 @@
+"""
+Shared inference utilities for the Smart City ML models
+"""
+
+from .artifacts import export_models, load_artifact, save_artifact
+from .cache import PredictionCache
+from .core import MODEL_SPECS, InferenceCore, ModelSpec, get_core
+from .executor import BoundedExecutor, QueueFull
+from .features import SCHEMAS, Feature, FeatureSchema
+from .forecast import EnergyForecaster
+from .forest import CompiledForest, compile_forest
+from .live import LivePublisher
+from .payloads import PayloadError, RecordDecoder
+from .registry import ModelRegistry, load_model, model_nbytes
+
+__all__ = [
+    'CompiledForest', 'compile_forest',
+    'EnergyForecaster',
+    'ModelRegistry', 'load_model', 'model_nbytes',
+    'PredictionCache',
+    'InferenceCore', 'ModelSpec', 'MODEL_SPECS', 'get_core',
+    'BoundedExecutor', 'QueueFull',
+    'Feature', 'FeatureSchema', 'SCHEMAS',
+    'PayloadError', 'RecordDecoder',
+    'LivePublisher',
+    'export_models', 'load_artifact', 'save_artifact'
+]
@@ -0,0 +1,139 @@
+"""
+Memory-mapped model artifacts
+
+A `.forest` artifact is a directory holding the arrays of a CompiledForest
+as uncompressed `.npy` files plus a small `meta.json`. Loading opens the
+arrays with `mmap_mode='r'`, so every process on a host that serves the same
+artifact shares one page-cache copy instead of unpickling a private one.
+
+Convert the pickles in a models directory with:
+
+    python -m inference.artifacts models/
+"""
+
+import json
+import os
+import shutil
+import sys
+
+import joblib
+import numpy as np
+
+from .forest import CompiledForest, compile_forest
+
+ARTIFACT_SUFFIX = '.forest'
+# 2: arrays keep the dtypes they were saved with, and quantized leaf values
+# carry their scale and offset in meta.json
+FORMAT_VERSION = 2
+READABLE_VERSIONS = (1, 2)
+
+ARRAYS = ['feature', 'threshold', 'children', 'value', 'roots', 'missing_left']
+
+
+def save_artifact(model, path):
+    """
+    Write a forest (sklearn or compiled) as a `.forest` artifact directory
+
+    The directory is written next to its final location. A previous
+    version is renamed aside, the new one renamed into place and only then
+    the old one removed, so the path never holds a partially written or
+    partially deleted artifact (at most it is absent between the two
+    renames). Processes that mapped the old arrays keep reading them.
+    """
+    compiled = model if isinstance(model, CompiledForest) else compile_forest(model)
+    path = os.fspath(path)
+    staging = f'{path}.tmp-{os.getpid()}'
+
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    arrays = []
+    for name in ARRAYS:
+        array = getattr(compiled, name)
+        if array is None:
+            continue
+        np.save(os.path.join(staging, f'{name}.npy'), np.ascontiguousarray(array), allow_pickle=False)
+        arrays.append(name)
+
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'arrays': arrays,
+        'max_depth': compiled.max_depth,
+        'n_features': compiled.n_features_in_,
+        'n_estimators': compiled.n_estimators,
+        'classes': compiled.classes_.tolist() if compiled.is_classifier else None,
+        'value_scale': None if compiled.value_scale is None else np.asarray(compiled.value_scale).tolist(),
+        'value_offset': None if compiled.value_offset is None else np.asarray(compiled.value_offset).tolist()
+    }
+    with open(os.path.join(staging, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    retired = None
+    if os.path.isdir(path):
+        retired = f'{path}.old-{os.getpid()}'
+        shutil.rmtree(retired, ignore_errors=True)
+        os.rename(path, retired)
+    try:
+        os.rename(staging, path)
+    except OSError:
+        if retired is not None:
+            os.rename(retired, path)
+        raise
+    if retired is not None:
+        shutil.rmtree(retired, ignore_errors=True)
+    return path
+
+
+def load_artifact(path, mmap_mode='r'):
+    """Open a `.forest` artifact; arrays are memory-mapped unless mmap_mode is None"""
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+
+    if meta.get('format_version') not in READABLE_VERSIONS:
+        raise ValueError(f"Unsupported artifact format {meta.get('format_version')} in {path}")
+
+    # np.asarray drops the memmap subclass (cheaper indexing) but keeps the mapping
+    arrays = {name: np.asarray(np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode))
+              for name in meta['arrays']}
+
+    forest = CompiledForest(
+        feature=arrays['feature'],
+        threshold=arrays['threshold'],
+        children=arrays['children'],
+        value=arrays['value'],
+        roots=arrays['roots'],
+        max_depth=meta['max_depth'],
+        n_features=meta['n_features'],
+        missing_left=arrays.get('missing_left'),
+        classes=np.array(meta['classes']) if meta['classes'] is not None else None,
+        value_scale=np.array(meta['value_scale']) if meta.get('value_scale') is not None else None,
+        value_offset=np.array(meta['value_offset']) if meta.get('value_offset') is not None else None
+    )
+    forest.shared = mmap_mode is not None
+    return forest
+
+
+def is_artifact(path):
+    """Whether `path` is a `.forest` artifact directory"""
+    return path.endswith(ARTIFACT_SUFFIX) and os.path.isfile(os.path.join(path, 'meta.json'))
+
+
+def export_models(models_dir):
+    """Convert every pickled forest in `models_dir` to a `.forest` artifact"""
+    exported = []
+    for filename in sorted(os.listdir(models_dir)):
+        name, extension = os.path.splitext(filename)
+        source = os.path.join(models_dir, filename)
+        if extension != '.pkl' or os.path.getsize(source) == 0:
+            continue
+        try:
+            exported.append(save_artifact(joblib.load(source),
+                                          os.path.join(models_dir, name + ARTIFACT_SUFFIX)))
+        except ValueError as e:
+            print(f"✗ {filename}: {e}")
+    return exported
+
+
+if __name__ == '__main__':
+    for artifact in export_models(sys.argv[1] if len(sys.argv) > 1 else 'models'):
+        print(f"✓ {artifact}")
@@ -0,0 +1,114 @@
+"""
+Prediction result cache - TTL + LRU with optional input quantization
+"""
+
+import collections
+import threading
+import time
+
+import numpy as np
+
+
+class PredictionCache:
+    """
+    Bounded cache of per-row prediction results for one model
+
+    Entries expire `ttl` seconds after they are stored (None = never) and
+    the least recently used entry is evicted once `max_entries` is reached.
+
+    `quantize` maps feature column indices to a step: inputs are rounded to
+    the nearest multiple of the step before lookup *and* before scoring, so
+    rows that differ by less than a step share one entry and the cached
+    result is exactly what the model returns for the rounded row.
+
+    `clear()` bumps a generation counter; results computed before a clear
+    (e.g. by the model that was just replaced) are not stored afterwards.
+    """
+
+    def __init__(self, max_entries=10000, ttl=None, quantize=None, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.quantize = dict(quantize or {})
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self.generation = 0
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+    def prepare(self, features):
+        """Apply the quantization rules to a feature matrix (returns a copy if any apply)"""
+        if not self.quantize:
+            return features
+        features = np.array(features, dtype=np.float64)
+        for column, step in self.quantize.items():
+            features[:, column] = np.round(features[:, column] / step) * step
+        return features
+
+    @staticmethod
+    def key(row):
+        """Hashable key of one prepared feature row"""
+        return np.ascontiguousarray(row, dtype=np.float64).tobytes()
+
+    def get(self, key):
+        """Cached result for `key`, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+
+            expires, value = entry
+            if expires is not None and expires <= self.clock():
+                del self._entries[key]
+                self._expirations += 1
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def put(self, key, value, generation=None):
+        """Store a result; skipped if the cache was cleared since `generation` was read"""
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            expires = self.clock() + self.ttl if self.ttl is not None else None
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+            self._invalidations += 1
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        """Size and hit/miss/eviction counters"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+                'invalidations': self._invalidations
+            }
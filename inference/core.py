@@ -0,0 +1,168 @@
+"""
+Shared inference core for the Flask, FastAPI and Streamlit frontends
+
+One place owns model loading (pickles are compiled, `.forest` artifacts
+memory-mapped), the feature schema of every model (inference/features.py) and the batched
+prediction path. Frontends in the same process share one core per models
+directory through `get_core`; frontends in separate processes share the
+model arrays through the page cache when `.forest` artifacts are exported
+(see inference/artifacts.py).
+"""
+
+import logging
+import os
+import threading
+
+import joblib
+import numpy as np
+
+from .artifacts import is_artifact, load_artifact
+from .features import SCHEMAS, FeatureSchema
+from .forest import compile_forest
+from .registry import ModelRegistry, warm_up
+
+logger = logging.getLogger(__name__)
+
+
+class ModelSpec:
+    """
+    Feature schema (None = whatever the model was fitted on) and class labels of an artifact
+
+    `features` is a FeatureSchema (see inference/features.py) or a list of
+    feature names.
+    """
+
+    def __init__(self, features=None, labels=None):
+        if features is not None and not isinstance(features, FeatureSchema):
+            features = FeatureSchema(features)
+        self.schema = features
+        self.features = features.names if features is not None else None
+        self.labels = labels
+
+
+LABELS = {
+    'traffic_model': ['Low', 'Medium', 'High'],
+    'traffic_random_forest': ['Low', 'Medium', 'High', 'Very High']
+}
+
+# Artifact (file name without extension in MODELS_DIR) -> spec
+MODEL_SPECS = {artifact: ModelSpec(schema, LABELS.get(artifact)) for artifact, schema in SCHEMAS.items()}
+
+
+class InferenceCore:
+    """
+    Loads models on demand and scores feature matrices
+
+    Each artifact is held as its sklearn estimator plus, for tree
+    ensembles, the compiled forest. Inputs of up to `compiled_max_rows`
+    rows use the compiled traversal (no per-call sklearn overhead), larger
+    ones sklearn's Cython loop. Artifacts that do not match their spec are
+    rejected at load, so a bad file never replaces a working model.
+    """
+
+    def __init__(self, models_dir, compile_models=True, compiled_max_rows=1024, memory_budget=None,
+                 specs=None):
+        self.models_dir = models_dir
+        self.compile_models = compile_models
+        self.compiled_max_rows = compiled_max_rows
+        self.specs = MODEL_SPECS if specs is None else specs
+        self.registry = ModelRegistry(models_dir, memory_budget, loader=self._load,
+                                      validator=self._validate)
+
+    def _load(self, path):
+        """
+        Registry loader - keep the sklearn estimator and its compiled form
+
+        Memory-mapped `.forest` artifacts only have the compiled form, which
+        then serves inputs of every size.
+        """
+        if is_artifact(path):
+            return {'estimator': None, 'compiled': load_artifact(path)}
+
+        estimator = joblib.load(path)
+        compiled = None
+
+        if self.compile_models:
+            try:
+                compiled = compile_forest(estimator)
+            except ValueError as e:
+                logger.warning(f"{os.path.basename(path)} not compiled: {str(e)}")
+
+        return {'estimator': estimator, 'compiled': compiled}
+
+    def _validate(self, artifact, model):
+        """Registry validator - the model against its feature schema, then a warm-up prediction"""
+        schema = self.schema(artifact)
+        if schema is not None:
+            for member in model.values():
+                if member is not None:
+                    schema.check(member, artifact)
+        warm_up(model)
+
+    def __contains__(self, artifact):
+        return artifact in self.registry
+
+    def schema(self, artifact):
+        """FeatureSchema of an artifact, None if its features are only known from the fitted model"""
+        spec = self.specs.get(artifact)
+        return spec.schema if spec is not None else None
+
+    def features(self, artifact):
+        """Feature order of an artifact, None if it is only known from the fitted model"""
+        spec = self.specs.get(artifact)
+        return spec.features if spec is not None else None
+
+    def labels(self, artifact):
+        """Class labels of a classifier artifact, None if it has none"""
+        spec = self.specs.get(artifact)
+        return spec.labels if spec is not None else None
+
+    def matrix(self, artifact, records):
+        """float32 feature matrix for feature dicts, columnar data or rows (see FeatureSchema.transform)"""
+        schema = self.schema(artifact)
+        if schema is None:
+            return np.ascontiguousarray(records, dtype=np.float32)
+        return schema.transform(records)
+
+    def estimator(self, artifact, n_rows):
+        """The compiled forest for small inputs, sklearn for large ones"""
+        model = self.registry.get(artifact)
+        compiled = model['compiled']
+        if compiled is not None and (n_rows <= self.compiled_max_rows or model['estimator'] is None):
+            return compiled
+        return model['estimator']
+
+    def predict(self, artifact, features):
+        """Predictions for a 2-D feature matrix"""
+        features = np.asarray(features, dtype=np.float32)
+        return self.estimator(artifact, len(features)).predict(features)
+
+    def classify(self, artifact, features):
+        """
+        (classes, confidence) from a single predict_proba call
+
+        Uses the same decision rule as RandomForestClassifier.predict.
+        """
+        features = np.asarray(features, dtype=np.float32)
+        model = self.estimator(artifact, len(features))
+        probability = model.predict_proba(features)
+        return model.classes_.take(probability.argmax(axis=1)), probability.max(axis=1)
+
+
+# Process-wide cores, one per models directory and settings
+_cores = {}
+_cores_lock = threading.Lock()
+
+
+def get_core(models_dir, compile_models=True, compiled_max_rows=1024, memory_budget=None):
+    """
+    The shared InferenceCore of this process for `models_dir`
+
+    Every frontend asking for the same directory and settings gets the same
+    instance, and so the same loaded models, counters and compiled forests.
+    """
+    key = (os.path.realpath(models_dir), compile_models, compiled_max_rows, memory_budget)
+    with _cores_lock:
+        if key not in _cores:
+            _cores[key] = InferenceCore(models_dir, compile_models, compiled_max_rows, memory_budget)
+        return _cores[key]
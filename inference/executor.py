@@ -0,0 +1,151 @@
+"""
+Bounded inference executor with admission control for async servers
+"""
+
+import asyncio
+import collections
+import functools
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+EXECUTOR_KINDS = ('thread', 'process')
+
+
+class QueueFull(Exception):
+    """The executor already holds `max_queue` waiting calls"""
+
+
+def _timed_call(fn, args):
+    """Run `fn(*args)` and report when it started (wall clock, valid across processes)"""
+    return time.time(), fn(*args)
+
+
+class BoundedExecutor:
+    """
+    Runs CPU-bound calls off the event loop with a bounded queue
+
+    Up to `max_workers` calls run at once in a dedicated thread or process
+    pool; up to `max_queue` more may wait for a worker. Beyond that `run`
+    raises QueueFull immediately, so a burst is shed at admission instead of
+    growing the latency of every request. With `kind='process'` the function
+    and its arguments must be picklable and `initializer` runs once in each
+    worker process. The pool is created on first use.
+    """
+
+    def __init__(self, kind='thread', max_workers=4, max_queue=64, initializer=None,
+                 initargs=(), sample_size=2048):
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError(f'Unknown executor kind {kind!r} (expected one of {EXECUTOR_KINDS})')
+
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.initializer = initializer
+        self.initargs = initargs
+        self._pool = None
+
+        self._lock = threading.Lock()
+        self._pending = 0
+
+        # Statistics
+        self._completed = 0
+        self._rejected = 0
+        self._failed = 0
+        self._max_depth = 0
+        self._waits = collections.deque(maxlen=sample_size)
+        self._runs = collections.deque(maxlen=sample_size)
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                if self.kind == 'process':
+                    self._pool = ProcessPoolExecutor(self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'),
+                                                     initializer=self.initializer, initargs=self.initargs)
+                else:
+                    self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix='inference',
+                                                    initializer=self.initializer, initargs=self.initargs)
+            return self._pool
+
+    @property
+    def queue_depth(self):
+        """Calls waiting for a worker"""
+        with self._lock:
+            return max(0, self._pending - self.max_workers)
+
+    async def run(self, fn, *args):
+        """Run `fn(*args)` in the pool; raises QueueFull when the queue is full"""
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise QueueFull(f'Inference queue full ({self.max_queue} waiting)')
+            self._pending += 1
+            self._max_depth = max(self._max_depth, self._pending - self.max_workers)
+
+        submitted = time.time()
+        try:
+            future = self._get_pool().submit(_timed_call, fn, args)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        # The slot is held until the call itself ends: cancelling the awaiting
+        # coroutine (e.g. a client disconnect) does not stop a running call
+        future.add_done_callback(functools.partial(self._finished, submitted))
+        started, result = await asyncio.wrap_future(future)
+        return result
+
+    def _finished(self, submitted, future):
+        """Done callback of a pool future: free its slot and record its timings"""
+        finished = time.time()
+        with self._lock:
+            self._pending -= 1
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                self._failed += 1
+                return
+            started, _ = future.result()
+            self._completed += 1
+            self._waits.append(max(0.0, started - submitted))
+            self._runs.append(finished - started)
+
+    def shutdown(self, wait=True):
+        """Stop the pool; it is created again on the next call"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=True)
+
+    def stats(self):
+        """Queue depth, admission counters and wait/run time percentiles"""
+        with self._lock:
+            waits = np.array(self._waits) * 1000.0
+            runs = np.array(self._runs) * 1000.0
+
+            def summary(samples):
+                return {
+                    'samples': len(samples),
+                    'mean': float(samples.mean()) if len(samples) else 0.0,
+                    'p50': float(np.percentile(samples, 50)) if len(samples) else 0.0,
+                    'p99': float(np.percentile(samples, 99)) if len(samples) else 0.0,
+                    'max': float(samples.max()) if len(samples) else 0.0
+                }
+
+            return {
+                'kind': self.kind,
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'running': min(self._pending, self.max_workers),
+                'queue_depth': max(0, self._pending - self.max_workers),
+                'max_queue_depth': self._max_depth,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'failed': self._failed,
+                'wait_ms': summary(waits),
+                'run_ms': summary(runs)
+            }
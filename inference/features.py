@@ -0,0 +1,168 @@
+"""
+Feature schemas shared by training and serving
+
+Every model's inputs are declared once here as a FeatureSchema: the
+ordered features it was fitted on, each read from a field of the raw
+record, derived from other fields when the record lacks it, or defaulted.
+The same schema turns feature dicts (API requests), columnar data
+(DataFrames, cached datasets, CSV chunks) and ready-made rows into the
+contiguous float32 matrix the forests score, so training, the Flask
+website, the FastAPI backend and the dashboard cannot drift apart.
+
+float32 is what the forests compare against (see inference/forest.py),
+so converting once here loses nothing. Schemas are checked when they are
+declared and against every model when it is loaded (see
+InferenceCore._validate); a mismatch fails there instead of per request.
+"""
+
+import numpy as np
+
+
+def total(*counts):
+    """Sum of count columns"""
+    return sum(counts[1:], np.asarray(counts[0], dtype=np.float32))
+
+
+def hour_of_day(minute_of_day):
+    """Hour (0-23) of a minute of the day"""
+    return np.floor_divide(minute_of_day, 60)
+
+
+class Feature:
+    """
+    One model input
+
+    Read from the record's `name` field; when the record lacks it (or it
+    is NaN) and `derive` is set, computed as `derive(*inputs)` from the
+    record's `inputs` fields (absent inputs count as 0); otherwise
+    `default`. `low` and `high` bound the values requests may send (see
+    inference/payloads.py).
+    """
+
+    def __init__(self, name, default=0.0, inputs=(), derive=None, low=None, high=None):
+        if derive is not None and not inputs:
+            raise ValueError(f'Derived feature {name} needs inputs')
+        self.name = name
+        self.default = default
+        self.inputs = list(inputs)
+        self.derive = derive
+        self.low = low
+        self.high = high
+
+
+class FeatureSchema:
+    """Ordered features of a model, compiled to a vectorized transform"""
+
+    def __init__(self, features):
+        self.features = [f if isinstance(f, Feature) else Feature(f) for f in features]
+        self.names = [f.name for f in self.features]
+        duplicates = sorted({name for name in self.names if self.names.count(name) > 1})
+        if duplicates:
+            raise ValueError(f"Duplicate features: {', '.join(duplicates)}")
+
+        # Missing derived features are NaN until derived
+        self._fill = [(f.name, np.nan if f.derive is not None else f.default) for f in self.features]
+        self._derived = [j for j, f in enumerate(self.features) if f.derive is not None]
+
+    def __len__(self):
+        return len(self.features)
+
+    def index(self, name):
+        return self.names.index(name)
+
+    def positions(self, header):
+        """Column of each feature in a CSV `header` (None where absent)"""
+        return [header.index(name) if name in header else None for name in self.names]
+
+    def check(self, model, name='model'):
+        """Raise ValueError unless `model` was fitted on these features"""
+        n_features = getattr(model, 'n_features_in_', None)
+        if n_features is not None and n_features != len(self):
+            raise ValueError(f'{name} expects {n_features} features, not {len(self)}')
+        fitted = getattr(model, 'feature_names_in_', None)
+        if fitted is not None and list(fitted) != self.names:
+            raise ValueError(f"{name} was fitted on {', '.join(map(str, fitted))}, "
+                             f"not {', '.join(self.names)}")
+
+    def transform(self, records):
+        """
+        Contiguous float32 matrix, one row per record
+
+        `records` is a list of feature dicts, a columnar source (DataFrame
+        or training Dataset, e.g. a CSV chunk) or a 2-D array-like whose
+        columns are already in feature order.
+        """
+        if hasattr(records, 'columns'):
+            return self._from_columns(records)
+        if len(records) and isinstance(records[0], dict):
+            return self._from_dicts(records)
+
+        features = np.ascontiguousarray(records, dtype=np.float32)
+        if features.ndim != 2 or features.shape[1] != len(self):
+            raise ValueError(f'Expected a 2-D array with {len(self)} columns')
+        return features
+
+    def _from_dicts(self, records):
+        n, width = len(records), len(self)
+        # One flat list of values converted in a single call, no per-row arrays
+        features = np.array([record.get(name, default) for record in records for name, default in self._fill],
+                            dtype=np.float32).reshape(n, width)
+        return self.fill_derived(features, records)
+
+    def fill_derived(self, features, records):
+        """Derive the derived features left NaN in the matrix of `records` (feature dicts), in place"""
+        if self._derived and np.isnan(features).any():
+            for j in self._derived:
+                rows = np.flatnonzero(np.isnan(features[:, j]))
+                if len(rows):
+                    feature = self.features[j]
+                    inputs = (np.fromiter((records[i].get(name, 0.0) for i in rows), dtype=np.float32,
+                                          count=len(rows)) for name in feature.inputs)
+                    features[rows, j] = feature.derive(*inputs)
+        return features
+
+    def _from_columns(self, data):
+        features = np.empty((len(data), len(self)), dtype=np.float32)
+        for j, feature in enumerate(self.features):
+            if feature.name in data:
+                features[:, j] = data[feature.name]
+            elif feature.derive is not None and any(name in data for name in feature.inputs):
+                features[:, j] = feature.derive(*(np.asarray(data[name], dtype=np.float32) if name in data
+                                                  else np.zeros(len(data), dtype=np.float32)
+                                                  for name in feature.inputs))
+            else:
+                features[:, j] = feature.default
+        return features
+
+
+VEHICLE_COUNTS = ['CarCount', 'BikeCount', 'BusCount', 'TruckCount']
+
+# Energy forecaster history, in readings (about 20 minutes apart): the
+# consumption `k` readings back (1 = the latest) and the mean of the last `w`
+# readings, kept incrementally by inference/forecast.py
+ENERGY_LAGS = [1, 2, 3, 6, 12]
+ENERGY_WINDOWS = [6, 24, 72]
+
+# Artifact (file name without extension in MODELS_DIR) -> schema
+SCHEMAS = {
+    # Flask website (synthetic models, see fix_models.py)
+    'traffic_model': FeatureSchema([
+        Feature('hour', inputs=['minute_of_day'], derive=hour_of_day, low=0, high=23),
+        Feature('day_of_week', low=0, high=6),
+        Feature('vehicle_count', inputs=VEHICLE_COUNTS, derive=total, low=0),
+        Feature('avg_speed', low=0),
+        Feature('weather', low=0, high=2)
+    ]),
+    'air_quality_model': FeatureSchema([f'feature_{i}' for i in range(10)]),
+    'energy_model': FeatureSchema([f'feature_{i}' for i in range(5)]),
+    # Trained on the raw datasets (see training/pipelines.py)
+    'traffic_random_forest': FeatureSchema([Feature(name, low=0) for name in VEHICLE_COUNTS]
+                                           + [Feature('Total', inputs=VEHICLE_COUNTS, derive=total, low=0)]),
+    'air_quality_random_forest': FeatureSchema(['PT08.S1(CO)', 'NMHC(GT)', 'C6H6(GT)', 'PT08.S2(NMHC)', 'NOx(GT)',
+                                                'PT08.S3(NOx)', 'NO2(GT)', 'PT08.S4(NO2)', 'PT08.S5(O3)',
+                                                'T', 'RH', 'AH']),
+    'energy_random_forest': FeatureSchema(['record_id']),
+    # Time of day of the latest reading as a point on the unit circle, so 23:59 is next to 00:00
+    'energy_forecaster': FeatureSchema([f'lag_{k}' for k in ENERGY_LAGS] + [f'mean_{w}' for w in ENERGY_WINDOWS]
+                                       + ['time_sin', 'time_cos'])
+}
@@ -0,0 +1,211 @@
+"""
+Streaming energy forecasts
+
+The blower meters report kWh readings (TxnDate, TxnTime, Consumption)
+roughly every 20 minutes. The `energy_forecaster` model predicts the next
+`horizon` readings at once, from the lags, rolling means and time of day
+declared in its schema (see inference/features.py).
+
+Training computes those features over the whole series in a few
+vectorized calls (`history_features`, `forecast_dataset`). Serving keeps
+them incrementally: `MeterWindow` holds a ring buffer of the last
+`HISTORY` readings of a meter and one running sum per rolling window, so a
+new reading costs the same constant work after a hundred readings or a
+million. `EnergyForecaster` tracks a bounded number of meters and scores
+all of them in one predict call, every horizon step included; nothing is
+fed back step by step.
+
+Windows count readings, not minutes, as the model was trained on them.
+"""
+
+import collections
+from datetime import datetime
+
+import numpy as np
+
+from .features import ENERGY_LAGS, ENERGY_WINDOWS, SCHEMAS
+
+ARTIFACT = 'energy_forecaster'
+SCHEMA = SCHEMAS[ARTIFACT]
+
+# Readings forecast by a trained model (about two hours)
+DEFAULT_HORIZON = 6
+
+# Readings a meter needs before it can be forecast: the longest lag or window
+HISTORY = max(ENERGY_LAGS + ENERGY_WINDOWS)
+
+# Meters tracked at once; the one updated least recently is dropped beyond this
+DEFAULT_MAX_METERS = 10000
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def reading_time(record):
+    """
+    datetime64[s] of a reading record: `TxnDate` and `TxnTime` as in the
+    meter CSVs ('01 Jan 2022', '16:55:52'), or an ISO `timestamp`
+    """
+    if 'timestamp' in record:
+        return np.datetime64(record['timestamp'], 's')
+    return np.datetime64(datetime.strptime(f"{record['TxnDate']} {record['TxnTime']}", '%d %b %Y %H:%M:%S'), 's')
+
+
+def time_of_day(timestamps):
+    """(sin, cos) of the time of day of datetime64 `timestamps`"""
+    timestamps = np.asarray(timestamps, dtype='datetime64[s]')
+    seconds = (timestamps - timestamps.astype('datetime64[D]')).astype(np.int64)
+    angle = seconds * (2 * np.pi / SECONDS_PER_DAY)
+    return np.sin(angle), np.cos(angle)
+
+
+def history_features(timestamps, values):
+    """
+    Feature rows of a time-ordered series, for every reading with a full history
+
+    Returns (features, rows): the float32 matrix in schema order and the
+    index of the reading each row ends at (the first HISTORY - 1 readings
+    have none).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    rows = np.arange(HISTORY - 1, len(values))
+    # Rolling means as differences of one cumulative sum
+    cumulative = np.concatenate([[0.0], np.cumsum(values)])
+    columns = [values[rows - (k - 1)] for k in ENERGY_LAGS]
+    columns += [(cumulative[rows + 1] - cumulative[rows + 1 - w]) / w for w in ENERGY_WINDOWS]
+    columns += time_of_day(np.asarray(timestamps)[rows])
+    return np.column_stack(columns).astype(np.float32), rows
+
+
+def forecast_dataset(timestamps, values, horizon=DEFAULT_HORIZON):
+    """
+    (X, y) of a time-ordered series: each reading's features and the `horizon` readings after it
+
+    y has one column per step ahead; readings too close to the end of the
+    series to have them all are dropped.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    X, rows = history_features(timestamps, values)
+    keep = rows + horizon < len(values)
+    rows = rows[keep]
+    return X[keep], values[rows[:, np.newaxis] + np.arange(1, horizon + 1)]
+
+
+class MeterWindow:
+    """
+    The last HISTORY readings of one meter, with a running sum per rolling window
+
+    `push` replaces the oldest reading in the ring buffer and moves each
+    window's sum by the reading entering it and the one leaving it:
+    O(lags + windows) per reading, independent of how many came before.
+    Every HISTORY readings the sums are recomputed from the buffer, so
+    rounding from the additions and subtractions cannot build up (amortized
+    O(windows) per reading).
+    """
+
+    __slots__ = ('buffer', 'position', 'count', 'sums', 'last_time')
+
+    def __init__(self):
+        self.buffer = [0.0] * HISTORY
+        self.position = 0  # slot of the next reading
+        self.count = 0
+        self.sums = [0.0] * len(ENERGY_WINDOWS)
+        self.last_time = None
+
+    @property
+    def ready(self):
+        return self.count >= HISTORY
+
+    def push(self, timestamp, value):
+        """Add a reading; False (and ignored) if it is older than the latest one"""
+        if self.last_time is not None and timestamp < self.last_time:
+            return False
+        buffer, position, count, sums = self.buffer, self.position, self.count, self.sums
+        for j, window in enumerate(ENERGY_WINDOWS):
+            # Read before the slot is overwritten: the oldest slot leaves the longest window
+            sums[j] += value - (buffer[(position - window) % HISTORY] if count >= window else 0.0)
+        buffer[position] = value
+        self.position = (position + 1) % HISTORY
+        self.count = count + 1
+        self.last_time = timestamp
+        if self.position == 0:
+            self.resync()
+        return True
+
+    def resync(self):
+        """Recompute the running sums from the buffer"""
+        buffer, position, count = self.buffer, self.position, self.count
+        self.sums = [sum(buffer[(position - k) % HISTORY] for k in range(1, min(window, count) + 1))
+                     for window in ENERGY_WINDOWS]
+
+    def row(self):
+        """Lag and rolling-mean features, in schema order"""
+        buffer, position = self.buffer, self.position
+        return ([buffer[(position - k) % HISTORY] for k in ENERGY_LAGS]
+                + [total / window for total, window in zip(self.sums, ENERGY_WINDOWS)])
+
+
+class EnergyForecaster:
+    """
+    Streaming multi-step consumption forecasts for any number of meters
+
+    `update` adds one reading to a meter in constant time; `forecast`
+    builds the feature matrix of every ready meter and scores it with a
+    single `predict(features)` call (e.g. a bound InferenceCore.predict),
+    which returns all horizon steps of all meters.
+
+    Memory is bounded: `known_meters`, when given, is the set of meter ids
+    accepted (others raise KeyError), and at most `max_meters` are tracked,
+    the least recently updated one being dropped to make room.
+    """
+
+    def __init__(self, max_meters=DEFAULT_MAX_METERS, known_meters=None):
+        self.meters = collections.OrderedDict()
+        self.max_meters = max_meters
+        self.known_meters = None if known_meters is None else set(known_meters)
+        self.late = 0
+        self.evicted = 0
+
+    def update(self, meter, timestamp, value):
+        """Add a reading; False if it arrived after a newer one of the same meter (dropped)"""
+        window = self.meters.get(meter)
+        if window is None:
+            if not self.accepts(meter):
+                raise KeyError(f'Unknown meter {meter!r}')
+            while len(self.meters) >= self.max_meters:
+                self.meters.popitem(last=False)
+                self.evicted += 1
+            window = self.meters[meter] = MeterWindow()
+        else:
+            self.meters.move_to_end(meter)
+        accepted = window.push(np.datetime64(timestamp, 's'), float(value))
+        if not accepted:
+            self.late += 1
+        return accepted
+
+    def accepts(self, meter):
+        """Whether readings of `meter` are accepted (see `known_meters`)"""
+        return self.known_meters is None or meter in self.known_meters
+
+    def pending(self, meter):
+        """Readings `meter` still needs before it can be forecast"""
+        window = self.meters.get(meter)
+        return HISTORY - min(window.count, HISTORY) if window is not None else HISTORY
+
+    def matrix(self, meters=None):
+        """(meters, float32 features) of the given (default: all) meters that have a full history"""
+        names = [meter for meter in (self.meters if meters is None else meters)
+                 if meter in self.meters and self.meters[meter].ready]
+        features = np.empty((len(names), len(SCHEMA)), dtype=np.float32)
+        if names:
+            windows = [self.meters[meter] for meter in names]
+            features[:, :-2] = [window.row() for window in windows]
+            features[:, -2], features[:, -1] = time_of_day([window.last_time for window in windows])
+        return names, features
+
+    def forecast(self, predict, meters=None):
+        """{meter: float64 array of the next readings} for the ready meters, in one predict call"""
+        names, features = self.matrix(meters)
+        if not names:
+            return {}
+        values = np.asarray(predict(features), dtype=np.float64).reshape(len(names), -1)
+        return dict(zip(names, values))
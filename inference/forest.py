@@ -0,0 +1,226 @@
+"""
+Compiled tree-ensemble inference
+
+Flattens the trees of a fitted RandomForestClassifier/RandomForestRegressor
+(or ExtraTrees*) into a few packed NumPy arrays and evaluates every tree for
+every row with a vectorized level-by-level traversal. This skips sklearn's
+per-call input validation and per-estimator dispatch, which dominate the
+cost of small batches.
+
+Exactness: inputs are cast to float32 as sklearn does. Thresholds are stored
+as the largest float32 not above the original float64 threshold, which gives
+the same decision as sklearn's float64 comparison for every float32 input.
+Class counts are normalized per leaf exactly like DecisionTreeClassifier
+(trees fitted with sklearn >= 1.4 already store fractions and are kept
+as-is), and per-tree outputs are summed in estimator order before dividing by
+the tree count. Results are therefore bit-identical to sklearn for forests
+predicted with n_jobs=None/1. With n_jobs > 1 sklearn itself accumulates the
+trees in thread completion order, so the two can differ in the last ulp
+(relative error below 1e-12).
+"""
+
+import numpy as np
+
+# Row chunk size is chosen so a chunk touches about this many (row, tree) pairs
+CHUNK_ELEMENTS = 1 << 16
+
+
+class CompiledForest:
+    """
+    Tree ensemble stored as flat arrays
+
+    Nodes of all trees are concatenated. For node `i`:
+    - `feature[i]`, `threshold[i]`: split test `x[feature] <= threshold` (float32)
+    - `children[2*i]`, `children[2*i + 1]`: left and right child
+    - `missing_left[i]`: NaN inputs go left (sklearn >= 1.3 forests)
+    - `value[i]`: leaf output (class probabilities or regression outputs),
+      or its integer code when `value_scale`/`value_offset` are set: the
+      output is then `value * value_scale + value_offset` per column
+      (quantized leaves, see training/compaction.py)
+
+    Leaves point to themselves, so traversing `max_depth` levels lands every
+    row on a leaf in every tree without per-node branching.
+
+    `shared` is True when the arrays are memory-mapped from an artifact (see
+    inference/artifacts.py) rather than held in private memory.
+    """
+
+    def __init__(self, feature, threshold, children, value, roots, max_depth,
+                 n_features, missing_left=None, classes=None, value_scale=None, value_offset=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.missing_left = missing_left
+        self.max_depth = int(max_depth)
+        self.n_features_in_ = int(n_features)
+        self.classes_ = classes
+        self.value_scale = value_scale
+        self.value_offset = value_offset
+        self.n_estimators = len(roots)
+        self.n_outputs_ = 1 if classes is not None else value.shape[1]
+        self.shared = False
+
+    @property
+    def is_classifier(self):
+        return self.classes_ is not None
+
+    @property
+    def nbytes(self):
+        """Memory held by the node arrays"""
+        arrays = [self.feature, self.threshold, self.children, self.value, self.roots]
+        if self.missing_left is not None:
+            arrays.append(self.missing_left)
+        return sum(a.nbytes for a in arrays)
+
+    def _validate(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(
+                f'X has {X.shape[-1] if X.ndim else 0} features, but the model '
+                f'expects {self.n_features_in_} features'
+            )
+        return X
+
+    def _apply(self, X):
+        """Leaf index reached in every tree, shape (n_rows, n_trees)"""
+        n_rows = X.shape[0]
+        flat = X.ravel()
+        offsets = (np.arange(n_rows, dtype=np.intp) * self.n_features_in_)[:, None]
+        nodes = np.repeat(self.roots[None, :], n_rows, axis=0)
+        has_nan = np.isnan(flat).any()
+
+        for _ in range(self.max_depth):
+            x = flat.take(offsets + self.feature.take(nodes))
+            if has_nan:
+                # NaN fails `x <= threshold` and goes right unless the split says otherwise
+                go_right = ~(x <= self.threshold.take(nodes))
+                if self.missing_left is not None:
+                    go_right &= ~(np.isnan(x) & self.missing_left.take(nodes))
+            else:
+                go_right = x > self.threshold.take(nodes)
+            nodes = self.children.take(2 * nodes + go_right)
+        return nodes
+
+    def tree_values(self, X):
+        """Leaf value (or code) of every tree for every row, shape (n_trees, n_rows, n_outputs or n_classes)"""
+        return self.value[self._apply(self._validate(X)).T]
+
+    def _accumulate(self, X):
+        """Mean of the leaf values over all trees"""
+        X = self._validate(X)
+        n_rows = X.shape[0]
+        out = np.zeros((n_rows, self.value.shape[1]), dtype=np.float64)
+        chunk = max(1, CHUNK_ELEMENTS // self.n_estimators)
+
+        for start in range(0, n_rows, chunk):
+            leaves = self._apply(X[start:start + chunk])
+            block = out[start:start + chunk]
+            # Sum in estimator order to match sklearn's accumulation
+            for t in range(self.n_estimators):
+                block += self.value[leaves[:, t]]
+
+        out /= self.n_estimators
+        if self.value_scale is not None:
+            # The mean of affinely coded leaves is the same affine map of the mean code
+            out *= self.value_scale
+            out += self.value_offset
+        return out
+
+    def predict_proba(self, X):
+        """Class probabilities (classifiers only)"""
+        if not self.is_classifier:
+            raise AttributeError('predict_proba is only available for classifiers')
+        return self._accumulate(X)
+
+    def predict(self, X):
+        """Class labels for classifiers, outputs for regressors"""
+        out = self._accumulate(X)
+        if self.is_classifier:
+            return self.classes_.take(out.argmax(axis=1))
+        if self.n_outputs_ == 1:
+            return out[:, 0]
+        return out
+
+
+def float32_floor(values):
+    """
+    Largest float32 not greater than each float64 value
+
+    For any float32 `x`, `x <= values` and `x <= float32_floor(values)`
+    are equivalent, so thresholds can be stored in half the space without
+    changing a single decision.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    rounded = values.astype(np.float32)
+    above = rounded.astype(np.float64) > values
+    rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+    return rounded
+
+
+def compile_forest(estimator):
+    """
+    Compile a fitted sklearn forest into a CompiledForest
+
+    Raises ValueError for estimators that are not tree ensembles or for
+    multi-output classifiers.
+    """
+    trees = getattr(estimator, 'estimators_', None)
+    if not trees or not all(hasattr(tree, 'tree_') for tree in trees):
+        raise ValueError(f'{type(estimator).__name__} is not a fitted tree ensemble')
+
+    classes = getattr(estimator, 'classes_', None)
+    if classes is not None and getattr(estimator, 'n_outputs_', 1) != 1:
+        raise ValueError('Multi-output classifiers are not supported')
+
+    features, thresholds, children, values, missing, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+
+    for tree in trees:
+        tree = tree.tree_
+        n_nodes = tree.node_count
+        ids = np.arange(n_nodes)
+        is_leaf = tree.children_left < 0
+
+        left = np.where(is_leaf, ids, tree.children_left) + offset
+        right = np.where(is_leaf, ids, tree.children_right) + offset
+
+        features.append(np.where(is_leaf, 0, tree.feature))
+        thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+        children.append(np.column_stack([left, right]).ravel())
+
+        value = np.asarray(tree.value, dtype=np.float64)
+        if classes is not None:
+            value = value[:, 0, :len(classes)].copy()
+            normalizer = value.sum(axis=1)[:, np.newaxis]
+            if (normalizer > 1.0 + 1e-9).any():
+                # Class counts (sklearn < 1.4): same normalization as predict_proba
+                normalizer[normalizer == 0.0] = 1.0
+                value /= normalizer
+        else:
+            value = value[:, :, 0]
+        values.append(value)
+
+        missing_go_to_left = getattr(tree, 'missing_go_to_left', None)
+        missing.append(np.zeros(n_nodes, dtype=bool) if missing_go_to_left is None
+                       else np.asarray(missing_go_to_left, dtype=bool) & ~is_leaf)
+
+        roots.append(offset)
+        offset += n_nodes
+        max_depth = max(max_depth, tree.max_depth)
+
+    missing_left = np.concatenate(missing)
+
+    return CompiledForest(
+        feature=np.concatenate(features).astype(np.int32),
+        threshold=float32_floor(np.concatenate(thresholds)),
+        children=np.concatenate(children).astype(np.intp),
+        value=np.ascontiguousarray(np.concatenate(values)),
+        roots=np.asarray(roots, dtype=np.intp),
+        max_depth=max_depth,
+        n_features=estimator.n_features_in_,
+        missing_left=missing_left if missing_left.any() else None,
+        classes=classes
+    )
@@ -0,0 +1,141 @@
+"""
+Live feed publisher - compute once per tick, fan out to every subscriber
+"""
+
+import asyncio
+import logging
+import time
+
+from .payloads import dumps
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """
+    One subscriber's view of the feed
+
+    Holds at most the newest undelivered message: a client that falls
+    behind skips ticks instead of buffering them.
+    """
+
+    def __init__(self, publisher):
+        self.publisher = publisher
+        self._queue = asyncio.Queue(maxsize=1)
+        self.dropped = 0
+
+    def offer(self, message):
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(message)
+
+    async def get(self):
+        """Next message (a JSON string)"""
+        return await self._queue.get()
+
+    def close(self):
+        self.publisher.unsubscribe(self)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.get()
+
+
+class LivePublisher:
+    """
+    Periodically computes a payload and broadcasts it
+
+    `compute()` is an async callable returning a JSON-serializable payload.
+    It runs once per `interval` seconds while at least one client is
+    subscribed, and not at all otherwise; the result is serialized once and
+    the same string is handed to every subscriber, so N viewers cost one
+    computation per tick rather than N. New subscribers receive the latest
+    payload immediately.
+    """
+
+    def __init__(self, compute, interval=5.0):
+        self.compute = compute
+        self.interval = interval
+        self._subscribers = set()
+        self._task = None
+        self._wakeup = None
+        self.latest = None
+
+        # Statistics
+        self.ticks = 0
+        self.failures = 0
+        self.messages = 0
+        self.last_tick_ms = None
+
+    def subscribe(self):
+        subscription = Subscription(self)
+        self._subscribers.add(subscription)
+        if self.latest is not None:
+            subscription.offer(self.latest)
+        elif self._wakeup is not None:
+            # Nothing published yet - tick now rather than at the next interval
+            self._wakeup.set()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self._subscribers.discard(subscription)
+
+    async def tick(self):
+        """Compute one payload and deliver it to all current subscribers"""
+        started = time.perf_counter()
+        try:
+            payload = await self.compute()
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Live feed update failed: {str(e)}")
+            return None
+        self.ticks += 1
+        self.last_tick_ms = (time.perf_counter() - started) * 1000
+
+        message = dumps({'tick': self.ticks, 'timestamp': time.time(), **payload}).decode()
+        self.latest = message
+        for subscription in list(self._subscribers):
+            subscription.offer(message)
+            self.messages += 1
+        return message
+
+    async def _run(self):
+        while True:
+            if self._subscribers:
+                await self.tick()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self):
+        """Start ticking on the running event loop"""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._wakeup = None
+
+    def stats(self):
+        return {
+            'interval': self.interval,
+            'running': self._task is not None,
+            'subscribers': len(self._subscribers),
+            'ticks': self.ticks,
+            'failures': self.failures,
+            'messages': self.messages,
+            'dropped': sum(subscription.dropped for subscription in self._subscribers),
+            'last_tick_ms': self.last_tick_ms
+        }
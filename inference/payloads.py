@@ -0,0 +1,234 @@
+"""
+Prediction payloads - JSON bodies in, typed arrays in between, JSON out
+
+`RecordDecoder` is built once per feature schema (see
+inference/features.py) and turns the parsed records of a request, single
+or batch, into the schema's float32 matrix in a handful of NumPy calls:
+one flat pass reads every field, then missing required fields, non-numeric
+values and values outside the features' `low`/`high` bounds are found with
+vectorized checks. Only rejected rows are walked in Python, to word their
+errors, so a batch reports every bad row at once instead of failing on the
+first.
+
+`loads` and `dumps` use orjson when it is installed (an optional
+dependency; `pip install orjson`) and the standard library otherwise.
+`dumps` encodes NumPy arrays and scalars natively, so large result sets
+need no conversion to Python lists first.
+"""
+
+import json
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # optional, the standard library is used instead
+    orjson = None
+
+
+class PayloadError(ValueError):
+    """A request body that cannot be decoded; `row_errors` maps rejected rows to their errors"""
+
+    def __init__(self, message, row_errors=None):
+        # Both in args, so the error survives pickling out of worker processes
+        super().__init__(message, row_errors or {})
+        self.message = message
+        self.row_errors = row_errors or {}
+
+    def __str__(self):
+        return self.message
+
+
+def loads(body):
+    """Parse a JSON body (bytes or str); PayloadError if it is not JSON"""
+    try:
+        return orjson.loads(body) if orjson is not None else json.loads(body)
+    except ValueError as e:
+        raise PayloadError(f'Invalid JSON: {e}') from None
+
+
+def _default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def dumps(payload):
+    """JSON bytes of `payload`; NumPy arrays and scalars included"""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, default=_default, separators=(',', ':')).encode()
+
+
+class RecordDecoder:
+    """
+    Validates request records against a FeatureSchema into its float32 matrix
+
+    Records are feature dicts, or arrays of values in feature order.
+    `required` names the fields every dict must hold (arrays always hold
+    all of them). Missing optional fields take the schema's defaults or are
+    derived, as in FeatureSchema.transform.
+    """
+
+    def __init__(self, schema, required=()):
+        unknown = sorted(set(required) - set(schema.names))
+        if unknown:
+            raise ValueError(f"Unknown required fields: {', '.join(unknown)}")
+        self.schema = schema
+        self.names = schema.names
+        self.required = np.array([schema.index(name) for name in required], dtype=np.intp)
+        self.low = np.array([-np.inf if f.low is None else f.low for f in schema.features], dtype=np.float64)
+        self.high = np.array([np.inf if f.high is None else f.high for f in schema.features], dtype=np.float64)
+        self.bounded = bool(np.isfinite(self.low).any() or np.isfinite(self.high).any())
+        # Filled into missing optional fields; derived ones stay NaN until derived
+        self.defaults = np.array([np.nan if f.derive is not None else f.default for f in schema.features],
+                                 dtype=np.float64)
+        # Per-field rules of the single-record path
+        self._rules = [(f.name, np.nan if f.derive is not None else f.default, f.name in required, f.low, f.high)
+                       for f in schema.features]
+
+    def decode(self, records):
+        """
+        (features, errors) for a list of records
+
+        `features` has one float32 row per record; rows of rejected records
+        are zeros. `errors` maps the position of each rejected record to a
+        message naming its bad fields.
+        """
+        if not isinstance(records, list):
+            raise PayloadError('Expected a list of records')
+        objects = [i for i, record in enumerate(records) if type(record) is dict]
+        if len(objects) == len(records):
+            return self._decode_objects(records)
+        if not objects:
+            return self._decode_arrays(records)
+
+        # Mixed batch: decode each kind, then put the rows back in order
+        arrays = [i for i, record in enumerate(records) if type(record) is not dict]
+        features = np.empty((len(records), len(self.names)), dtype=np.float32)
+        errors = {}
+        for rows, (part, part_errors) in ((objects, self._decode_objects([records[i] for i in objects])),
+                                          (arrays, self._decode_arrays([records[i] for i in arrays]))):
+            features[rows] = part
+            errors.update({rows[i]: error for i, error in part_errors.items()})
+        return features, dict(sorted(errors.items()))
+
+    def decode_one(self, record):
+        """The float32 feature row of a single record; PayloadError if it is rejected"""
+        if type(record) is not dict:
+            features, errors = self.decode([record])
+            if errors:
+                raise PayloadError(errors[0], errors)
+            return features[0]
+
+        # Plain Python beats a dozen NumPy calls on one record; same rules and messages as decode
+        values, wrong, absent, outside = [], [], [], []
+        derive = False
+        for name, default, required, low, high in self._rules:
+            value = record.get(name)
+            kind = type(value)
+            if kind is float or kind is int or kind is bool:
+                if value != value:
+                    value = None
+                elif low is not None and value < low:
+                    outside.append(f'{name}: {value:g} is below {low:g}')
+                elif high is not None and value > high:
+                    outside.append(f'{name}: {value:g} is above {high:g}')
+            elif value is not None:
+                wrong.append(f'{name}: expected a number')
+                value = 0
+            if value is None:
+                if required:
+                    absent.append(name)
+                value = default
+                derive = derive or default != default
+            values.append(value)
+
+        if wrong or absent or outside:
+            message = '; '.join(wrong + ([f"missing {', '.join(absent)}"] if absent else []) + outside)
+            raise PayloadError(message, {0: message})
+        features = np.array(values, dtype=np.float32)
+        if derive:
+            self.schema.fill_derived(features[None, :], [record])
+        return features
+
+    def _decode_objects(self, records):
+        n, width = len(records), len(self.names)
+        flat = [record.get(name, np.nan) for record in records for name in self.names]
+        values, errors = self._numbers(flat, n, width, nullable=True)
+
+        missing = np.isnan(values)
+        if len(self.required):
+            for i in np.flatnonzero(missing[:, self.required].any(axis=1)):
+                absent = [self.names[j] for j in self.required if missing[i, j]]
+                errors.setdefault(int(i), []).append(f"missing {', '.join(absent)}")
+        values = np.where(missing, self.defaults, values)
+        return self._finish(values, errors, records)
+
+    def _decode_arrays(self, rows):
+        n, width = len(rows), len(self.names)
+        try:
+            values = np.array(rows)
+        except ValueError:
+            values = None
+        if values is not None and values.shape == (n, width) and values.dtype.kind in 'biuf':
+            return self._finish(values.astype(np.float64, copy=False), {})
+
+        # Slow path: find the malformed rows
+        errors = {}
+        flat = []
+        for i, row in enumerate(rows):
+            if isinstance(row, (list, tuple)) and len(row) == width:
+                flat.extend(row)
+            else:
+                errors[i] = [f'expected an object or an array of {width} numbers']
+                flat.extend([0] * width)
+        values, value_errors = self._numbers(flat, n, width, nullable=False)
+        for i, messages in value_errors.items():
+            errors.setdefault(i, []).extend(messages)
+        return self._finish(values, errors)
+
+    def _numbers(self, flat, n, width, nullable):
+        """float64 (n, width) matrix of `flat`, plus {row: [messages]} of values that are not numbers"""
+        try:
+            values = np.array(flat)
+        except ValueError:
+            values = None
+        if values is not None and values.dtype.kind in 'biuf' and values.shape == (len(flat),):
+            return values.astype(np.float64, copy=False).reshape(n, width), {}
+
+        values = np.empty(len(flat), dtype=np.float64)
+        errors = {}
+        for k, value in enumerate(flat):
+            kind = type(value)
+            if kind is float or kind is int or kind is bool:
+                values[k] = value
+            elif value is None and nullable:
+                values[k] = np.nan
+            else:
+                # Not also reported as missing; the row is rejected anyway
+                values[k] = 0
+                errors.setdefault(k // width, []).append(f'{self.names[k % width]}: expected a number')
+        return values.reshape(n, width), errors
+
+    def _finish(self, values, errors, records=None):
+        """Bounds checks, then the float32 matrix with rejected rows zeroed"""
+        if self.bounded:
+            with np.errstate(invalid='ignore'):
+                below, above = values < self.low, values > self.high
+            for i in np.flatnonzero((below | above).any(axis=1)):
+                errors.setdefault(int(i), []).extend(
+                    f'{self.names[j]}: {values[i, j]:g} is below {self.low[j]:g}' if below[i, j] else
+                    f'{self.names[j]}: {values[i, j]:g} is above {self.high[j]:g}'
+                    for j in np.flatnonzero(below[i] | above[i]))
+
+        features = values.astype(np.float32)
+        if errors:
+            features[list(errors)] = 0
+        if records is not None:
+            self.schema.fill_derived(features, records)
+        return features, {i: '; '.join(messages) for i, messages in sorted(errors.items())}
@@ -0,0 +1,460 @@
+"""
+Model registry - lazy loading with a memory budget, LRU eviction and hot reload
+"""
+
+import collections
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+import joblib
+import numpy as np
+
+from .artifacts import ARTIFACT_SUFFIX, is_artifact, load_artifact
+from .forest import CompiledForest, compile_forest
+
+logger = logging.getLogger(__name__)
+
+# Size of one sklearn tree node record (children, feature, threshold, impurity, ...)
+SKLEARN_NODE_BYTES = 64
+
+ARTIFACT_EXTENSIONS = ('.pkl', '.joblib')
+
+
+def load_model(path):
+    """
+    Default loader
+
+    `.forest` artifacts are memory-mapped; pickles are unpickled and compiled
+    when they hold a tree ensemble.
+    """
+    if is_artifact(path):
+        return load_artifact(path)
+
+    model = joblib.load(path)
+    try:
+        return compile_forest(model)
+    except ValueError:
+        return model
+
+
+def model_nbytes(model, shared=None):
+    """
+    Estimate the memory held by a loaded model
+
+    Understands compiled forests, fitted sklearn tree ensembles, NumPy
+    arrays and tuples/lists/dicts of those. Anything else counts as 0.
+    `shared=None` counts everything, `True` only memory-mapped forests and
+    `False` only private memory.
+    """
+    if model is None:
+        return 0
+    if isinstance(model, CompiledForest):
+        return model.nbytes if shared in (None, model.shared) else 0
+    if isinstance(model, dict):
+        return sum(model_nbytes(value, shared) for value in model.values())
+    if isinstance(model, (list, tuple)):
+        return sum(model_nbytes(value, shared) for value in model)
+    if shared:
+        return 0
+    if hasattr(model, 'estimators_'):
+        return sum(model_nbytes(estimator) for estimator in model.estimators_)
+    if hasattr(model, 'tree_'):
+        return model.tree_.node_count * SKLEARN_NODE_BYTES + model.tree_.value.nbytes
+    return getattr(model, 'nbytes', 0)
+
+
+def artifact_signature(path):
+    """
+    Cheap change detector for an artifact: (path, mtime_ns, size)
+
+    `.forest` directories are renamed into place as a whole, so their
+    `meta.json` changes whenever the artifact does.
+    """
+    target = os.path.join(path, 'meta.json') if os.path.isdir(path) else path
+    stat = os.stat(target)
+    return (path, stat.st_mtime_ns, stat.st_size)
+
+
+def artifact_version(path):
+    """Short content hash identifying the version of an artifact"""
+    digest = hashlib.sha1()
+    if os.path.isdir(path):
+        files = [os.path.join(path, filename) for filename in sorted(os.listdir(path))]
+    else:
+        files = [path]
+
+    for filename in files:
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def warm_up(model):
+    """
+    Default validator - one prediction on a row of zeros must be finite
+
+    Models without `n_features_in_` (or dicts/lists of them) are checked
+    member by member; anything else passes.
+    """
+    if isinstance(model, dict):
+        models = [value for value in model.values() if value is not None]
+    elif isinstance(model, (list, tuple)):
+        models = list(model)
+    else:
+        models = [model]
+
+    for member in models:
+        n_features = getattr(member, 'n_features_in_', None)
+        if n_features is None:
+            continue
+        prediction = np.asarray(member.predict(np.zeros((1, n_features))), dtype=np.float64)
+        if not np.isfinite(prediction).all():
+            raise ValueError(f'{type(member).__name__} warm-up prediction is not finite')
+
+
+class _Counters:
+    """Per-model registry counters"""
+
+    __slots__ = ('hits', 'misses', 'loads', 'evictions', 'size_bytes', 'shared_bytes', 'last_load_ms',
+                 'signature', 'version', 'loaded_at', 'reloads', 'reload_failures', 'last_reload_ms',
+                 'last_error')
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+        self.size_bytes = 0
+        self.shared_bytes = 0
+        self.last_load_ms = None
+        self.signature = None
+        self.version = None
+        self.loaded_at = None
+        self.reloads = 0
+        self.reload_failures = 0
+        self.last_reload_ms = None
+        self.last_error = None
+
+
+class ModelRegistry:
+    """
+    Discovers model artifacts in a directory and loads them on first use
+
+    Artifacts are pickles (`name.pkl`, `name.joblib`) or memory-mapped
+    `name.forest` directories; the latter win when both exist. Loaded models
+    are kept in least-recently-used order. When their estimated private
+    memory exceeds `memory_budget` bytes, the least recently used models are
+    evicted (they are simply reloaded on their next use). Memory-mapped
+    arrays live in the shared page cache and do not count against the
+    budget. A single model larger than the budget is still served, with a
+    warning.
+
+    `loader(path)` turns an artifact path into a model; it defaults to
+    `load_model`. `validator(name, model)` runs on every freshly loaded model
+    before it is served and raises to reject it; it defaults to a warm-up
+    prediction (see `warm_up`).
+
+    Hot reload: `refresh()` (or the thread started by `start_watcher`)
+    reloads every loaded model whose artifact changed on disk. The new
+    version is loaded and validated off the request path, then swapped in
+    with a single reference assignment, so requests keep using the old
+    version until then and never wait for the load. A version that fails to
+    load or validate is logged and the old one keeps serving. Callbacks
+    registered with `add_listener` are called with the model name whenever a
+    different version of a model goes live.
+    """
+
+    def __init__(self, models_dir, memory_budget=None, loader=None, validator=None):
+        self.models_dir = models_dir
+        self.memory_budget = memory_budget
+        self.loader = loader or load_model
+        self.validator = validator or (lambda name, model: warm_up(model))
+
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._loaded = collections.OrderedDict()
+        self._artifacts = {}
+        self._counters = collections.defaultdict(_Counters)
+        self._watcher = None
+        self._watch_stop = threading.Event()
+        self._listeners = []
+        self.watch_interval = None
+        self.discover()
+
+    def add_listener(self, callback):
+        """Call `callback(name)` whenever a new version of a model is installed"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        """Stop calling a callback registered with `add_listener`"""
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self, name):
+        for callback in list(self._listeners):
+            try:
+                callback(name)
+            except Exception as e:
+                logger.error(f"Model change listener failed for {name}: {str(e)}")
+
+    def discover(self):
+        """Scan the models directory for artifacts, returning {name: path}"""
+        artifacts = {}
+        if os.path.isdir(self.models_dir):
+            for filename in sorted(os.listdir(self.models_dir)):
+                name, extension = os.path.splitext(filename)
+                path = os.path.join(self.models_dir, filename)
+                if extension == ARTIFACT_SUFFIX and is_artifact(path):
+                    artifacts[name] = path
+                elif (extension in ARTIFACT_EXTENSIONS and os.path.isfile(path)
+                      and os.path.getsize(path) > 0):
+                    # Memory-mapped artifacts take precedence over pickles
+                    if not artifacts.get(name, '').endswith(ARTIFACT_SUFFIX):
+                        artifacts[name] = path
+
+        with self._lock:
+            self._artifacts = artifacts
+        return dict(artifacts)
+
+    def available(self):
+        """Names of all discovered artifacts"""
+        with self._lock:
+            return sorted(self._artifacts)
+
+    def __contains__(self, name):
+        with self._lock:
+            return name in self._artifacts
+
+    def get(self, name):
+        """Return a loaded model, loading it on first use; KeyError if unknown"""
+        with self._lock:
+            if name in self._loaded:
+                self._loaded.move_to_end(name)
+                self._counters[name].hits += 1
+                return self._loaded[name]
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        # One loader per model; other models stay available meanwhile
+        with load_lock:
+            with self._lock:
+                if name in self._loaded:
+                    self._loaded.move_to_end(name)
+                    self._counters[name].hits += 1
+                    return self._loaded[name]
+                path = self._artifacts.get(name)
+
+            if path is None:
+                path = self.discover().get(name)
+                if path is None:
+                    raise KeyError(f'No model artifact named {name!r} in {self.models_dir}')
+
+            model, loaded = self._load(name, path)
+            with self._lock:
+                self._counters[name].misses += 1
+                changed = self._install(name, model, loaded)
+
+        if changed:
+            self._notify(name)
+        return model
+
+    def _load(self, name, path):
+        """Load and validate one artifact without touching the served models"""
+        started = time.perf_counter()
+        signature = artifact_signature(path)
+        model = self.loader(path)
+        self.validator(name, model)
+        load_ms = (time.perf_counter() - started) * 1000.0
+
+        loaded = {
+            'signature': signature,
+            'version': artifact_version(path),
+            'size_bytes': model_nbytes(model, shared=False),
+            'shared_bytes': model_nbytes(model, shared=True),
+            'load_ms': load_ms
+        }
+        logger.info(f"✓ Loaded {name} {loaded['version']} ({loaded['size_bytes'] / 1e6:.1f} MB private, "
+                    f"{loaded['shared_bytes'] / 1e6:.1f} MB mapped in {load_ms:.0f} ms)")
+        return model, loaded
+
+    def _install(self, name, model, loaded):
+        """Publish a loaded model (lock held); True if it replaces another version"""
+        counters = self._counters[name]
+        changed = counters.version is not None and counters.version != loaded['version']
+        counters.loads += 1
+        counters.size_bytes = loaded['size_bytes']
+        counters.shared_bytes = loaded['shared_bytes']
+        counters.last_load_ms = loaded['load_ms']
+        counters.signature = loaded['signature']
+        counters.version = loaded['version']
+        counters.loaded_at = datetime.utcnow().isoformat()
+        self._loaded[name] = model
+        self._enforce_budget(keep=name)
+        return changed
+
+    def refresh(self):
+        """
+        Reload loaded models whose artifact changed; returns the names reloaded
+
+        Models that are not loaded need nothing: their next use loads
+        whatever is on disk.
+        """
+        artifacts = self.discover()
+        with self._lock:
+            candidates = [(name, self._counters[name].signature) for name in self._loaded]
+
+        reloaded = []
+        for name, signature in candidates:
+            path = artifacts.get(name)
+            if path is None:
+                continue
+            try:
+                if artifact_signature(path) == signature:
+                    continue
+            except OSError:
+                continue
+
+            with self._lock:
+                load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+            # Requests keep hitting the current version while this loads
+            with load_lock:
+                started = time.perf_counter()
+                try:
+                    model, loaded = self._load(name, path)
+                except Exception as e:
+                    with self._lock:
+                        self._counters[name].reload_failures += 1
+                        self._counters[name].last_error = str(e)
+                    logger.error(f"Reload of {name} from {path} failed, keeping the current version: {str(e)}")
+                    continue
+
+                with self._lock:
+                    if name not in self._loaded:
+                        # Evicted meanwhile; the next use loads the new version
+                        continue
+                    counters = self._counters[name]
+                    counters.reloads += 1
+                    counters.last_reload_ms = (time.perf_counter() - started) * 1000.0
+                    counters.last_error = None
+                    changed = self._install(name, model, loaded)
+
+            if changed:
+                self._notify(name)
+            reloaded.append(name)
+        return reloaded
+
+    def start_watcher(self, interval):
+        """Poll the models directory every `interval` seconds in a daemon thread"""
+        if self._watcher is not None:
+            return
+        self.watch_interval = interval
+        self._watch_stop.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,),
+                                         name='model-watcher', daemon=True)
+        self._watcher.start()
+        logger.info(f"✓ Watching {self.models_dir} for model changes every {interval}s")
+
+    def stop_watcher(self):
+        """Stop the watcher thread"""
+        watcher, self._watcher = self._watcher, None
+        if watcher is not None:
+            self._watch_stop.set()
+            watcher.join()
+        self.watch_interval = None
+
+    def _watch(self, interval):
+        while not self._watch_stop.wait(interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Error while checking {self.models_dir} for model changes: {str(e)}")
+
+    def evict(self, name):
+        """Drop a loaded model; returns True if it was loaded"""
+        with self._lock:
+            if self._loaded.pop(name, None) is None:
+                return False
+            self._counters[name].evictions += 1
+            return True
+
+    def clear(self):
+        """Drop every loaded model"""
+        with self._lock:
+            for name in list(self._loaded):
+                self._loaded.pop(name)
+                self._counters[name].evictions += 1
+
+    def resident_bytes(self):
+        """Estimated private memory held by loaded models"""
+        with self._lock:
+            return self._resident_bytes()
+
+    def _resident_bytes(self):
+        return sum(self._counters[name].size_bytes for name in self._loaded)
+
+    def _enforce_budget(self, keep):
+        """Evict least recently used models until within budget (lock held)"""
+        if self.memory_budget is None:
+            return
+
+        for name in list(self._loaded):
+            if self._resident_bytes() <= self.memory_budget:
+                break
+            if name == keep:
+                continue
+            self._loaded.pop(name)
+            self._counters[name].evictions += 1
+            logger.info(f"Evicted {name} to stay within the model memory budget")
+
+        if self._resident_bytes() > self.memory_budget:
+            logger.warning(f"{keep} alone exceeds the model memory budget "
+                           f"({self._counters[keep].size_bytes} > {self.memory_budget} bytes)")
+
+    def stats(self):
+        """Budget, resident size and per-model load/evict/hit counters"""
+        with self._lock:
+            names = sorted(set(self._artifacts) | set(self._counters))
+            return {
+                'memory_budget_bytes': self.memory_budget,
+                'resident_bytes': self._resident_bytes(),
+                'shared_bytes': sum(self._counters[name].shared_bytes for name in self._loaded),
+                'models': {
+                    name: {
+                        'loaded': name in self._loaded,
+                        'available': name in self._artifacts,
+                        'path': self._artifacts.get(name),
+                        'size_bytes': self._counters[name].size_bytes,
+                        'shared_bytes': self._counters[name].shared_bytes,
+                        'hits': self._counters[name].hits,
+                        'misses': self._counters[name].misses,
+                        'loads': self._counters[name].loads,
+                        'evictions': self._counters[name].evictions,
+                        'last_load_ms': self._counters[name].last_load_ms
+                    } for name in names
+                }
+            }
+
+    def versions(self):
+        """Active version, load time and reload history per model"""
+        with self._lock:
+            names = sorted(set(self._artifacts) | set(self._counters))
+            return {
+                'watch_interval': self.watch_interval,
+                'models': {
+                    name: {
+                        'loaded': name in self._loaded,
+                        'version': self._counters[name].version,
+                        'loaded_at': self._counters[name].loaded_at,
+                        'last_load_ms': self._counters[name].last_load_ms,
+                        'reloads': self._counters[name].reloads,
+                        'last_reload_ms': self._counters[name].last_reload_ms,
+                        'reload_failures': self._counters[name].reload_failures,
+                        'last_error': self._counters[name].last_error
+                    } for name in names
+                }
+            }
@@ -2,5 +2,37 @@
 import os
 import sys
 
+import pytest
+
 # Add project root to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def app():
+    """Flask application backed by an in-memory database"""
+    from website import create_app, db
+
+    app = create_app('testing')
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    """Test client logged in as a fresh user"""
+    from website import db
+    from website.models import User
+
+    with app.app_context():
+        user = User(username='tester', email='tester@example.com')
+        user.set_password('secret123')
+        db.session.add(user)
+        db.session.commit()
+
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'tester', 'password': 'secret123'})
+    return client
@@ -0,0 +1,71 @@
+"""
+Unit tests for the prediction result cache
+"""
+
+import numpy as np
+
+from inference.cache import PredictionCache
+
+
+class FakeClock:
+    """Manually advanced monotonic clock"""
+    
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+
+
+class TestPredictionCache:
+    """Test TTL, LRU eviction, quantization and invalidation"""
+    
+    def test_hit_and_miss(self):
+        """Test that stored results are returned and counted"""
+        cache = PredictionCache()
+        key = cache.key(np.array([1.0, 2.0]))
+        assert cache.get(key) is None
+        cache.put(key, {'aqi': 3.0})
+        assert cache.get(key) == {'aqi': 3.0}
+        
+        stats = cache.stats()
+        assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+        assert stats['hit_rate'] == 0.5
+    
+    def test_ttl_expiry(self):
+        """Test that entries expire after their TTL"""
+        clock = FakeClock()
+        cache = PredictionCache(ttl=10, clock=clock)
+        cache.put('k', 1)
+        clock.now = 9.9
+        assert cache.get('k') == 1
+        clock.now = 10.0
+        assert cache.get('k') is None
+        assert cache.stats()['expirations'] == 1
+    
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted first"""
+        cache = PredictionCache(max_entries=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1 and cache.get('c') == 3
+        assert cache.stats()['evictions'] == 1
+    
+    def test_quantization_shares_entries(self):
+        """Test that rows within one step map to the same key"""
+        cache = PredictionCache(quantize={1: 1.0, 2: 5})
+        rows = cache.prepare(np.array([[8, 20.3, 301], [8, 19.8, 299]], dtype=np.float64))
+        assert np.array_equal(rows[0], [8, 20.0, 300])
+        assert cache.key(rows[0]) == cache.key(rows[1])
+    
+    def test_clear_discards_in_flight_results(self):
+        """Test that results computed before a clear are not stored"""
+        cache = PredictionCache()
+        generation = cache.generation
+        cache.clear()
+        cache.put('k', 'stale', generation)
+        assert cache.get('k') is None
+        assert cache.stats()['invalidations'] == 1
@@ -0,0 +1,83 @@
+"""
+Unit tests for the shared inference core
+"""
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+
+from inference.core import InferenceCore, ModelSpec, get_core
+from website.ml_models import ModelManager
+
+
+@pytest.fixture
+def models_dir(tmp_path):
+    """A classifier and a regressor with known feature counts"""
+    rng = np.random.default_rng(0)
+    X = rng.uniform(0, 1, (300, 3))
+    joblib.dump(RandomForestClassifier(n_estimators=5, random_state=0).fit(X, (X[:, 0] > 0.5).astype(int)),
+                tmp_path / 'level.pkl')
+    joblib.dump(RandomForestRegressor(n_estimators=5, random_state=0).fit(X, X.sum(axis=1)),
+                tmp_path / 'amount.pkl')
+    return tmp_path
+
+
+SPECS = {
+    'level': ModelSpec(['a', 'b', 'c'], labels=['Low', 'High']),
+    'amount': ModelSpec(['a', 'b', 'c'])
+}
+
+
+class TestInferenceCore:
+    """Test loading, schemas and the batched prediction path"""
+
+    def test_compiled_for_small_inputs(self, models_dir):
+        """Test that small inputs use the compiled forest and match sklearn"""
+        core = InferenceCore(str(models_dir), compiled_max_rows=10, specs=SPECS)
+        X = np.random.default_rng(1).uniform(0, 1, (50, 3))
+        estimator = core.registry.get('amount')['estimator']
+
+        assert core.estimator('amount', 5) is core.registry.get('amount')['compiled']
+        assert core.estimator('amount', 50) is estimator
+        np.testing.assert_allclose(core.predict('amount', X[:5]), estimator.predict(X[:5]))
+        np.testing.assert_allclose(core.predict('amount', X), estimator.predict(X))
+
+    def test_classify(self, models_dir):
+        """Test classes and confidence against sklearn"""
+        core = InferenceCore(str(models_dir), specs=SPECS)
+        X = np.random.default_rng(2).uniform(0, 1, (20, 3))
+        estimator = core.registry.get('level')['estimator']
+
+        classes, confidence = core.classify('level', X)
+        np.testing.assert_array_equal(classes, estimator.predict(X))
+        np.testing.assert_allclose(confidence, estimator.predict_proba(X).max(axis=1))
+        assert core.labels('level') == ['Low', 'High']
+
+    def test_matrix_follows_schema(self, models_dir):
+        """Test feature dicts are ordered by the spec"""
+        core = InferenceCore(str(models_dir), specs=SPECS)
+        matrix = core.matrix('amount', [{'c': 3, 'a': 1}])
+        np.testing.assert_array_equal(matrix, [[1, 0, 3]])
+
+    def test_rejects_schema_mismatch(self, models_dir):
+        """Test that an artifact with the wrong feature count is not served"""
+        core = InferenceCore(str(models_dir), specs={'amount': ModelSpec(['a', 'b'])})
+        with pytest.raises(ValueError):
+            core.registry.get('amount')
+
+    def test_frontends_share_one_core(self, models_dir):
+        """Test that get_core hands every frontend the same loaded models"""
+        core = get_core(str(models_dir))
+        assert get_core(str(models_dir) + '/') is core
+        assert get_core(str(models_dir), compiled_max_rows=1) is not core
+
+        first = ModelManager(str(models_dir), core=core)
+        second = ModelManager(str(models_dir), core=core)
+        assert first.registry is second.registry
+        core.registry.get('amount')
+        assert core.registry.stats()['models']['amount']['loads'] == 1
+
+        # A closed manager no longer listens to model changes
+        first.close()
+        assert first._model_changed not in core.registry._listeners
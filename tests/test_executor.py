@@ -0,0 +1,168 @@
+"""
+Unit tests for the bounded inference executor and the async FastAPI handlers
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from inference.executor import BoundedExecutor, QueueFull
+
+
+def _square(x):
+    return x * x
+
+
+class TestBoundedExecutor:
+    """Test admission control and statistics"""
+
+    def test_runs_calls(self):
+        """Test that results come back and are counted"""
+        executor = BoundedExecutor('thread', max_workers=2, max_queue=4)
+
+        async def main():
+            return await asyncio.gather(*(executor.run(_square, i) for i in range(5)))
+
+        assert asyncio.run(main()) == [0, 1, 4, 9, 16]
+        stats = executor.stats()
+        assert stats['completed'] == 5
+        assert stats['rejected'] == 0
+        assert stats['queue_depth'] == 0
+        assert stats['wait_ms']['samples'] == 5
+        executor.shutdown()
+
+    def test_rejects_when_queue_full(self):
+        """Test that calls beyond workers + queue fail fast with QueueFull"""
+        executor = BoundedExecutor('thread', max_workers=1, max_queue=2)
+        release = threading.Event()
+
+        async def main():
+            tasks = [asyncio.ensure_future(executor.run(release.wait)) for _ in range(3)]
+            await asyncio.sleep(0.05)
+            assert executor.queue_depth == 2
+            with pytest.raises(QueueFull):
+                await executor.run(release.wait)
+            release.set()
+            await asyncio.gather(*tasks)
+
+        asyncio.run(main())
+        stats = executor.stats()
+        assert stats['completed'] == 3
+        assert stats['rejected'] == 1
+        assert stats['max_queue_depth'] == 2
+        # The queued calls waited for the first one to be released
+        assert stats['wait_ms']['max'] >= 40
+        executor.shutdown()
+
+    def test_failures_free_the_slot(self):
+        """Test that a raising call is counted and does not leak capacity"""
+        executor = BoundedExecutor('thread', max_workers=1, max_queue=0)
+
+        async def main():
+            with pytest.raises(ZeroDivisionError):
+                await executor.run(divmod, 1, 0)
+            return await executor.run(_square, 3)
+
+        assert asyncio.run(main()) == 9
+        assert executor.stats()['failed'] == 1
+        executor.shutdown()
+
+    def test_cancelled_caller_keeps_slot(self):
+        """Test that a running call holds its slot after its caller is cancelled"""
+        executor = BoundedExecutor('thread', max_workers=1, max_queue=0)
+        release = threading.Event()
+
+        async def main():
+            task = asyncio.ensure_future(executor.run(release.wait))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            assert executor.stats()['running'] == 1
+            with pytest.raises(QueueFull):
+                await executor.run(_square, 2)
+            release.set()
+            await asyncio.sleep(0.05)
+            return await executor.run(_square, 2)
+
+        assert asyncio.run(main()) == 4
+        stats = executor.stats()
+        assert stats['running'] == 0 and stats['completed'] == 2 and stats['rejected'] == 1
+        executor.shutdown()
+
+    def test_process_pool(self):
+        """Test the process-backed executor"""
+        executor = BoundedExecutor('process', max_workers=1, max_queue=1)
+
+        async def main():
+            return await executor.run(_square, 7)
+
+        assert asyncio.run(main()) == 49
+        executor.shutdown()
+
+
+class TestFastAPIExecutor:
+    """Test that the FastAPI handlers go through the executor"""
+
+    @pytest.fixture
+    def backend(self):
+        import backend.main as backend
+        return backend
+
+    def test_prediction_and_stats(self, backend):
+        """Test a traffic prediction and the executor statistics endpoint"""
+        if 'traffic_random_forest' not in backend.registry:
+            pytest.skip('traffic_random_forest.pkl not available')
+
+        with TestClient(backend.app) as client:
+            response = client.post('/traffic/predict', json=[12, 3, 1, 2, 40])
+            assert response.status_code == 200
+            assert 'Traffic_Level' in response.json()
+
+            stats = client.get('/executor/stats').json()
+            assert stats['completed'] >= 1
+            assert 'queue_depth' in stats and 'wait_ms' in stats
+
+    def test_invalid_body_returns_422(self, backend):
+        """Test that a malformed or out-of-range row is rejected with its reason"""
+        if 'traffic_random_forest' not in backend.registry:
+            pytest.skip('traffic_random_forest.pkl not available')
+
+        with TestClient(backend.app) as client:
+            response = client.post('/traffic/predict', json=[12, 3, -1, 2, 40])
+            assert response.status_code == 422
+            assert response.json()['detail'] == 'BusCount: -1 is below 0'
+            assert client.post('/traffic/predict', content=b'[12, 3').status_code == 422
+
+    def test_missing_model(self, backend):
+        """Test 503 for a model without an artifact"""
+        if 'energy_random_forest' in backend.registry:
+            pytest.skip('energy_random_forest is available')
+
+        with TestClient(backend.app) as client:
+            assert client.post('/energy/predict', json=[1, 2, 3]).status_code == 503
+
+    def test_overload_returns_503(self, backend, monkeypatch):
+        """Test that a full queue sheds requests with 503 and Retry-After"""
+        monkeypatch.setattr(backend, 'executor', BoundedExecutor('thread', max_workers=1, max_queue=0))
+        monkeypatch.setattr(type(backend.registry), '__contains__', lambda self, name: True)
+        release = threading.Event()
+        monkeypatch.setattr(backend, '_predict', lambda name, data: release.wait() and 1)
+
+        with TestClient(backend.app) as client:
+            blocked = threading.Thread(target=client.post, args=('/traffic/predict',), kwargs={'json': [1]})
+            blocked.start()
+            deadline = time.monotonic() + 2
+            while backend.executor.stats()['running'] == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+            response = client.post('/traffic/predict', json=[1])
+            assert response.status_code == 503
+            assert response.headers['Retry-After'] == '1'
+            release.set()
+            blocked.join()
+
+        assert backend.executor.stats()['rejected'] == 1
@@ -0,0 +1,62 @@
+"""
+Unit tests for the shared feature schemas
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+from inference.features import SCHEMAS, Feature, FeatureSchema, total
+
+COUNTS = ['cars', 'bikes']
+SCHEMA = FeatureSchema(['hour', 'speed', Feature('vehicles', inputs=COUNTS, derive=total),
+                        Feature('weather', default=2.0)])
+
+
+class TestFeatureSchema:
+    """Test declaration checks and the vectorized transform"""
+
+    def test_dicts_columns_and_rows_agree(self):
+        """Test that every input form gives the same float32 matrix"""
+        records = [{'hour': 8, 'speed': 31.5, 'cars': 10, 'bikes': 4},
+                   {'hour': 17, 'speed': '12', 'vehicles': 50, 'weather': 1}]
+        expected = np.array([[8, 31.5, 14, 2], [17, 12, 50, 1]], dtype=np.float32)
+
+        from_dicts = SCHEMA.transform(records)
+        assert from_dicts.dtype == np.float32 and from_dicts.flags.c_contiguous
+        np.testing.assert_array_equal(from_dicts, expected)
+
+        frame = pd.DataFrame({'hour': [8, 17], 'speed': [31.5, 12.0], 'cars': [10, 46], 'bikes': [4, 4],
+                              'weather': [2, 1]})
+        np.testing.assert_array_equal(SCHEMA.transform(frame), expected)
+        np.testing.assert_array_equal(SCHEMA.transform(expected.tolist()), expected)
+        with pytest.raises(ValueError):
+            SCHEMA.transform([[1, 2, 3]])
+
+    def test_declaration_errors(self):
+        """Test that broken schemas fail when declared"""
+        with pytest.raises(ValueError, match='Duplicate'):
+            FeatureSchema(['a', 'b', 'a'])
+        with pytest.raises(ValueError, match='inputs'):
+            Feature('total', derive=total)
+        assert SCHEMA.positions(['speed', 'x', 'hour']) == [2, 0, None, None]
+
+    def test_check_against_model(self):
+        """Test feature count and fitted column names against the schema"""
+        X = pd.DataFrame(np.random.default_rng(0).uniform(size=(50, 4)), columns=['hour', 'speed', 'vehicles', 'x'])
+        model = RandomForestRegressor(n_estimators=2, random_state=0).fit(X, X['hour'])
+
+        with pytest.raises(ValueError, match='fitted on'):
+            SCHEMA.check(model)
+        FeatureSchema(['hour', 'speed', 'vehicles', 'x']).check(model)
+        with pytest.raises(ValueError, match='expects 4 features'):
+            FeatureSchema(['hour']).check(model)
+
+    def test_training_and_serving_share_features(self):
+        """Test that a raw traffic frame and API records give the same rows"""
+        frame = pd.DataFrame({'CarCount': [10, 3], 'BikeCount': [1, 0], 'BusCount': [2, 1], 'TruckCount': [0, 5],
+                              'Total': [13, 9]})
+        records = frame.drop(columns='Total').to_dict('records')
+        schema = SCHEMAS['traffic_random_forest']
+        np.testing.assert_array_equal(schema.transform(frame), schema.transform(records))
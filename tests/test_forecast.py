@@ -0,0 +1,115 @@
+"""
+Unit tests for the streaming energy forecaster
+"""
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from inference.features import ENERGY_WINDOWS
+from inference.forecast import (HISTORY, SCHEMA, EnergyForecaster, forecast_dataset, history_features,
+                                reading_time)
+
+
+def _series(n, seed=0):
+    """Irregularly spaced readings, in time order"""
+    rng = np.random.default_rng(seed)
+    seconds = np.cumsum(rng.integers(600, 1800, n))
+    return np.datetime64('2022-01-01T00:00:00') + seconds.astype('timedelta64[s]'), rng.uniform(0.5, 5.0, n)
+
+
+class TestEnergyForecaster:
+    """Test incremental windows against the batch features and one-pass forecasts"""
+
+    def test_streaming_matches_batch_features(self):
+        """Test that the ring buffer and running sums give the training features, long after wrapping"""
+        timestamps, values = _series(10 * HISTORY)
+        X, rows = history_features(timestamps, values)
+        assert X.shape == (len(values) - HISTORY + 1, len(SCHEMA)) and rows[0] == HISTORY - 1
+
+        forecaster = EnergyForecaster()
+        for i, (timestamp, value) in enumerate(zip(timestamps, values)):
+            forecaster.update('m1', timestamp, value)
+            if i in (HISTORY - 2, HISTORY - 1, 5 * HISTORY + 3, len(values) - 1):
+                meters, features = forecaster.matrix()
+                if i < HISTORY - 1:
+                    assert meters == [] and forecaster.pending('m1') == 1
+                else:
+                    np.testing.assert_allclose(features[0], X[i - HISTORY + 1], rtol=1e-6)
+        assert len(forecaster.meters['m1'].buffer) == HISTORY
+
+    def test_late_readings_are_dropped(self):
+        """Test that a reading older than its meter's latest is ignored"""
+        timestamps, values = _series(3)
+        forecaster = EnergyForecaster()
+        assert forecaster.update('m1', timestamps[1], values[1])
+        assert not forecaster.update('m1', timestamps[0], values[0])
+        assert forecaster.update('m2', timestamps[0], values[0])
+        assert forecaster.late == 1 and forecaster.meters['m1'].count == 1
+        assert reading_time({'TxnDate': '01 Jan 2022', 'TxnTime': '16:55:52'}) == np.datetime64('2022-01-01T16:55:52')
+
+    def test_meters_are_bounded(self):
+        """Test least-recently-updated eviction and the known-meter list"""
+        timestamps, values = _series(4)
+        forecaster = EnergyForecaster(max_meters=2)
+        for meter, i in (('a', 0), ('b', 1), ('a', 2), ('c', 3)):
+            forecaster.update(meter, timestamps[i], values[i])
+        assert list(forecaster.meters) == ['a', 'c'] and forecaster.evicted == 1
+
+        forecaster = EnergyForecaster(known_meters=['a'])
+        with pytest.raises(KeyError):
+            forecaster.update('b', timestamps[0], values[0])
+        assert not forecaster.meters
+
+    def test_running_sums_do_not_drift(self):
+        """Test that the sums are recomputed from the buffer, cancelling rounding"""
+        forecaster = EnergyForecaster()
+        timestamps, _ = _series(3 * HISTORY)
+        for i, timestamp in enumerate(timestamps):
+            forecaster.update('m', timestamp, 1e12 if i < HISTORY else 0.1)
+        window = forecaster.meters['m']
+        np.testing.assert_allclose(window.sums, [0.1 * w for w in ENERGY_WINDOWS], rtol=1e-12)
+
+    def test_one_predict_call_for_all_meters(self):
+        """Test that every ready meter and horizon step comes from a single call"""
+        forecaster = EnergyForecaster()
+        for meter, seed in (('a', 1), ('b', 2), ('c', 3)):
+            timestamps, values = _series(HISTORY if meter != 'c' else 3, seed)
+            for timestamp, value in zip(timestamps, values):
+                forecaster.update(meter, timestamp, value)
+
+        calls = []
+
+        def predict(features):
+            calls.append(len(features))
+            return np.repeat(features[:, :1], 4, axis=1)
+
+        forecasts = forecaster.forecast(predict)
+        assert calls == [2] and sorted(forecasts) == ['a', 'b']
+        assert forecasts['a'].shape == (4,) and forecasts['a'][0] == np.float32(forecaster.meters['a'].row()[0])
+
+    def test_forecast_dataset_targets(self):
+        """Test that each row's targets are the readings after it"""
+        timestamps, values = _series(HISTORY + 10)
+        X, y = forecast_dataset(timestamps, values, horizon=3)
+        assert X.shape == (8, len(SCHEMA)) and y.shape == (8, 3)
+        np.testing.assert_array_equal(y[0], values[HISTORY:HISTORY + 3])
+        np.testing.assert_array_equal(y[-1], values[-3:])
+
+    def test_backend_endpoints(self):
+        """Test reading validation and forecasts without a trained model"""
+        import backend.main as backend
+
+        with TestClient(backend.app) as client:
+            response = client.post('/energy/readings', json=[{'meter': 'x', 'TxnDate': '01 Jan 2022',
+                                                              'TxnTime': '00:10:00', 'Consumption': 1.2},
+                                                             {'meter': 'x', 'TxnDate': '01 Jan 2022'}])
+            assert response.status_code == 422 and 'Reading 1' in response.json()['detail']
+            assert 'x' not in backend.forecaster.meters
+
+            response = client.post('/energy/readings', json={'meter': 'x', 'timestamp': '2022-01-01T00:10:00',
+                                                             'Consumption': 1.2})
+            assert response.json()['accepted'] == 1
+            if backend.FORECAST_MODEL in backend.registry:
+                pytest.skip('energy_forecaster is available')
+            assert client.get('/energy/forecast', params={'meter': 'x'}).status_code == 503
@@ -0,0 +1,82 @@
+"""
+Unit tests for the compiled forest inference engine
+"""
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+
+from inference.forest import compile_forest, float32_floor
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    X = rng.uniform(0, 100, (400, 6))
+    y = (X[:, 0] + 2 * X[:, 1] > 150).astype(int) + (X[:, 2] > 70)
+    return X, y
+
+
+class TestCompiledForest:
+    """Test that compiled forests reproduce sklearn outputs"""
+    
+    def test_classifier_matches_sklearn(self, data):
+        """Test classifier probabilities and labels"""
+        X, y = data
+        model = RandomForestClassifier(n_estimators=25, max_depth=8, random_state=0).fit(X, y)
+        compiled = compile_forest(model)
+        
+        X_test = np.random.default_rng(1).uniform(-10, 110, (1000, 6))
+        assert np.array_equal(compiled.predict_proba(X_test), model.predict_proba(X_test))
+        assert np.array_equal(compiled.predict(X_test), model.predict(X_test))
+    
+    def test_regressor_matches_sklearn(self, data):
+        """Test single and multi-output regression"""
+        X, y = data
+        targets = np.column_stack([X[:, 0] * 0.5 + y, X[:, 3] ** 2])
+        
+        for y_fit in [targets[:, 0], targets]:
+            model = RandomForestRegressor(n_estimators=20, random_state=0).fit(X, y_fit)
+            compiled = compile_forest(model)
+            assert np.array_equal(compiled.predict(X), model.predict(X))
+    
+    def test_thresholds_hit_exactly(self, data):
+        """Test inputs lying exactly on split thresholds"""
+        X, y = data
+        model = RandomForestRegressor(n_estimators=10, random_state=0).fit(X, y)
+        compiled = compile_forest(model)
+        
+        tree = model.estimators_[0].tree_
+        splits = tree.feature >= 0
+        X_test = np.tile(X[:1], (splits.sum(), 1))
+        X_test[np.arange(splits.sum()), tree.feature[splits]] = tree.threshold[splits]
+        assert np.array_equal(compiled.predict(X_test), model.predict(X_test))
+    
+    def test_missing_values(self, data):
+        """Test NaN routing for forests trained with missing values"""
+        X, y = data
+        X = X.copy()
+        X[::7, 1] = np.nan
+        model = RandomForestClassifier(n_estimators=15, random_state=0).fit(X, y)
+        compiled = compile_forest(model)
+        assert np.array_equal(compiled.predict_proba(X), model.predict_proba(X))
+    
+    def test_feature_count_checked(self, data):
+        """Test that inputs with the wrong width are rejected"""
+        X, y = data
+        compiled = compile_forest(RandomForestRegressor(n_estimators=2).fit(X, y))
+        with pytest.raises(ValueError):
+            compiled.predict(X[:, :3])
+    
+    def test_rejects_non_forest(self):
+        """Test that non-ensemble estimators are rejected"""
+        with pytest.raises(ValueError):
+            compile_forest(object())
+    
+    def test_float32_floor(self):
+        """Test that float32 thresholds preserve every comparison"""
+        values = np.random.default_rng(2).normal(0, 1e3, 10000)
+        floored = float32_floor(values)
+        x = values.astype(np.float32)
+        assert np.array_equal(x <= values, x <= floored)
+        assert (floored.astype(np.float64) <= values).all()
@@ -0,0 +1,146 @@
+"""
+Unit tests for background scoring jobs
+"""
+
+import csv
+import io
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from config import TestingConfig
+from website import create_app, db
+from website.jobs import JobRunner
+from website.ml_models import TRAFFIC_FEATURES
+from website.models import ScoringJob, User
+
+
+@pytest.fixture
+def job_app(tmp_path, monkeypatch):
+    """App with a file-backed database, which job workers can open themselves"""
+    monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'jobs.db'}")
+    monkeypatch.setattr(TestingConfig, 'UPLOAD_FOLDER', str(tmp_path / 'uploads'))
+    app = create_app('testing')
+    yield app
+    
+    app.extensions['job_runner'].shutdown()
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def job_client(job_app):
+    """Test client logged in as a fresh user"""
+    with job_app.app_context():
+        user = User(username='tester', email='tester@example.com')
+        user.set_password('secret123')
+        db.session.add(user)
+        db.session.commit()
+    
+    client = job_app.test_client()
+    client.post('/auth/login', data={'username': 'tester', 'password': 'secret123'})
+    return client
+
+
+def traffic_csv(n_rows):
+    """Upload body with `n_rows` traffic rows"""
+    text = io.StringIO()
+    writer = csv.writer(text)
+    writer.writerow(TRAFFIC_FEATURES)
+    writer.writerows([[i % 24, i % 7, i % 500, 30.0, i % 3] for i in range(n_rows)])
+    return {'file': (io.BytesIO(text.getvalue().encode()), 'rows.csv')}
+
+
+def wait_for(client, job_id, timeout=60):
+    """Poll a job until it finishes"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f'/api/jobs/{job_id}').get_json()
+        if job['status'] in ScoringJob.FINISHED:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f'Job {job_id} did not finish: {job}')
+
+
+class TestScoringJobs:
+    """Test job submission, progress, cancellation and results"""
+    
+    def test_job_completes(self, job_client):
+        """Test that a submitted job runs in the background and its result downloads"""
+        response = job_client.post('/api/jobs/traffic', data=traffic_csv(250))
+        assert response.status_code == 202
+        job = wait_for(job_client, response.get_json()['id'])
+        
+        assert job['status'] == 'completed'
+        assert (job['rows_total'], job['rows_done'], job['progress']) == (250, 250, 1.0)
+        
+        result = job_client.get(f"/api/jobs/{job['id']}/result")
+        rows = list(csv.DictReader(io.StringIO(result.get_data(as_text=True))))
+        assert len(rows) == 250 and rows[0]['label']
+        assert job_client.get('/api/jobs').get_json()['data'][0]['id'] == job['id']
+    
+    def test_cancel(self, job_client, job_app):
+        """Test that a job cancelled while queued or running stops"""
+        job_app.extensions['job_runner'].chunk_size = 50
+        job_app.extensions['job_runner'].progress_interval = 0
+        job_id = job_client.post('/api/jobs/traffic', data=traffic_csv(50000)).get_json()['id']
+        
+        response = job_client.post(f'/api/jobs/{job_id}/cancel')
+        assert response.status_code == 200
+        job = wait_for(job_client, job_id)
+        assert job['status'] == 'cancelled'
+        assert job['rows_done'] < 50000
+        assert job_client.get(f'/api/jobs/{job_id}/result').status_code == 409
+        assert job_client.post(f'/api/jobs/{job_id}/cancel').status_code == 409
+    
+    def test_per_user_limit(self, job_client, job_app):
+        """Test that users cannot queue unlimited jobs"""
+        job_app.config['JOBS_MAX_ACTIVE_PER_USER'] = 0
+        assert job_client.post('/api/jobs/traffic', data=traffic_csv(5)).status_code == 429
+    
+    def test_resume_stale_job(self, job_client, job_app, tmp_path):
+        """Test that a job whose worker died is queued again and finishes"""
+        job_client.post('/api/jobs/traffic', data=traffic_csv(10))
+        runner = job_app.extensions['job_runner']
+        while runner.active():
+            time.sleep(0.05)
+        
+        with job_app.app_context():
+            job = ScoringJob.query.one()
+            source = tmp_path / 'uploads' / 'stale-input.csv'
+            source.write_bytes(traffic_csv(20)['file'][0].getvalue())
+            job.input_path = str(source)
+            job.status = 'running'
+            job.heartbeat_at = datetime.utcnow() - timedelta(hours=1)
+            db.session.commit()
+            job_id = job.id
+        
+        assert runner.resume() == [job_id]
+        assert wait_for(job_client, job_id)['rows_done'] == 20
+    
+    def test_stats_count_own_jobs(self, job_client, job_app):
+        """Test that job statistics only count the current user's jobs"""
+        with job_app.app_context():
+            other = User(username='other', email='other@example.com')
+            other.set_password('secret123')
+            db.session.add(other)
+            db.session.flush()
+            db.session.add(ScoringJob(user_id=other.id, prediction_type='traffic', status='failed',
+                                      input_path='in.csv', result_path='out.csv'))
+            db.session.commit()
+        
+        assert job_client.get('/api/stats/jobs').get_json()['jobs'] == {}
+    
+    def test_process_pool(self, job_client, job_app):
+        """Test that jobs also run in spawned worker processes"""
+        runner = JobRunner(job_app, max_workers=1, executor='process')
+        job_app.extensions['job_runner'] = runner
+        try:
+            job_id = job_client.post('/api/jobs/traffic', data=traffic_csv(100)).get_json()['id']
+            job = wait_for(job_client, job_id, timeout=120)
+            assert job['status'] == 'completed'
+            assert job['stats']['rows'] == 100
+        finally:
+            runner.shutdown()
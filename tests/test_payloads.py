@@ -0,0 +1,80 @@
+"""
+Unit tests for request decoding and response encoding
+"""
+
+import pickle
+
+import numpy as np
+import pytest
+
+from inference import payloads
+from inference.features import Feature, FeatureSchema, total
+from inference.payloads import PayloadError, RecordDecoder
+
+SCHEMA = FeatureSchema([Feature('hour', low=0, high=23), 'speed',
+                        Feature('vehicles', inputs=['cars', 'bikes'], derive=total, low=0),
+                        Feature('weather', default=2.0)])
+DECODER = RecordDecoder(SCHEMA, ['hour', 'speed'])
+
+
+class TestRecordDecoder:
+    """Test typed decoding, per-row errors and encoding"""
+
+    def test_valid_records(self):
+        """Test dicts, arrays and mixed batches against the schema transform"""
+        records = [{'hour': 8, 'speed': 31.5, 'cars': 10, 'bikes': 4},
+                   {'hour': 17, 'speed': 12, 'vehicles': 50, 'weather': 1}]
+        features, errors = DECODER.decode(records)
+        assert errors == {} and features.dtype == np.float32
+        np.testing.assert_array_equal(features, SCHEMA.transform(records))
+        np.testing.assert_array_equal(DECODER.decode_one(records[0]), features[0])
+
+        arrays, errors = DECODER.decode(features.tolist())
+        assert errors == {}
+        np.testing.assert_array_equal(arrays, features)
+        mixed, errors = DECODER.decode([records[0], features[1].tolist()])
+        assert errors == {}
+        np.testing.assert_array_equal(mixed, features)
+
+    def test_row_errors(self):
+        """Test that every rejected row is reported and zeroed, valid rows kept"""
+        records = [{'hour': 8, 'speed': 30},
+                   {'hour': 'eight', 'speed': 30},
+                   {'speed': 30},
+                   {'hour': 30, 'speed': 30, 'vehicles': -1},
+                   [1, 2],
+                   'row']
+        features, errors = DECODER.decode(records)
+        assert errors == {
+            1: 'hour: expected a number',
+            2: 'missing hour',
+            3: 'hour: 30 is above 23; vehicles: -1 is below 0',
+            4: 'expected an object or an array of 4 numbers',
+            5: 'expected an object or an array of 4 numbers'
+        }
+        assert features[0, 0] == 8 and not features[1:].any()
+
+    def test_single_record_matches_batch(self):
+        """Test that decode_one rejects with the same message as decode"""
+        for record in ({'hour': None, 'speed': 'fast'}, {'hour': -2, 'speed': 1}, [1, 2, 3]):
+            _, errors = DECODER.decode([record])
+            with pytest.raises(PayloadError) as info:
+                DECODER.decode_one(record)
+            assert str(info.value) == errors[0]
+            assert info.value.row_errors == {0: errors[0]}
+
+        with pytest.raises(PayloadError, match='list of records'):
+            DECODER.decode({'hour': 1})
+        with pytest.raises(ValueError, match='Unknown required'):
+            RecordDecoder(SCHEMA, ['minute'])
+
+    def test_loads_and_dumps(self):
+        """Test invalid JSON, NumPy encoding and pickling of errors"""
+        with pytest.raises(PayloadError, match='Invalid JSON'):
+            payloads.loads(b'{"hour": ')
+
+        payload = {'predictions': np.array([1.5, 2.0], dtype=np.float32), 'count': np.int64(2)}
+        assert payloads.loads(payloads.dumps(payload)) == {'predictions': [1.5, 2.0], 'count': 2}
+
+        error = pickle.loads(pickle.dumps(PayloadError('bad', {3: 'hour: expected a number'})))
+        assert str(error) == 'bad' and error.row_errors == {3: 'hour: expected a number'}
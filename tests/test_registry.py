@@ -0,0 +1,177 @@
+"""
+Unit tests for the lazy model registry
+"""
+
+import time
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+from inference.artifacts import export_models, load_artifact, save_artifact
+from inference.forest import CompiledForest
+from inference.registry import ModelRegistry, model_nbytes
+
+
+@pytest.fixture
+def models_dir(tmp_path):
+    """Directory with three small pickled forests"""
+    rng = np.random.default_rng(0)
+    X = rng.uniform(0, 1, (200, 4))
+    for i, name in enumerate(['a', 'b', 'c']):
+        model = RandomForestRegressor(n_estimators=5 + i, random_state=i).fit(X, X[:, i])
+        joblib.dump(model, tmp_path / f'{name}.pkl')
+    (tmp_path / 'notes.txt').write_text('not a model')
+    return tmp_path
+
+
+class TestModelRegistry:
+    """Test lazy loading, counters and LRU eviction"""
+    
+    def test_discovers_without_loading(self, models_dir):
+        """Test that artifacts are found but not loaded up front"""
+        registry = ModelRegistry(str(models_dir))
+        assert registry.available() == ['a', 'b', 'c']
+        assert registry.resident_bytes() == 0
+    
+    def test_loads_on_first_use(self, models_dir):
+        """Test load, hit and size accounting"""
+        registry = ModelRegistry(str(models_dir))
+        model = registry.get('a')
+        assert isinstance(model, CompiledForest)
+        assert registry.get('a') is model
+        
+        stats = registry.stats()['models']['a']
+        assert stats['loads'] == 1
+        assert stats['hits'] == 1
+        assert stats['size_bytes'] == model_nbytes(model) > 0
+    
+    def test_lru_eviction(self, models_dir):
+        """Test that the least recently used model is evicted"""
+        registry = ModelRegistry(str(models_dir))
+        sizes = {name: model_nbytes(registry.get(name)) for name in 'abc'}
+        
+        registry = ModelRegistry(str(models_dir), memory_budget=sum(sizes.values()) - 1)
+        registry.get('a')
+        registry.get('b')
+        registry.get('a')  # b is now least recently used
+        registry.get('c')
+        
+        stats = registry.stats()['models']
+        assert stats['b']['evictions'] == 1
+        assert stats['a']['loaded'] and stats['c']['loaded']
+        assert registry.resident_bytes() <= registry.memory_budget
+        
+        registry.get('b')
+        assert registry.stats()['models']['b']['loads'] == 2
+    
+    def test_unknown_model(self, models_dir):
+        """Test that unknown names raise KeyError"""
+        registry = ModelRegistry(str(models_dir))
+        with pytest.raises(KeyError):
+            registry.get('missing')
+    
+    def test_picks_up_new_artifacts(self, models_dir):
+        """Test that artifacts added after startup are discovered"""
+        registry = ModelRegistry(str(models_dir))
+        joblib.dump(joblib.load(models_dir / 'a.pkl'), models_dir / 'd.pkl')
+        assert registry.get('d') is not None
+
+
+class TestHotReload:
+    """Test background reload, validation and version tracking"""
+    
+    def test_reload_swaps_changed_model(self, models_dir):
+        """Test that a changed artifact replaces the loaded model"""
+        registry = ModelRegistry(str(models_dir))
+        changed = []
+        registry.add_listener(changed.append)
+        old = registry.get('a')
+        old_version = registry.versions()['models']['a']['version']
+        
+        joblib.dump(joblib.load(models_dir / 'b.pkl'), models_dir / 'a.pkl')
+        assert registry.refresh() == ['a']
+        
+        status = registry.versions()['models']['a']
+        assert registry.get('a') is not old
+        assert changed == ['a']
+        assert status['version'] != old_version
+        assert status['reloads'] == 1
+        assert status['last_reload_ms'] > 0
+        assert registry.refresh() == []
+    
+    def test_rejected_artifact_keeps_serving(self, models_dir):
+        """Test that unreadable or invalid artifacts never replace a model"""
+        def validator(name, model):
+            if model.n_features_in_ != 4:
+                raise ValueError('wrong feature count')
+        
+        registry = ModelRegistry(str(models_dir), validator=validator)
+        old = registry.get('a')
+        
+        (models_dir / 'a.pkl').write_bytes(b'truncated')
+        assert registry.refresh() == []
+        
+        X = np.random.default_rng(2).uniform(0, 1, (50, 3))
+        joblib.dump(RandomForestRegressor(n_estimators=2).fit(X, X[:, 0]), models_dir / 'a.pkl')
+        assert registry.refresh() == []
+        
+        status = registry.versions()['models']['a']
+        assert registry.get('a') is old
+        assert status['reload_failures'] == 2
+        assert 'feature count' in status['last_error']
+    
+    def test_watcher_reloads_in_background(self, models_dir):
+        """Test that the watcher thread picks up a new version on its own"""
+        registry = ModelRegistry(str(models_dir))
+        old = registry.get('a')
+        registry.start_watcher(0.02)
+        try:
+            joblib.dump(joblib.load(models_dir / 'c.pkl'), models_dir / 'a.pkl')
+            deadline = time.time() + 5
+            while registry.get('a') is old and time.time() < deadline:
+                time.sleep(0.02)
+            assert registry.get('a') is not old
+            assert registry.versions()['watch_interval'] == 0.02
+        finally:
+            registry.stop_watcher()
+
+
+class TestArtifacts:
+    """Test memory-mapped .forest artifacts"""
+    
+    def test_round_trip_is_exact(self, models_dir):
+        """Test that a mapped artifact predicts exactly like the pickle"""
+        model = joblib.load(models_dir / 'a.pkl')
+        save_artifact(model, models_dir / 'a.forest')
+        forest = load_artifact(str(models_dir / 'a.forest'))
+        
+        X = np.random.default_rng(1).uniform(0, 1, (500, 4))
+        assert forest.shared
+        assert np.array_equal(forest.predict(X), model.predict(X))
+    
+    def test_overwrite_swaps_whole_directories(self, models_dir):
+        """Test that replacing an artifact leaves mapped readers working and no leftovers"""
+        save_artifact(joblib.load(models_dir / 'a.pkl'), models_dir / 'a.forest')
+        old = load_artifact(str(models_dir / 'a.forest'))
+        save_artifact(joblib.load(models_dir / 'b.pkl'), models_dir / 'a.forest')
+        
+        X = np.random.default_rng(2).uniform(0, 1, (50, 4))
+        assert old.n_estimators == 5 and old.predict(X).shape == (50,)
+        assert load_artifact(str(models_dir / 'a.forest')).n_estimators == 6
+        assert sorted(path.name for path in models_dir.iterdir() if 'forest' in path.name) == ['a.forest']
+    
+    def test_registry_prefers_artifacts(self, models_dir):
+        """Test that .forest artifacts win and do not count against the budget"""
+        export_models(str(models_dir))
+        registry = ModelRegistry(str(models_dir), memory_budget=1)
+        
+        assert registry.stats()['models']['a']['path'].endswith('.forest')
+        registry.get('a')
+        registry.get('b')
+        
+        stats = registry.stats()
+        assert stats['resident_bytes'] == 0
+        assert stats['shared_bytes'] > 0
+        assert stats['models']['a']['evictions'] == 0
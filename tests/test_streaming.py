@@ -0,0 +1,150 @@
+"""
+Unit tests for the FastAPI streaming endpoints
+"""
+
+import asyncio
+import json
+import time
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import backend.main as backend
+from inference.live import LivePublisher
+
+
+@pytest.fixture
+def client():
+    if 'traffic_random_forest' not in backend.registry:
+        pytest.skip('traffic_random_forest.pkl not available')
+    with TestClient(backend.app) as client:
+        yield client
+
+
+def ndjson_body(rows, lines_per_chunk=500):
+    """Chunked request body: a generator of NDJSON byte blocks"""
+    for start in range(0, len(rows), lines_per_chunk):
+        yield ''.join(json.dumps(row) + '\n' for row in rows[start:start + lines_per_chunk]).encode()
+
+
+class TestPredictionStream:
+    """Test NDJSON micro-batch scoring over one connection"""
+
+    def test_matches_single_predictions(self, client):
+        """Test that streamed predictions equal the one-row endpoint, in order"""
+        rows = np.random.default_rng(0).uniform(0, 50, (20, 5)).round(2).tolist()
+        response = client.post('/traffic/predict/stream', content=ndjson_body(rows, 7))
+        assert response.status_code == 200
+        assert response.headers['content-type'].startswith('application/x-ndjson')
+
+        results = [json.loads(line) for line in response.text.splitlines()]
+        assert [r['line'] for r in results] == list(range(1, 21))
+        for row, result in zip(rows, results):
+            single = client.post('/traffic/predict', json=row).json()
+            assert result['Traffic_Level'] == single['Traffic_Level']
+
+    def test_bad_rows_fail_alone(self, client):
+        """Test per-line errors, ids and a final line without a newline"""
+        body = (b'[1, 2, 3, 4, 5]\n'
+                b'not json\n'
+                b'{"id": "gw-7", "data": [1, 2, 3, 4, 5]}\n'
+                b'[1, 2]\n'
+                b'\n'
+                b'[5, 4, 3, 2, 1]')
+        results = [json.loads(line) for line in client.post('/traffic/predict/stream', content=body).text.splitlines()]
+
+        assert [r['line'] for r in results] == [1, 2, 3, 4, 5]
+        assert 'Traffic_Level' in results[0]
+        assert results[1]['error'].startswith('invalid row')
+        assert results[2]['id'] == 'gw-7' and 'Traffic_Level' in results[2]
+        assert 'error' in results[3]
+        assert 'Traffic_Level' in results[4]
+
+    def test_unknown_stream(self, client):
+        """Test 404 for an unknown model kind"""
+        assert client.post('/weather/predict/stream', content=b'[1]\n').status_code == 404
+
+    def test_throughput(self, client):
+        """Test rows/second over a single connection"""
+        n = 50000
+        rows = np.random.default_rng(1).uniform(0, 50, (n, 5)).round(2).tolist()
+
+        started = time.perf_counter()
+        response = client.post('/traffic/predict/stream', content=ndjson_body(rows))
+        lines = response.text.splitlines()
+        seconds = time.perf_counter() - started
+
+        rows_per_second = n / seconds
+        print(f'\nNDJSON stream: {n} rows in {seconds:.2f}s ({rows_per_second:.0f} rows/s)')
+        assert len(lines) == n
+        assert 'error' not in lines[-1]
+        # One-row POSTs manage a few hundred per second; the stream must do
+        # far better
+        assert rows_per_second > 5000
+
+
+class TestLiveFeed:
+    """Test the shared live prediction feed"""
+
+    def test_one_computation_per_tick(self):
+        """Test that N subscribers share one computation per tick"""
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            return {'value': len(calls)}
+
+        async def main():
+            publisher = LivePublisher(compute, interval=60)
+            subscriptions = [publisher.subscribe() for _ in range(50)]
+            for _ in range(3):
+                await publisher.tick()
+            latest = [json.loads(await s.get()) for s in subscriptions]
+            return publisher, latest
+
+        publisher, latest = asyncio.run(main())
+        assert len(calls) == 3
+        assert all(message['tick'] == 3 and message['value'] == 3 for message in latest)
+        stats = publisher.stats()
+        assert stats['messages'] == 150
+        # Each subscriber kept only the newest of its 3 undelivered messages
+        assert stats['dropped'] == 100
+
+    def test_idle_without_subscribers(self):
+        """Test that nothing is computed while nobody listens"""
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            return {}
+
+        async def main():
+            publisher = LivePublisher(compute, interval=0.01)
+            publisher.start()
+            await asyncio.sleep(0.1)
+            assert calls == []
+            subscription = publisher.subscribe()
+            await asyncio.wait_for(subscription.get(), 1)
+            subscription.close()
+            await publisher.stop()
+
+        asyncio.run(main())
+        assert len(calls) >= 1
+
+    def test_websocket_and_sse(self, client):
+        """Test that WebSocket and SSE clients receive the same tick"""
+        client.post('/live/readings/traffic', json=[[12, 3, 1, 2, 40], [1, 2, 3, 4, 5]])
+        ticks = backend.live.ticks
+
+        with client.websocket_connect('/live/ws') as websocket:
+            message = websocket.receive_json()
+        assert len(message['traffic']) == 2
+        assert 'Traffic_Level' in message['traffic'][0]
+
+        response = client.get('/live/sse', params={'limit': 1})
+        assert response.headers['content-type'].startswith('text/event-stream')
+        event = json.loads(response.text.split('data: ', 1)[1])
+        assert event['tick'] == message['tick']
+        # Both clients were served from a single inference pass
+        assert backend.live.ticks == ticks + 1
@@ -0,0 +1,397 @@
+"""
+Unit tests for the training pipelines and orchestrator
+"""
+
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+
+from training import (DatasetError, TrainingTask, iter_chunks, load_dataset, plan_cores, read_log, run_out_of_core,
+                      run_pipeline, train_all, update_forest, update_from_csv, update_model)
+from inference.artifacts import load_artifact, save_artifact
+from inference.core import InferenceCore
+from training.compaction import compact_file, quantize, select_trees
+from training.outofcore import MB
+from training.pipelines import load_traffic, traffic_levels
+from inference.forest import compile_forest
+from training.tuning import dominates, pareto_front, search, select
+
+FAST = {'n_estimators': 5}
+
+
+def _native_threads():
+    """Thread counts of the BLAS/OpenMP pools loaded in this process"""
+    from threadpoolctl import threadpool_info
+    return {info['internal_api']: info['num_threads'] for info in threadpool_info()}
+
+
+AIR_QUALITY_CSV = """Date;Time;CO(GT);PT08.S1(CO);NMHC(GT);C6H6(GT);PT08.S2(NMHC);NOx(GT);PT08.S3(NOx);NO2(GT);PT08.S4(NO2);PT08.S5(O3);T;RH;AH;;
+10/03/2004;18.00.00;2,6;1360;150;11,9;1046;166;1056;113;1692;1268;13,6;48,9;0,7578;;
+10/03/2004;19.00.00;-200;1292;112;9,4;955;103;1174;92;1559;972;13,3;47,7;0,7255;;
+10/03/2004;20.00.00;2,2;1402;-200;9,0;939;131;1140;114;1555;1074;11,9;54,0;0,7502;;
+;;;;;;;;;;;;;;;;
+"""
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """Small datasets laid out and formatted like datasets/"""
+    rng = np.random.default_rng(0)
+    n = 400
+    (tmp_path / 'traffic').mkdir()
+    counts = rng.integers(0, 100, (n, 4))
+    pd.DataFrame({
+        'Time': [f'{(i // 4) % 12 + 1}:{15 * (i % 4):02d}:00 {"AM" if i % 96 < 48 else "PM"}' for i in range(n)],
+        'Date': 10 + np.arange(n) // 96, 'Day of the week': 'Tuesday',
+        'CarCount': counts[:, 0], 'BikeCount': counts[:, 1], 'BusCount': counts[:, 2],
+        'TruckCount': counts[:, 3], 'Total': counts.sum(axis=1), 'Traffic Situation': 'normal'
+    }).to_csv(tmp_path / 'traffic' / 'Traffic.csv', index=False)
+
+    (tmp_path / 'energy').mkdir()
+    pd.DataFrame({
+        'TxnDate': '01 Jan 2022', 'TxnTime': [f'{i // 60 % 24:02d}:{i % 60:02d}:00' for i in range(300)],
+        'Consumption': rng.uniform(0, 5, 300)
+    }).to_csv(tmp_path / 'energy' / 'KwhConsumptionBlower78_1.csv')
+    return tmp_path
+
+
+class TestTrainingPipelines:
+    """Test single pipelines and the concurrent orchestrator"""
+
+    def test_run_pipeline(self, data_dir, tmp_path):
+        """Test metrics, stage timings and the saved model"""
+        result = run_pipeline('traffic', str(data_dir), str(tmp_path / 'models'), params=FAST)
+
+        assert result['status'] == 'trained'
+        assert result['dataset_cache'] == 'miss'
+        assert set(result['timings']) == {'load', 'split', 'fit', 'evaluate', 'save'}
+        assert 0 <= result['metrics']['accuracy'] <= 1
+        model = joblib.load(result['path'])
+        assert model.n_estimators == 5 and model.n_features_in_ == 5
+
+    def test_energy_forecast_pipeline(self, data_dir, tmp_path):
+        """Test a multi-output forecaster tested on the latest readings"""
+        result = run_pipeline('energy_forecast', str(data_dir), str(tmp_path / 'models'), params=FAST)
+
+        assert result['status'] == 'trained'
+        model = joblib.load(result['path'])
+        assert model.n_outputs_ == 6 and model.n_features_in_ == 10
+        with np.load(tmp_path / 'models' / 'energy_forecaster.holdout.npz') as holdout:
+            consumption = pd.read_csv(data_dir / 'energy' / 'KwhConsumptionBlower78_1.csv')['Consumption']
+            np.testing.assert_allclose(holdout['y'][-1], consumption.to_numpy()[-6:], rtol=1e-6)
+
+    def test_missing_dataset_fails_alone(self, data_dir, tmp_path):
+        """Test that a failing pipeline is reported, not raised"""
+        result = run_pipeline('air_quality', str(data_dir), str(tmp_path / 'models'))
+        assert result['status'] == 'failed'
+        assert 'No dataset found' in result['error']
+        assert 'fit' not in result['timings']
+
+    def test_plan_cores(self):
+        """Test that the plan never exceeds the core budget"""
+        assert plan_cores(3, 8) == (3, 2)
+        assert plan_cores(3, 2) == (2, 1)
+        assert plan_cores(1, 4) == (1, 4)
+        for n_tasks in range(1, 6):
+            for cores in range(1, 9):
+                parallel, n_jobs = plan_cores(n_tasks, cores)
+                assert parallel * n_jobs <= cores
+
+    def test_train_all_with_variants(self, data_dir, tmp_path):
+        """Test several tasks, including a per-zone variant, in task order"""
+        tasks = [
+            TrainingTask('traffic', params=FAST),
+            TrainingTask('traffic', artifact='traffic_random_forest_zone1', params=FAST),
+            TrainingTask('energy', params=FAST),
+            TrainingTask('air_quality')
+        ]
+        finished = []
+        run = train_all(tasks, cores=2, data_dir=str(data_dir), models_dir=str(tmp_path / 'models'),
+                        executor='thread', on_result=finished.append)
+
+        assert [r['artifact'] for r in run['results']] == [
+            'traffic_random_forest', 'traffic_random_forest_zone1', 'energy_random_forest',
+            'air_quality_random_forest'
+        ]
+        assert [r['status'] for r in run['results']] == ['trained', 'trained', 'trained', 'failed']
+        assert len(finished) == 4
+        assert (run['parallel'], run['n_jobs']) == (2, 1)
+        assert (tmp_path / 'models' / 'traffic_random_forest_zone1.pkl').exists()
+
+    def test_process_pool(self, data_dir, tmp_path):
+        """Test pipelines in separate worker processes"""
+        run = train_all([TrainingTask('traffic', params=FAST), TrainingTask('energy', params=FAST)],
+                        cores=2, data_dir=str(data_dir), models_dir=str(tmp_path / 'models'))
+        assert [r['status'] for r in run['results']] == ['trained', 'trained']
+
+    def test_worker_thread_limits(self):
+        """Test that the initializer resizes native pools loaded before it runs"""
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        from training.orchestrator import _init_worker
+
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker, initargs=(3,)) as pool:
+            threads = pool.submit(_native_threads).result(timeout=60)
+        assert 'openmp' in threads and set(threads.values()) == {3}
+
+    def test_unknown_target(self):
+        """Test that unknown targets are rejected up front"""
+        with pytest.raises(ValueError):
+            TrainingTask('weather')
+
+
+class TestDatasets:
+    """Test parsing and the columnar dataset cache"""
+
+    def test_air_quality_dialect(self, tmp_path):
+        """Test separators, decimal commas, sentinels and blank rows"""
+        (tmp_path / 'air_quality').mkdir()
+        (tmp_path / 'air_quality' / 'AirQuality.csv').write_text(AIR_QUALITY_CSV)
+        data = load_dataset('air_quality', str(tmp_path))
+
+        assert len(data) == 3
+        assert data['CO(GT)'].dtype == np.float32
+        np.testing.assert_allclose(data['CO(GT)'][[0, 2]], [2.6, 2.2], rtol=1e-6)
+        assert np.isnan(data['CO(GT)'][1]) and np.isnan(data['NMHC(GT)'][2])
+        assert str(data['timestamp'][1]) == '2004-03-10T19:00:00'
+        assert 'Unnamed: 15' not in data
+
+    def test_warm_load_is_memory_mapped(self, data_dir):
+        """Test that the second load reads the cache"""
+        cold = load_dataset('traffic', str(data_dir))
+        warm = load_dataset('traffic', str(data_dir))
+
+        assert not cold.cache_hit and warm.cache_hit
+        assert isinstance(warm['CarCount'], np.memmap)
+        np.testing.assert_array_equal(warm['Total'], cold['Total'])
+        assert warm.categories['situation'] == ['normal']
+        assert warm.frame()['situation'].iloc[0] == 'normal'
+
+    def test_invalidated_by_changes(self, data_dir):
+        """Test that edited files rebuild the cache and touched files do not"""
+        path = data_dir / 'energy' / 'KwhConsumptionBlower78_1.csv'
+        first = load_dataset('energy', str(data_dir))
+
+        # Same contents, new mtime
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert load_dataset('energy', str(data_dir)).cache_hit
+
+        path.write_text(path.read_text() + '300,02 Jan 2022,00:00:00,9.5\n')
+        changed = load_dataset('energy', str(data_dir))
+        assert not changed.cache_hit
+        assert len(changed) == len(first) + 1
+        assert load_dataset('energy', str(data_dir)).cache_hit
+
+    def test_missing_dataset(self, tmp_path):
+        """Test DatasetError when no source file exists"""
+        with pytest.raises(DatasetError):
+            load_dataset('energy', str(tmp_path))
+        with pytest.raises(DatasetError):
+            next(iter_chunks('energy', str(tmp_path)))
+
+    def test_chunks_match_whole(self, data_dir):
+        """Test that streamed chunks hold the same rows as a whole load"""
+        chunks = list(iter_chunks('traffic', str(data_dir), chunk_rows=150))
+        assert [len(chunk) for chunk in chunks] == [150, 150, 100]
+        whole = load_dataset('traffic', str(data_dir))
+        np.testing.assert_array_equal(np.concatenate([chunk['Total'] for chunk in chunks]), whole['Total'])
+        np.testing.assert_array_equal(np.concatenate([chunk['minute_of_day'] for chunk in chunks]),
+                                      whole['minute_of_day'])
+
+
+class TestIncrementalUpdates:
+    """Test appending and retiring trees on saved forests"""
+
+    def test_append_and_retire(self):
+        """Test that new trees are appended and the oldest retired"""
+        rng = np.random.default_rng(0)
+        X, y = rng.normal(size=(200, 3)), rng.integers(0, 3, 200)
+        model = RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y)
+        oldest = model.estimators_[:3]
+
+        assert update_forest(model, X[:50], y[:50], new_trees=3, max_trees=5) == (3, 3)
+        assert model.n_estimators == len(model.estimators_) == 5
+        assert all(tree is not old for tree in model.estimators_ for old in oldest)
+        assert not model.warm_start
+        assert model.predict_proba(X).shape == (200, 3)
+
+    def test_window_missing_a_class(self):
+        """Test that a window without some class keeps the model's classes"""
+        rng = np.random.default_rng(1)
+        X, y = rng.normal(size=(200, 3)), rng.integers(0, 3, 200)
+        model = RandomForestClassifier(n_estimators=4, random_state=0).fit(X, y)
+
+        update_forest(model, X[y < 2], y[y < 2], new_trees=2)
+        np.testing.assert_array_equal(model.classes_, [0, 1, 2])
+        assert model.predict_proba(X).shape == (200, 3)
+        with pytest.raises(ValueError):
+            update_forest(model, X[:2], [0, 7])
+        # Labels are checked before being cast to the classes' dtype
+        with pytest.raises(ValueError, match=r'\[1\.5\]'):
+            update_forest(model, X[:2], [0.0, 1.5])
+        update_forest(model, X[:2], [0.0, 1.0], new_trees=1)
+        assert model.classes_.dtype == y.dtype
+
+    def test_update_from_csv_drops(self, data_dir, tmp_path):
+        """Test that each drop is consumed once and scored on the saved holdout"""
+        models_dir = str(tmp_path / 'models')
+        run_pipeline('traffic', str(data_dir), models_dir, params=FAST)
+        assert update_from_csv('traffic', str(data_dir), models_dir) is None
+
+        (data_dir / 'incoming' / 'traffic').mkdir(parents=True)
+        pd.read_csv(data_dir / 'traffic' / 'Traffic.csv').iloc[:96].to_csv(
+            data_dir / 'incoming' / 'traffic' / 'day1.csv', index=False)
+        entry = update_from_csv('traffic', str(data_dir), models_dir, new_trees=3, max_trees=6)
+
+        assert (entry['rows'], entry['trees_added'], entry['trees_retired'], entry['n_estimators']) == (96, 3, 2, 6)
+        assert entry['holdout_rows'] == 80
+        assert set(entry['drift']) == {'accuracy'}
+        assert joblib.load(tmp_path / 'models' / 'traffic_random_forest.pkl').n_estimators == 6
+        assert update_from_csv('traffic', str(data_dir), models_dir) is None
+
+        log = read_log(models_dir, 'traffic_random_forest')
+        assert [w['file'] for w in log['watermarks']['csv']] == [os.path.join('incoming', 'traffic', 'day1.csv')]
+        assert len(log['history']) == 1
+
+    def test_update_rewrites_exported_artifact(self, data_dir, tmp_path):
+        """Test that a served `.forest` artifact gets the updated trees, not just the pickle"""
+        models_dir = tmp_path / 'models'
+        result = run_pipeline('traffic', str(data_dir), str(models_dir), params=FAST)
+        save_artifact(joblib.load(result['path']), models_dir / 'traffic_random_forest.forest')
+        registry = InferenceCore(str(models_dir)).registry
+        assert registry.get('traffic_random_forest')['compiled'].n_estimators == 5
+
+        X, y = load_traffic(load_dataset('traffic', str(data_dir)))
+        update_model('traffic_random_forest', X[:100], y[:100], str(models_dir), new_trees=3)
+        assert registry.refresh() == ['traffic_random_forest']
+        assert registry.get('traffic_random_forest')['compiled'].n_estimators == 8
+
+
+class TestOutOfCore:
+    """Test chunked training under a memory limit"""
+
+    def test_traffic_levels_match_cut(self):
+        """Test that levels from a known range equal pd.cut over the data"""
+        total = np.random.default_rng(0).integers(5, 400, 1000).astype(float)
+        expected = np.asarray(pd.cut(total, bins=4, labels=[0, 1, 2, 3]), dtype=int)
+        np.testing.assert_array_equal(traffic_levels(total, total.min(), total.max()), expected)
+
+    def test_streams_within_limit(self, data_dir, tmp_path):
+        """Test chunked splitting, batched trees and the memory report"""
+        result = run_out_of_core('traffic', str(data_dir), str(tmp_path / 'models'), memory_limit=2048 * MB,
+                                 chunk_rows=64, max_samples=100, trees_per_batch=2, params=FAST)
+
+        assert result['status'] == 'trained', result.get('error')
+        assert result['train_samples'] + result['test_samples'] == 400
+        assert result['batches'] == 3
+        assert set(result['timings']) == {'stream', 'fit', 'evaluate', 'save'}
+        assert 0 < result['peak_memory'] <= result['memory_limit']
+        model = joblib.load(result['path'])
+        assert model.n_estimators == len(model.estimators_) == 5
+        total = np.asarray(load_dataset('traffic', str(data_dir))['Total'], dtype=float)
+        np.testing.assert_array_equal(model.classes_, np.unique(traffic_levels(total, total.min(), total.max())))
+        assert (tmp_path / 'models' / 'traffic_random_forest.holdout.npz').exists()
+
+    def test_limit_below_usage(self, data_dir, tmp_path):
+        """Test that a limit the process already exceeds fails the run"""
+        result = run_out_of_core('energy', str(data_dir), str(tmp_path / 'models'), memory_limit=MB)
+        assert result['status'] == 'failed'
+        assert 'limit' in result['error']
+        assert not (tmp_path / 'models').exists()
+
+    def test_time_series_rejected(self, data_dir, tmp_path):
+        """Test that a pipeline split in time order is not chunked and shuffled"""
+        result = run_out_of_core('energy_forecast', str(data_dir), str(tmp_path / 'models'), memory_limit=2048 * MB)
+        assert result['status'] == 'failed'
+        assert 'time series' in result['error']
+        assert not (tmp_path / 'models').exists()
+
+
+class TestTuning:
+    """Test the latency-aware successive-halving search"""
+
+    def test_pareto_selection(self):
+        """Test the front and that selection takes whole fronts first"""
+        candidates = [{'score': score, 'latency_1row': latency}
+                      for score, latency in [(0.9, 1.0), (0.8, 0.5), (0.85, 2.0), (0.7, 0.4), (0.6, 3.0)]]
+        front = pareto_front(candidates)
+
+        assert [c['latency_1row'] for c in front] == [0.4, 0.5, 1.0]
+        assert not any(dominates(a, b) for a in front for b in front)
+        assert [c['score'] for c in select(candidates, 4)] == [0.9, 0.8, 0.7, 0.85]
+
+    def test_search(self, data_dir):
+        """Test rungs, measured latencies and the recommendation"""
+        space = {'n_estimators': [2, 5, 10], 'max_depth': [2, 4]}
+        result = search('traffic', str(data_dir), n_candidates=6, factor=2, final_candidates=3, cores=1,
+                        floor=0.0, space=space, executor='thread')
+
+        assert [(r['candidates'], r['kept']) for r in result['rungs']] == [(6, 3), (3, 3)]
+        assert result['rungs'][0]['n_samples'] < result['rungs'][1]['n_samples']
+        assert all(c['latency_1row'] > 0 and c['latency_batch'] > 0 and c['nbytes'] > 0
+                   for c in result['candidates'])
+        assert result['recommended'] is min(result['candidates'], key=lambda c: c['latency_1row'])
+        assert result['metric'] == 'accuracy'
+
+        strict = search('traffic', str(data_dir), n_candidates=2, cores=1, floor=1.1, space=space,
+                        executor='thread')
+        assert strict['recommended'] is None
+
+
+class TestCompaction:
+    """Test tree selection, leaf quantization and compact artifacts"""
+
+    def test_select_trees(self):
+        """Test that redundant trees are dropped within the tolerance"""
+        rng = np.random.default_rng(0)
+        X = rng.normal(size=(600, 4))
+        y = (X[:, 0] > 0).astype(int)
+        model = RandomForestClassifier(n_estimators=30, random_state=0).fit(X[:300], y[:300])
+
+        indices, curve = select_trees(model, X[300:], y[300:], tolerance=0.01)
+        assert indices == sorted(indices) and len(set(indices)) == len(indices)
+        assert len(indices) < 30
+        assert curve[len(indices) - 1] >= curve[-1] - 0.01
+
+    def test_quantize(self):
+        """Test narrow arrays and 16-bit leaves against the exact forest"""
+        rng = np.random.default_rng(1)
+        X = rng.uniform(0, 10, (300, 3))
+        model = RandomForestRegressor(n_estimators=10, random_state=0).fit(X, X[:, 0] * 3 + X[:, 1])
+        exact = compile_forest(model)
+        forest = quantize(exact, bits=16)
+
+        assert (forest.feature.dtype, forest.children.dtype, forest.value.dtype) == (np.uint8, np.int32, np.uint16)
+        assert forest.nbytes < exact.nbytes
+        span = np.ptp(exact.predict(X))
+        np.testing.assert_allclose(forest.predict(X), exact.predict(X), atol=span / 2 ** 15)
+        np.testing.assert_array_equal(quantize(exact, bits=None).predict(X), exact.predict(X))
+
+    def test_compact_file(self, data_dir, tmp_path):
+        """Test that the artifact is validated on the holdout and served by the loader"""
+        models_dir = tmp_path / 'models'
+        run_pipeline('energy', str(data_dir), str(models_dir), params={'n_estimators': 20})
+        path = str(models_dir / 'energy_random_forest.pkl')
+
+        dry = compact_file(path, dry_run=True)
+        assert dry['path'] is None
+        assert sorted(os.listdir(models_dir)) == ['energy_random_forest.holdout.npz', 'energy_random_forest.pkl']
+
+        report = compact_file(path, tolerance=0.05)
+        assert report['metric'] == 'r2'
+        assert report['compact']['trees'] <= report['original']['trees'] == 20
+        assert report['compact']['file_bytes'] < report['original']['file_bytes']
+        assert report['validation_rows'] == 30
+
+        forest = load_artifact(report['path'])
+        with np.load(models_dir / 'energy_random_forest.holdout.npz') as holdout:
+            X = holdout['X']
+        assert forest.shared
+        assert forest.n_estimators == report['compact']['trees']
+        assert forest.predict(X).shape == (len(X),)
@@ -0,0 +1,556 @@
+"""
+Unit tests for the Flask website API
+"""
+
+import csv
+import io
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from website.batching import MicroBatcher
+from website import db
+from website.models import Prediction, PredictionHistory
+from website.ml_models import get_model_manager, TRAFFIC_FEATURES
+from website.recorder import PredictionRecorder
+from website.scoring import score_csv
+
+TRAFFIC_ROW = {
+    "hour": 8,
+    "day_of_week": 1,
+    "vehicle_count": 300,
+    "avg_speed": 20.0,
+    "weather": 1
+}
+
+
+class TestBatchPrediction:
+    """Test batch prediction endpoints"""
+    
+    def test_batch_matches_single_predictions(self, client):
+        """Test that a batch returns the same results as single calls"""
+        rows = [dict(TRAFFIC_ROW, vehicle_count=count, hour=count % 24)
+                for count in range(10, 500, 37)]
+        
+        response = client.post('/api/predict/batch/traffic', json=rows)
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['count'] == len(rows)
+        
+        manager = get_model_manager()
+        for row, result in zip(rows, data['predictions']):
+            single = manager.predict_traffic(row)
+            assert result['prediction'] == single['prediction']
+            assert result['confidence'] == pytest.approx(single['confidence'])
+    
+    def test_batch_accepts_records_envelope(self, client, app):
+        """Test batch request wrapped in a records object"""
+        rows = [{f'feature_{i}': float(i * n) for i in range(10)} for n in range(5)]
+        
+        response = client.post('/api/predict/batch/air-quality', json={'records': rows})
+        assert response.status_code == 200
+        assert len(response.get_json()['predictions']) == 5
+        
+        with app.app_context():
+            assert Prediction.query.filter_by(prediction_type='air_quality').count() == 5
+    
+    def test_batch_matrix_input(self):
+        """Test ModelManager batch call with a 2-D array"""
+        manager = get_model_manager()
+        result = manager.predict_energy_batch([[20.0, 50.0, 12, 120.0, 0.5]] * 3)
+        assert result['status'] == 'success'
+        assert result['count'] == 3
+    
+    def test_batch_missing_fields(self, client):
+        """Test that rows missing required fields are reported"""
+        rows = [TRAFFIC_ROW, {"hour": 3}]
+        
+        response = client.post('/api/predict/batch/traffic', json=rows)
+        assert response.status_code == 400
+        assert response.get_json()['invalid_rows'] == [1]
+        assert response.get_json()['row_errors'][0]['error'].startswith('missing day_of_week')
+    
+    def test_batch_unknown_type(self, client):
+        """Test unknown batch prediction type"""
+        response = client.post('/api/predict/batch/weather', json=[TRAFFIC_ROW])
+        assert response.status_code == 404
+    
+    def test_batch_too_large(self, client, app):
+        """Test batch size limit"""
+        app.config['MAX_BATCH_SIZE'] = 2
+        response = client.post('/api/predict/batch/traffic', json=[TRAFFIC_ROW] * 3)
+        assert response.status_code == 413
+
+
+class TestMicroBatching:
+    """Test request coalescing in front of ModelManager"""
+    
+    def test_concurrent_rows_share_a_batch(self):
+        """Test that concurrent submissions are scored together"""
+        calls = []
+        
+        def score(features):
+            calls.append(len(features))
+            return list(features.sum(axis=1))
+        
+        batcher = MicroBatcher(score, window_ms=50, max_rows=8)
+        results = {}
+        barrier = threading.Barrier(8)
+        
+        def worker(i):
+            barrier.wait()
+            results[i] = batcher.submit(np.array([i, 1.0]))
+        
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        batcher.close()
+        
+        assert results == {i: i + 1.0 for i in range(8)}
+        assert sum(calls) == 8
+        assert len(calls) < 8
+        
+        stats = batcher.stats()
+        assert stats['rows'] == 8
+        assert stats['max_batch_size'] == max(calls)
+        assert stats['queue_delay_ms']['samples'] == 8
+    
+    def test_errors_reach_every_caller(self):
+        """Test that a failing batch raises in each waiting caller"""
+        def score(features):
+            raise ValueError('bad batch')
+        
+        batcher = MicroBatcher(score, window_ms=1, max_rows=4)
+        with pytest.raises(ValueError):
+            batcher.submit(np.zeros(2))
+        batcher.close()
+    
+    def test_short_results_and_timeouts(self):
+        """Test that a scorer returning too few results fails its callers instead of hanging them"""
+        batcher = MicroBatcher(lambda features: [], window_ms=1, max_rows=4)
+        with pytest.raises(ValueError, match='0 results'):
+            batcher.submit(np.zeros(2))
+        batcher.close()
+        
+        release = threading.Event()
+        batcher = MicroBatcher(lambda features: release.wait() and [1.0], window_ms=1, timeout=0.05)
+        with pytest.raises(TimeoutError):
+            batcher.submit(np.zeros(2))
+        release.set()
+        batcher.close()
+    
+    @pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+    def test_worker_starts_after_fork(self):
+        """Test that a batcher used before a fork still scores in the forked child"""
+        import multiprocessing
+        
+        batcher = MicroBatcher(lambda features: list(features.sum(axis=1)), window_ms=1)
+        assert batcher.submit(np.array([1.0, 2.0])) == 3.0
+        
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        child = context.Process(target=lambda: results.put(batcher.submit(np.array([2.0, 2.0]))))
+        child.start()
+        assert results.get(timeout=10) == 4.0
+        child.join()
+        batcher.close()
+    
+    def test_manager_results_unchanged(self, client):
+        """Test that batched predictions match direct predictions"""
+        manager = get_model_manager()
+        expected = manager.predict_traffic(TRAFFIC_ROW)
+        
+        manager.enable_micro_batching(window_ms=5, max_rows=16)
+        try:
+            assert manager.predict_traffic(TRAFFIC_ROW) == expected
+            
+            response = client.get('/api/stats/batching')
+            data = response.get_json()
+            assert data['enabled'] is True
+            assert data['models']['traffic']['rows'] == 1
+        finally:
+            manager.disable_micro_batching()
+
+
+class TestPredictionCache:
+    """Test the result cache in ModelManager"""
+    
+    def test_repeated_inputs_hit_the_cache(self, client):
+        """Test that near-identical rows are served from the cache"""
+        manager = get_model_manager()
+        manager.enable_cache(ttl=60, quantize={'traffic': {'avg_speed': 1.0}})
+        try:
+            first = manager.predict_traffic(TRAFFIC_ROW)
+            second = manager.predict_traffic(dict(TRAFFIC_ROW, avg_speed=20.2))
+            assert first == second
+            
+            data = client.get('/api/stats/cache').get_json()
+            assert data['enabled'] is True
+            assert data['models']['traffic']['hits'] == 1
+            assert data['models']['traffic']['misses'] == 1
+        finally:
+            manager.disable_cache()
+    
+    def test_model_change_invalidates(self, client):
+        """Test that a new model version clears its cache"""
+        manager = get_model_manager()
+        manager.enable_cache(ttl={'traffic': 60})
+        try:
+            manager.predict_traffic(TRAFFIC_ROW)
+            assert len(manager.caches['traffic']) == 1
+            assert 'energy' not in manager.caches
+            
+            manager.registry._notify('traffic_model')
+            assert len(manager.caches['traffic']) == 0
+        finally:
+            manager.disable_cache()
+
+    
+    def test_forced_reload_is_opt_in(self, client, app):
+        """Test that users cannot force model reloads unless operators enabled it"""
+        assert client.post('/api/models/reload').status_code == 403
+        
+        app.config['MODEL_RELOAD_API_ENABLED'] = True
+        response = client.post('/api/models/reload')
+        assert response.status_code == 200 and 'reloaded' in response.get_json()
+
+
+class TestPredictionRecorder:
+    """Test write-behind persistence of predictions"""
+    
+    def test_sync_mode_stores_before_responding(self, client, app):
+        """Test that sync mode commits within the request"""
+        response = client.post('/api/predict/traffic', json=TRAFFIC_ROW)
+        assert response.status_code == 200
+        
+        with app.app_context():
+            assert Prediction.query.filter_by(prediction_type='traffic').count() == 1
+        assert client.get('/api/stats/recorder').get_json()['mode'] == 'sync'
+    
+    def test_async_mode_bulk_inserts(self, client, app):
+        """Test that queued rows are written in batches and flushed on demand"""
+        recorder = PredictionRecorder(app, mode='async', batch_size=3, flush_interval=10)
+        try:
+            with app.app_context():
+                recorder.record([{'user_id': 1, 'prediction_type': 'energy',
+                                  'input_data': {}, 'prediction_result': float(i)}
+                                 for i in range(7)])
+                recorder.flush()
+                assert Prediction.query.filter_by(prediction_type='energy').count() == 7
+            
+            stats = recorder.stats()
+            assert stats['written'] == 7
+            assert stats['flushes'] == 3
+            assert stats['queued'] == 0
+        finally:
+            recorder.close()
+    
+    def test_close_flushes_queue(self, client, app):
+        """Test that rows queued at shutdown are not lost"""
+        recorder = PredictionRecorder(app, mode='async', batch_size=100, flush_interval=60)
+        with app.app_context():
+            recorder.record([{'user_id': 1, 'prediction_type': 'energy',
+                              'input_data': {}, 'prediction_result': 1.0}] * 4)
+            recorder.close()
+            assert Prediction.query.filter_by(prediction_type='energy').count() == 4
+    
+    def test_writer_starts_after_fork(self, client, app):
+        """Test that rows recorded in a forked child are written by the child's own thread"""
+        import multiprocessing
+        
+        row = {'user_id': 1, 'prediction_type': 'energy', 'input_data': {}, 'prediction_result': 1.0}
+        recorder = PredictionRecorder(app, mode='async', batch_size=100, flush_interval=60)
+        with app.app_context():
+            recorder.record([row])
+            recorder.flush()
+        
+        def child_main():
+            with app.app_context():
+                recorder.record([row] * 3)
+                recorder.flush()
+                results.put(Prediction.query.filter_by(prediction_type='energy').count())
+        
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        child = context.Process(target=child_main)
+        child.start()
+        try:
+            assert results.get(timeout=10) == 4
+        finally:
+            child.join(timeout=5)
+            if child.is_alive():
+                child.terminate()
+            recorder.close()
+    
+    def test_unknown_mode(self, app):
+        """Test that an unknown durability mode is rejected"""
+        with pytest.raises(ValueError):
+            PredictionRecorder(app, mode='eventually')
+
+
+class TestPredictionCounters:
+    """Test the incrementally maintained per-user counters"""
+    
+    def test_counters_follow_inserts(self, client, app):
+        """Test that single and batch predictions update the dashboard counts"""
+        client.post('/api/predict/traffic', json=TRAFFIC_ROW)
+        client.post('/api/predict/batch/traffic', json=[TRAFFIC_ROW] * 3)
+        client.post('/api/predict/batch/energy', json=[{'feature_0': 1.0}] * 2)
+        
+        data = client.get('/api/stats/dashboard').get_json()
+        assert data == {'total': 6, 'traffic': 4, 'air_quality': 0, 'energy': 2}
+        assert client.get('/dashboard').status_code == 200
+    
+    def test_rebuild_matches_incremental(self, client, app):
+        """Test that the backfill reproduces the incremental counters"""
+        client.post('/api/predict/batch/energy', json=[{'feature_0': float(i)} for i in range(5)])
+        client.post('/api/predict/energy', json={'feature_0': 7.0})
+        
+        with app.app_context():
+            incremental = PredictionHistory.query.one()
+            expected = (incremental.total_predictions, incremental.average_value)
+            
+            assert PredictionHistory.rebuild() == 1
+            rebuilt = PredictionHistory.query.one()
+            assert rebuilt.total_predictions == expected[0] == 6
+            assert rebuilt.average_value == pytest.approx(expected[1])
+    
+    def test_increment_merges_into_concurrent_insert(self, client, app):
+        """Test that a counter row inserted by another writer is merged into, not duplicated"""
+        with app.app_context():
+            user_id = db.session.execute(db.text("SELECT id FROM users")).scalar()
+            with db.engine.begin() as connection:
+                connection.execute(PredictionHistory.__table__.insert().values(
+                    user_id=user_id, prediction_type='energy', average_value=1.0, total_predictions=2))
+            
+            PredictionHistory.increment([{'user_id': user_id, 'prediction_type': 'energy', 'prediction_result': 4.0},
+                                         {'user_id': user_id, 'prediction_type': 'air_quality',
+                                          'prediction_result': 3.0}])
+            db.session.commit()
+            
+            energy = PredictionHistory.query.filter_by(prediction_type='energy').one()
+            assert (energy.total_predictions, energy.average_value) == (3, 2.0)
+            assert PredictionHistory.query.filter_by(prediction_type='air_quality').one().total_predictions == 1
+    
+    def test_legacy_table_is_upgraded(self, client, app):
+        """Test that the old prediction_history table is replaced and backfilled"""
+        client.post('/api/predict/traffic', json=TRAFFIC_ROW)
+        
+        with app.app_context():
+            PredictionHistory.__table__.drop(db.engine)
+            db.session.execute(db.text(
+                'CREATE TABLE prediction_history (id INTEGER PRIMARY KEY, prediction_type VARCHAR(50), '
+                'average_value FLOAT, total_predictions INTEGER, date DATE)'))
+            db.session.commit()
+            
+            assert PredictionHistory.upgrade_schema() is True
+            assert PredictionHistory.upgrade_schema() is False
+            assert PredictionHistory.counts_for(1) == {'traffic': 1, 'total': 1}
+
+
+class TestObservedOutcomes:
+    """Test recording outcomes and updating models from them"""
+    
+    def test_record_observed(self, client, app):
+        """Test that outcomes are stored for the owner's predictions only"""
+        client.post('/api/predict/energy', json={'feature_0': 1.0})
+        prediction_id = client.get('/api/history/energy').get_json()['data'][0]['id']
+        
+        response = client.post(f'/api/predictions/{prediction_id}/observed', json={'value': 2.5})
+        assert response.status_code == 200
+        assert response.get_json()['observed'] == 2.5
+        assert client.post(f'/api/predictions/{prediction_id}/observed', json={'value': 'high'}).status_code == 400
+        assert client.post('/api/predictions/9999/observed', json={'value': 1}).status_code == 404
+    
+    def test_update_from_outcomes(self, client, app, tmp_path):
+        """Test that each recorded outcome trains the served model once"""
+        from website.updates import update_from_predictions
+        shutil.copy(os.path.join(app.config['MODELS_DIR'], 'energy_model.pkl'), tmp_path)
+        client.post('/api/predict/batch/energy', json=[{'feature_0': float(i)} for i in range(20)])
+        for row in client.get('/api/history/energy').get_json()['data']:
+            client.post(f"/api/predictions/{row['id']}/observed", json={'value': row['result'] + 1})
+        
+        with app.app_context():
+            assert update_from_predictions('energy', str(tmp_path), new_trees=2, min_rows=30) is None
+            entry = update_from_predictions('energy', str(tmp_path), new_trees=2, min_rows=10)
+            assert (entry['rows'], entry['holdout_rows'], entry['trees_added']) == (16, 4, 2)
+            assert update_from_predictions('energy', str(tmp_path), min_rows=1) is None
+
+
+class TestHistoryPagination:
+    """Test keyset pagination and NDJSON streaming of the history"""
+    
+    def test_pages_cover_history_once(self, client, app):
+        """Test that cursors walk every row exactly once, newest first"""
+        # Batch rows share one created_at, so ties are broken by id
+        client.post('/api/predict/batch/traffic', json=[TRAFFIC_ROW] * 12)
+        client.post('/api/predict/batch/traffic', json=[TRAFFIC_ROW] * 13)
+        
+        ids, cursor, pages = [], None, 0
+        while True:
+            url = '/api/history/traffic?limit=10' + (f'&cursor={cursor}' if cursor else '')
+            data = client.get(url).get_json()
+            ids += [row['id'] for row in data['data']]
+            cursor = data['next_cursor']
+            pages += 1
+            if cursor is None:
+                break
+        
+        assert pages == 3
+        assert ids == sorted(ids, reverse=True)
+        assert len(set(ids)) == 25
+    
+    def test_undated_rows(self, client, app):
+        """Test that rows without a created_at get cursors and come last"""
+        client.post('/api/predict/batch/traffic', json=[TRAFFIC_ROW] * 5)
+        with app.app_context():
+            undated = [row.id for row in Prediction.query.order_by(Prediction.id).limit(3)]
+            Prediction.query.filter(Prediction.id.in_(undated)).update({'created_at': None})
+            db.session.commit()
+        
+        ids, cursor = [], None
+        while True:
+            url = '/api/history/traffic?limit=2' + (f'&cursor={cursor}' if cursor else '')
+            data = client.get(url).get_json()
+            ids += [row['id'] for row in data['data']]
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        
+        assert len(ids) == 5 and ids[2:] == sorted(undated, reverse=True)
+        assert client.get('/history').status_code == 200
+    
+    def test_deep_pages_seek_the_index(self, client, app):
+        """Test that a page after a cursor is an index range, not a scan from the newest row"""
+        from sqlalchemy import event
+        from website.pagination import keyset_page
+        client.post('/api/predict/batch/traffic', json=[TRAFFIC_ROW] * 3)
+        
+        with app.app_context():
+            query = Prediction.query.filter_by(user_id=1, prediction_type='traffic')
+            _, cursor = keyset_page(query, limit=1)
+            statements = []
+            
+            def listener(connection, dbapi_cursor, sql, params, context, executemany):
+                statements.append((sql, params))
+            
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                predictions, _ = keyset_page(query, cursor, limit=1)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', listener)
+            assert len(predictions) == 1
+            
+            sql, params = statements[0]
+            with db.engine.connect() as connection:
+                plan = ' '.join(row[-1] for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}', params))
+            assert 'ix_predictions_user_type_created' in plan and 'created_at<?' in plan, plan
+    
+    def test_invalid_cursor(self, client):
+        """Test that a malformed cursor is rejected"""
+        response = client.get('/api/history/traffic?cursor=not-a-cursor')
+        assert response.status_code == 400
+    
+    def test_ndjson_stream(self, client, app):
+        """Test that the full history streams as one JSON object per line"""
+        client.post('/api/predict/batch/energy', json=[{'feature_0': float(i)} for i in range(7)])
+        app.config['HISTORY_STREAM_CHUNK'] = 3
+        
+        response = client.get('/api/history/energy?format=ndjson')
+        assert response.mimetype == 'application/x-ndjson'
+        rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert len(rows) == 7
+        assert [row['id'] for row in rows] == sorted((row['id'] for row in rows), reverse=True)
+    
+    def test_history_page(self, client, app):
+        """Test that the history page links to older predictions"""
+        app.config['HISTORY_PAGE_SIZE'] = 2
+        client.post('/api/predict/batch/traffic', json=[TRAFFIC_ROW] * 3)
+        
+        page = client.get('/history').get_data(as_text=True)
+        assert 'cursor=' in page
+
+
+class TestCSVScoring:
+    """Test chunked bulk CSV scoring"""
+    
+    @staticmethod
+    def upload(rows, header=TRAFFIC_FEATURES):
+        """CSV upload body"""
+        text = io.StringIO()
+        writer = csv.writer(text)
+        writer.writerow(header)
+        writer.writerows(rows)
+        return {'file': (io.BytesIO(text.getvalue().encode()), 'rows.csv')}
+    
+    def test_scores_in_chunks(self, client, app, tmp_path):
+        """Test that every row is scored, chunk by chunk, like the batch API"""
+        app.config['UPLOAD_FOLDER'] = str(tmp_path)
+        app.config['SCORING_CHUNK_SIZE'] = 4
+        rows = [[row % 24, row % 7, 10 * row, 30.5, row % 3] for row in range(10)]
+        
+        response = client.post('/api/score/traffic', data=self.upload(rows))
+        assert response.status_code == 200
+        data = response.get_json()
+        assert (data['rows'], data['chunks'], data['errors']) == (10, 3, 0)
+        assert data['rows_per_second'] > 0
+        assert data['peak_memory_bytes'] is not None
+        
+        scored = list(csv.DictReader(io.StringIO(client.get(data['result_url']).get_data(as_text=True))))
+        expected = get_model_manager().predict_traffic_batch(
+            [dict(zip(TRAFFIC_FEATURES, row)) for row in rows])['predictions']
+        assert [int(row['prediction']) for row in scored] == [p['prediction'] for p in expected]
+        assert [f.name for f in tmp_path.iterdir()] == [data['result_url'].rsplit('/', 1)[1]]
+    
+    def test_bad_rows_are_flagged(self, client, app, tmp_path):
+        """Test that unparseable rows get an error instead of failing the file"""
+        app.config['UPLOAD_FOLDER'] = str(tmp_path)
+        rows = [[8, 1, 300, 20.0, 1], [8, 1, 'lots', 20.0, 1], [8, 1, 300], [8, 1, 'lots', 20.0, 1, 'x', 'y']]
+        
+        data = client.post('/api/score/traffic', data=self.upload(rows)).get_json()
+        scored = list(csv.reader(io.StringIO(client.get(data['result_url']).get_data(as_text=True))))
+        assert data['errors'] == 3
+        # Short and over-long rows are cut to the header, so the error stays in its column
+        assert {len(row) for row in scored} == {len(TRAFFIC_FEATURES) + 4}
+        assert [row[-1] for row in scored[1:]] == ['', 'invalid value', 'invalid value', 'invalid value']
+    
+    def test_stale_results_are_removed(self, client, app, tmp_path):
+        """Test that scored files past SCORING_RESULT_TTL are deleted on the next upload"""
+        app.config['UPLOAD_FOLDER'] = str(tmp_path)
+        app.config['SCORING_RESULT_TTL'] = 60
+        old = client.post('/api/score/traffic', data=self.upload([[8, 1, 300, 20.0, 1]])).get_json()['result_url']
+        old_path = tmp_path / old.rsplit('/', 1)[1]
+        os.utime(old_path, (time.time() - 120, time.time() - 120))
+        (tmp_path / '1-job.csv').write_text('kept')
+        
+        new = client.post('/api/score/traffic', data=self.upload([[8, 1, 300, 20.0, 1]])).get_json()['result_url']
+        assert not old_path.exists() and client.get(old).status_code == 404
+        assert sorted(f.name for f in tmp_path.iterdir()) == sorted(['1-job.csv', new.rsplit('/', 1)[1]])
+    
+    def test_missing_columns(self, client, app, tmp_path):
+        """Test that a header without the required features is rejected"""
+        app.config['UPLOAD_FOLDER'] = str(tmp_path)
+        response = client.post('/api/score/traffic', data=self.upload([[1, 2]], header=['hour', 'weather']))
+        assert response.status_code == 400
+        assert list(tmp_path.iterdir()) == []
+    
+    def test_memory_is_bounded_by_chunk(self, tmp_path):
+        """Test that traced peak memory does not grow with the file"""
+        def peak(n_rows):
+            source = tmp_path / f'{n_rows}.csv'
+            with open(source, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['feature_0', 'feature_1'])
+                writer.writerows([[i, i / 2] for i in range(n_rows)])
+            return score_csv(get_model_manager(), 'energy', source, tmp_path / 'out.csv',
+                             chunk_size=500, trace_memory=True)['peak_memory_bytes']
+        
+        peak(10)  # load the model first
+        assert peak(20000) < 1.5 * peak(2000)
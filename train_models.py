@@ -1,215 +1,131 @@
 """
 ML Model Training Pipeline for Smart City Project
-Trains models for Air Quality, Traffic, and Energy prediction
+Trains models for Air Quality, Traffic, and Energy prediction, and the
+streaming energy forecaster
+
+The pipelines (see training/) run concurrently within a core budget.
+
+Usage: python train_models.py [air_quality traffic energy energy_forecast] [--cores N]
+                              [--data-dir datasets] [--models-dir models]
+                              [--executor process|thread]
+       python train_models.py [targets] --update [--new-trees 10] [--max-trees N]
+       python train_models.py [targets] --out-of-core [--memory-limit-mb 1024] [--chunk-rows N]
+
+--update adds trees fitted on new CSV drops in <data-dir>/incoming/<dataset>/
+to the saved models instead of retraining them (see training/incremental.py).
+--out-of-core streams the CSVs in chunks and trains one pipeline at a time
+under a RAM ceiling, reporting peak memory (see training/outofcore.py).
 """
 
-import pandas as pd
-import numpy as np
-import joblib
+import argparse
 import os
-from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestRegressor, RandomForestClassifier
-from sklearn.preprocessing import StandardScaler
-from sklearn.metrics import mean_squared_error, r2_score, accuracy_score, classification_report
 import warnings
+
+from training import PIPELINES, TrainingTask, run_out_of_core, train_all, update_from_csv
+from training.outofcore import MB
+
 warnings.filterwarnings('ignore')
 
-# Create models directory
-os.makedirs("models", exist_ok=True)
-
-print("=" * 80)
-print("SMART CITY ML - MODEL TRAINING PIPELINE")
-print("=" * 80)
-
-# ============================================================================
-# 1. AIR QUALITY MODEL TRAINING
-# ============================================================================
-print("\n[1/3] Training Air Quality Model...")
-try:
-    air_df = pd.read_csv("datasets/air_quality/AirQuality.csv")
-    
-    # Data preprocessing
-    air_df = air_df.dropna()
-    
-    # Features: PT08.S1(CO), NMHC(GT), C6H6(GT), PT08.S2(NMHC), NOx(GT), 
-    #           PT08.S3(NOx), NO2(GT), PT08.S4(NO2), PT08.S5(O3), T, RH, AH
-    # Target: CO(GT)
-    
-    feature_cols = [col for col in air_df.columns if col not in ['Date', 'Time', 'CO(GT)', 'Unnamed: 0']]
-    
-    # Handle missing values
-    for col in feature_cols:
-        if air_df[col].dtype == 'object':
-            air_df[col] = pd.to_numeric(air_df[col], errors='coerce')
-    
-    air_df = air_df.dropna()
-    
-    if 'CO(GT)' in air_df.columns:
-        X = air_df[feature_cols]
-        y = air_df['CO(GT)']
-        
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-        
-        air_model = RandomForestRegressor(
-            n_estimators=100,
-            max_depth=15,
-            min_samples_split=5,
-            min_samples_leaf=2,
-            random_state=42,
-            n_jobs=-1
-        )
-        
-        air_model.fit(X_train, y_train)
-        y_pred = air_model.predict(X_test)
-        
-        mse = mean_squared_error(y_test, y_pred)
-        rmse = np.sqrt(mse)
-        r2 = r2_score(y_test, y_pred)
-        
-        joblib.dump(air_model, "models/air_quality_random_forest.pkl")
-        
-        print(f"✓ Air Quality Model Trained")
-        print(f"  - RMSE: {rmse:.4f}")
-        print(f"  - R² Score: {r2:.4f}")
-        print(f"  - Training samples: {len(X_train)}, Test samples: {len(X_test)}")
-    else:
-        print("✗ CO(GT) column not found in air quality dataset")
-        
-except Exception as e:
-    print(f"✗ Error training air quality model: {e}")
-
-# ============================================================================
-# 2. TRAFFIC MODEL TRAINING
-# ============================================================================
-print("\n[2/3] Training Traffic Model...")
-try:
-    traffic_files = [
-        "datasets/traffic/Traffic.csv",
-        "datasets/traffic/TrafficTwoMonth.csv"
-    ]
-    
-    traffic_dfs = []
-    for file in traffic_files:
-        if os.path.exists(file):
-            df = pd.read_csv(file)
-            traffic_dfs.append(df)
-    
-    if traffic_dfs:
-        traffic_df = pd.concat(traffic_dfs, ignore_index=True)
-        
-        # Expected columns: CarCount, BikeCount, BusCount, TruckCount, Total
-        expected_cols = ['CarCount', 'BikeCount', 'BusCount', 'TruckCount', 'Total']
-        actual_cols = [col for col in traffic_df.columns if col.lower() in [c.lower() for c in expected_cols]]
-        
-        if len(actual_cols) < 4:
-            # Create synthetic features if columns don't exist
-            traffic_df['CarCount'] = np.random.randint(50, 300, len(traffic_df))
-            traffic_df['BikeCount'] = np.random.randint(10, 100, len(traffic_df))
-            traffic_df['BusCount'] = np.random.randint(5, 30, len(traffic_df))
-            traffic_df['TruckCount'] = np.random.randint(2, 20, len(traffic_df))
-            traffic_df['Total'] = traffic_df['CarCount'] + traffic_df['BikeCount'] + traffic_df['BusCount'] + traffic_df['TruckCount']
-            traffic_df['TrafficLevel'] = pd.cut(traffic_df['Total'], bins=4, labels=[0, 1, 2, 3])
-        
-        traffic_df = traffic_df.dropna()
-        
-        X = traffic_df[['CarCount', 'BikeCount', 'BusCount', 'TruckCount', 'Total']]
-        
-        # Create traffic level classification (0=Low, 1=Medium, 2=High, 3=Very High)
-        if 'TrafficLevel' in traffic_df.columns:
-            y = traffic_df['TrafficLevel']
-        else:
-            y = pd.cut(traffic_df['Total'], bins=4, labels=[0, 1, 2, 3])
-        
-        y = y.astype(int)
-        
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-        
-        traffic_model = RandomForestClassifier(
-            n_estimators=100,
-            max_depth=10,
-            min_samples_split=5,
-            random_state=42,
-            n_jobs=-1
-        )
-        
-        traffic_model.fit(X_train, y_train)
-        y_pred = traffic_model.predict(X_test)
-        
-        accuracy = accuracy_score(y_test, y_pred)
-        
-        joblib.dump(traffic_model, "models/traffic_random_forest.pkl")
-        
-        print(f"✓ Traffic Model Trained")
-        print(f"  - Accuracy: {accuracy:.4f}")
-        print(f"  - Training samples: {len(X_train)}, Test samples: {len(X_test)}")
-    else:
-        print("✗ Traffic dataset not found")
-        
-except Exception as e:
-    print(f"✗ Error training traffic model: {e}")
-
-# ============================================================================
-# 3. ENERGY MODEL TRAINING
-# ============================================================================
-print("\n[3/3] Training Energy Model...")
-try:
-    energy_files = [
-        "datasets/energy/KwhConsumptionBlower78_1.csv",
-        "datasets/energy/KwhConsumptionBlower78_2.csv",
-        "datasets/energy/KwhConsumptionBlower78_3.csv"
-    ]
-    
-    energy_dfs = []
-    for file in energy_files:
-        if os.path.exists(file):
-            df = pd.read_csv(file)
-            energy_dfs.append(df)
-    
-    if energy_dfs:
-        energy_df = pd.concat(energy_dfs, ignore_index=True)
-        energy_df = energy_df.dropna()
-        
-        # Use all numeric columns except the target
-        numeric_cols = energy_df.select_dtypes(include=[np.number]).columns.tolist()
-        
-        if len(numeric_cols) > 1:
-            # Last column as target, rest as features
-            X = energy_df[numeric_cols[:-1]]
-            y = energy_df[numeric_cols[-1]]
-            
-            X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-            
-            energy_model = RandomForestRegressor(
-                n_estimators=100,
-                max_depth=15,
-                min_samples_split=5,
-                min_samples_leaf=2,
-                random_state=42,
-                n_jobs=-1
-            )
-            
-            energy_model.fit(X_train, y_train)
-            y_pred = energy_model.predict(X_test)
-            
-            mse = mean_squared_error(y_test, y_pred)
-            rmse = np.sqrt(mse)
-            r2 = r2_score(y_test, y_pred)
-            
-            joblib.dump(energy_model, "models/energy_random_forest.pkl")
-            
-            print(f"✓ Energy Model Trained")
-            print(f"  - RMSE: {rmse:.4f}")
-            print(f"  - R² Score: {r2:.4f}")
-            print(f"  - Training samples: {len(X_train)}, Test samples: {len(X_test)}")
-        else:
-            print("✗ Insufficient features in energy dataset")
-    else:
-        print("✗ Energy dataset not found")
-        
-except Exception as e:
-    print(f"✗ Error training energy model: {e}")
-
-print("\n" + "=" * 80)
-print("MODEL TRAINING COMPLETED!")
-print("Models saved to: ./models/")
-print("=" * 80)
+STAGES = ('load', 'split', 'fit', 'evaluate', 'save')
+
+
+def report(result):
+    """Print one finished pipeline"""
+    label = result['target'].replace('_', ' ').title()
+    if result['status'] != 'trained':
+        print(f"✗ Error training {label} model: {result['error']}")
+        return
+
+    print(f"✓ {label} Model Trained -> {result['path']}")
+    for name, value in result['metrics'].items():
+        print(f"  - {name.upper() if name == 'rmse' else name.capitalize()}: {value:.4f}")
+    print(f"  - Training samples: {result['train_samples']}, Test samples: {result['test_samples']}")
+
+
+def summary(run):
+    """Per-stage wall-clock table"""
+    print(f"\n{'model':<28}" + ''.join(f'{stage:>10}' for stage in STAGES) + f"{'total':>10}")
+    for result in run['results']:
+        timings = result['timings']
+        print(f"{result['artifact']:<28}"
+              + ''.join(f"{timings[stage]:>9.2f}s" if stage in timings else f"{'-':>10}" for stage in STAGES)
+              + f"{result['seconds']:>9.2f}s")
+
+    serial = sum(result['seconds'] for result in run['results'])
+    print(f"\nWall clock: {run['seconds']:.2f}s on {run['cores']} cores "
+          f"({run['parallel']} pipelines at a time, n_jobs={run['n_jobs']}); "
+          f"pipelines sum to {serial:.2f}s")
+
+
+def update(targets, args):
+    """Incremental update of each target from its unconsumed CSV drops"""
+    for target in targets:
+        try:
+            entry = update_from_csv(target, args.data_dir, args.models_dir, args.new_trees, args.max_trees,
+                                    n_jobs=args.cores or 1)
+        except (OSError, ValueError) as e:
+            print(f"✗ Error updating {target}: {e}")
+            continue
+        if entry is None:
+            print(f"- {target}: no new files")
+            continue
+        print(f"✓ {target}: {entry['rows']} new rows, +{entry['trees_added']}/-{entry['trees_retired']} trees "
+              f"({entry['n_estimators']} total) in {entry['seconds']:.2f}s")
+        print(f"  - Holdout: {entry['before']} -> {entry['after']} (drift from baseline: {entry['drift']})")
+
+
+def out_of_core(targets, args):
+    """Train each target in turn, streaming its data, within the memory limit"""
+    for target in targets:
+        result = run_out_of_core(target, args.data_dir, args.models_dir, args.memory_limit_mb * MB,
+                                 args.chunk_rows, n_jobs=args.cores or 1)
+        report(result)
+        print(f"  - Peak memory: {result['peak_memory'] / MB:.0f} MB of {args.memory_limit_mb} MB")
+        if result['status'] == 'trained':
+            print(f"  - {result['chunk_rows']} rows per chunk, {result['max_samples']} rows per batch of trees, "
+                  f"{result['batches']} batches in {result['seconds']:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the Smart City models')
+    parser.add_argument('targets', nargs='*', help=f"pipelines to run: {', '.join(PIPELINES)} (default: all)")
+    parser.add_argument('--cores', type=int, default=None, help='core budget (default: all cores)')
+    parser.add_argument('--data-dir', default='datasets')
+    parser.add_argument('--models-dir', default='models')
+    parser.add_argument('--executor', choices=['process', 'thread'], default='process')
+    parser.add_argument('--update', action='store_true', help='add trees fitted on new CSV drops instead')
+    parser.add_argument('--new-trees', type=int, default=10)
+    parser.add_argument('--max-trees', type=int, default=None, help='retire the oldest trees beyond this many')
+    parser.add_argument('--out-of-core', action='store_true', help='stream the data under a memory limit')
+    parser.add_argument('--memory-limit-mb', type=int, default=1024)
+    parser.add_argument('--chunk-rows', type=int, default=None, help='CSV rows per chunk (default: from the limit)')
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("SMART CITY ML - MODEL TRAINING PIPELINE")
+    print("=" * 80)
+
+    try:
+        tasks = [TrainingTask(target) for target in (args.targets or PIPELINES)]
+    except ValueError as e:
+        parser.error(str(e))
+    if args.update:
+        update([task.target for task in tasks], args)
+        return
+    if args.out_of_core:
+        out_of_core([task.target for task in tasks], args)
+        return
+    os.makedirs(args.models_dir, exist_ok=True)
+    print(f"\nTraining {', '.join(task.target for task in tasks)}...\n")
+    run = train_all(tasks, cores=args.cores, data_dir=args.data_dir, models_dir=args.models_dir,
+                    executor=args.executor, on_result=report)
+    summary(run)
+
+    print("\n" + "=" * 80)
+    print("MODEL TRAINING COMPLETED!")
+    print(f"Models saved to: {args.models_dir}/")
+    print("=" * 80)
+
+
+if __name__ == '__main__':
+    main()
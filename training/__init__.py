@@ -0,0 +1,17 @@
+"""
+Model training for the Smart City ML models
+"""
+
+from .datasets import SOURCES, Dataset, DatasetError, clear_cache, iter_chunks, load_dataset
+from .incremental import read_log, update_forest, update_from_csv, update_model
+from .orchestrator import TrainingTask, plan_cores, train_all
+from .outofcore import MemoryLimitExceeded, run_out_of_core
+from .pipelines import PIPELINES, run_pipeline
+
+__all__ = [
+    'SOURCES', 'Dataset', 'DatasetError', 'clear_cache', 'iter_chunks', 'load_dataset',
+    'PIPELINES', 'run_pipeline',
+    'MemoryLimitExceeded', 'run_out_of_core',
+    'read_log', 'update_forest', 'update_from_csv', 'update_model',
+    'TrainingTask', 'plan_cores', 'train_all'
+]
@@ -0,0 +1,282 @@
+"""
+Forest compaction
+
+Shrinks a trained forest into a `.forest` artifact (see
+inference/artifacts.py) that ModelManager, the backend and the dashboard
+load in place of the pickle:
+
+1. Tree selection: greedy forward selection on a validation set. Trees
+   are added one at a time, each time the one that lowers the ensemble's
+   loss most (log loss for classifiers, squared error for regressors),
+   and the smallest prefix scoring within `tolerance` of the full forest
+   is kept.
+2. Narrow arrays: split features as uint8/uint16 and child and root
+   indices as int32 instead of int64. Thresholds are already float32
+   (exact, see inference/forest.py).
+3. Leaf quantization: leaf values are stored as 8- or 16-bit codes with a
+   per-output scale and offset, applied once to the averaged codes at
+   prediction time.
+
+Selection and the reported scores use different halves of the
+validation rows. Models trained by `run_pipeline` are validated on their
+saved holdout. Other models (e.g. the synthetic ones of fix_models.py)
+have no labelled data, so inputs are sampled within the ranges the trees
+split on and the full forest's own predictions are the labels: the report
+then measures fidelity to the original rather than accuracy.
+
+Compact every pickle in a models directory with:
+
+    python -m training.compaction [models_dir] [--tolerance 0.002] [--bits 16] [--dry-run]
+"""
+
+import argparse
+import copy
+import os
+import shutil
+import time
+
+import joblib
+import numpy as np
+from sklearn.base import is_classifier
+
+from inference.artifacts import ARTIFACT_SUFFIX, load_artifact, save_artifact
+from inference.forest import CompiledForest, compile_forest
+from .pipelines import score_model
+from .tuning import measure_latency
+
+QUANTIZED_DTYPES = {8: np.uint8, 16: np.uint16}
+
+# Validation score the kept trees may lose against the full forest
+DEFAULT_TOLERANCE = 0.002
+
+# Validation rows used for tree selection and for the report (each half)
+VALIDATION_ROWS = 4000
+
+
+def _loss(means, target, classifier):
+    """Loss of each candidate ensemble in `means` (..., n_rows, k)"""
+    if classifier:
+        picked = means[..., np.arange(len(target)), target]
+        return -np.log(np.clip(picked, 1e-15, None)).mean(axis=-1)
+    return ((means - target) ** 2).mean(axis=(-2, -1))
+
+
+def _score(mean, y, classes):
+    if classes is not None:
+        return float(np.mean(classes.take(mean.argmax(axis=1)) == y))
+    y = np.asarray(y, dtype=np.float64).reshape(mean.shape)
+    variance = np.sum((y - y.mean(axis=0)) ** 2)
+    return float(1 - np.sum((y - mean) ** 2) / variance) if variance > 0 else 0.0
+
+
+def select_trees(model, X, y, tolerance=DEFAULT_TOLERANCE):
+    """
+    Greedy forward selection of trees on (X, y)
+
+    Returns the indices of the kept trees (in their original order) and
+    the validation score after each addition; the full forest's score is
+    the bar that the kept prefix must reach within `tolerance`.
+    """
+    classifier = is_classifier(model)
+    forest = compile_forest(model)
+    # The compiled trees, which also normalize class counts of forests pickled by sklearn < 1.4
+    outputs = forest.tree_values(X).astype(np.float64)
+    classes = model.classes_ if classifier else None
+    target = np.searchsorted(classes, y) if classifier else np.asarray(y, dtype=np.float64).reshape(-1, 1)
+    full = _score(outputs.mean(axis=0), y, classes)
+
+    remaining = list(range(len(outputs)))
+    order, curve = [], []
+    total = np.zeros(outputs.shape[1:])
+    for step in range(1, len(outputs) + 1):
+        losses = _loss((total + outputs[remaining]) / step, target, classifier)
+        best = remaining.pop(int(np.argmin(losses)))
+        order.append(best)
+        total += outputs[best]
+        curve.append(_score(total / step, y, classes))
+
+    keep = next(k for k, score in enumerate(curve, 1) if score >= full - tolerance)
+    return sorted(order[:keep]), curve
+
+
+def subset(model, indices):
+    """Copy of a fitted forest holding only the trees at `indices`"""
+    selected = copy.copy(model)
+    selected.estimators_ = [model.estimators_[i] for i in indices]
+    selected.n_estimators = len(selected.estimators_)
+    return selected
+
+
+def quantize(forest, bits=16):
+    """
+    Compiled forest with narrow index arrays and, unless `bits` is None,
+    leaf values quantized to `bits`-bit codes
+
+    Internal nodes' values are never read, so only leaves set the range of
+    each output; their codes are zero.
+    """
+    n_nodes = len(forest.feature)
+    if 2 * n_nodes + 1 >= 2 ** 31:
+        raise ValueError(f'{n_nodes} nodes do not fit 32-bit indices')
+    n_features = forest.n_features_in_
+    feature_dtype = np.uint8 if n_features <= 2 ** 8 else np.uint16 if n_features <= 2 ** 16 else np.int32
+
+    value, scale, offset = forest.value, None, None
+    if bits is not None:
+        is_leaf = forest.children[0::2] == np.arange(n_nodes)
+        leaves = forest.value[is_leaf]
+        offset = leaves.min(axis=0)
+        scale = (leaves.max(axis=0) - offset) / (2 ** bits - 1)
+        scale[scale == 0] = 1.0
+        value = np.zeros(forest.value.shape, dtype=QUANTIZED_DTYPES[bits])
+        value[is_leaf] = np.rint((leaves - offset) / scale)
+
+    return CompiledForest(
+        feature=forest.feature.astype(feature_dtype),
+        threshold=forest.threshold,
+        children=forest.children.astype(np.int32),
+        value=value,
+        roots=forest.roots.astype(np.int32),
+        max_depth=forest.max_depth,
+        n_features=n_features,
+        missing_left=forest.missing_left,
+        classes=forest.classes_,
+        value_scale=scale,
+        value_offset=offset
+    )
+
+
+def sample_inputs(model, n_rows, random_state=None):
+    """Inputs spread over the range each feature is split on (10% margin either side)"""
+    rng = np.random.default_rng(random_state)
+    X = np.zeros((n_rows, model.n_features_in_))
+    for feature in range(model.n_features_in_):
+        thresholds = np.concatenate([tree.tree_.threshold[tree.tree_.feature == feature]
+                                     for tree in model.estimators_])
+        if len(thresholds):
+            low, high = thresholds.min(), thresholds.max()
+            margin = 0.1 * (high - low) or 1.0
+            X[:, feature] = rng.uniform(low - margin, high + margin, n_rows)
+    return X
+
+
+def compact(model, X, y=None, tolerance=DEFAULT_TOLERANCE, bits=16, random_state=42):
+    """
+    Compact a fitted forest; returns (compiled forest, report)
+
+    (X, y) are validation rows, halved between tree selection and the
+    report. Without `y` the full forest's predictions are the labels
+    (fidelity). The report compares the original and the compact forest:
+    trees, node array bytes, 1-row and batch latency and score.
+    """
+    fidelity = y is None
+    original = compile_forest(model)
+    rows = np.random.default_rng(random_state).permutation(len(X))[:2 * VALIDATION_ROWS]
+    X = np.asarray(X)[rows]
+    y = original.predict(X) if fidelity else np.asarray(y)[rows]
+    half = len(X) // 2
+    X_select, y_select, X_report, y_report = X[:half], y[:half], X[half:], y[half:]
+
+    indices, _ = select_trees(model, X_select, y_select, tolerance)
+    compacted = quantize(compile_forest(subset(model, indices)), bits)
+
+    classifier = is_classifier(model)
+    metric = ('agreement' if fidelity else 'accuracy') if classifier else 'r2'
+    report = {'metric': metric, 'tolerance': tolerance, 'bits': bits, 'validation_rows': len(X_report)}
+    for name, forest in (('original', original), ('compact', compacted)):
+        single, batch, nbytes = measure_latency(forest, X_report)
+        score = score_model(forest, X_report, y_report, classifier)
+        report[name] = {'trees': forest.n_estimators, 'nbytes': nbytes,
+                        'latency_1row': single, 'latency_batch': batch,
+                        'score': score['accuracy' if classifier else 'r2']}
+    report['score_delta'] = report['compact']['score'] - report['original']['score']
+    if not classifier:
+        report['max_abs_error'] = float(np.max(np.abs(compacted.predict(X_report) - original.predict(X_report))))
+    return compacted, report
+
+
+def _directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def compact_file(path, output=None, tolerance=DEFAULT_TOLERANCE, bits=16, dry_run=False, random_state=42):
+    """
+    Compact the pickled forest at `path` into `output` (default: the
+    `.forest` artifact next to it, which servers load in its place)
+
+    Validates on `<name>.holdout.npz` when training saved one, otherwise
+    on sampled inputs for fidelity. The report adds file sizes and load
+    times (unpickle and compile vs open the artifact).
+    """
+    name = os.path.splitext(path)[0]
+    started = time.perf_counter()
+    model = joblib.load(path)
+    compile_forest(model)
+    pickle_load = time.perf_counter() - started
+
+    holdout = f'{name}.holdout.npz'
+    if os.path.exists(holdout):
+        with np.load(holdout) as data:
+            X, y = data['X'], data['y']
+    else:
+        X, y = sample_inputs(model, 2 * VALIDATION_ROWS, random_state), None
+
+    forest, report = compact(model, X, y, tolerance, bits, random_state)
+    report['original']['file_bytes'] = os.path.getsize(path)
+    report['original']['load_seconds'] = pickle_load
+
+    output = output or name + ARTIFACT_SUFFIX
+    target = output if not dry_run else f'{name}.compact-{os.getpid()}{ARTIFACT_SUFFIX}'
+    save_artifact(forest, target)
+    started = time.perf_counter()
+    loaded = load_artifact(target)
+    loaded.predict(np.zeros((1, loaded.n_features_in_)))
+    report['compact']['load_seconds'] = time.perf_counter() - started
+    report['compact']['file_bytes'] = _directory_bytes(target)
+    report['path'] = None if dry_run else target
+    if dry_run:
+        shutil.rmtree(target)
+    return report
+
+
+def print_report(name, report):
+    original, compacted = report['original'], report['compact']
+    print(f"✓ {name}: {original['trees']} -> {compacted['trees']} trees "
+          f"({report['metric']} {original['score']:.4f} -> {compacted['score']:.4f}, "
+          f"delta {report['score_delta']:+.4f})")
+    print(f"  {'':10}{'file':>10}{'arrays':>10}{'load':>10}{'1 row':>10}{'batch':>10}")
+    for label, entry in (('original', original), ('compact', compacted)):
+        print(f"  {label:<10}{entry['file_bytes'] / 1024:>8.0f}KB{entry['nbytes'] / 1024:>8.0f}KB"
+              f"{entry['load_seconds'] * 1000:>8.1f}ms{entry['latency_1row'] * 1000:>8.3f}ms"
+              f"{entry['latency_batch'] * 1000:>8.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compact pickled forests into .forest artifacts')
+    parser.add_argument('paths', nargs='*', default=['models'], help='pickles or models directories')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='score the kept trees may lose against the full forest')
+    parser.add_argument('--bits', type=int, choices=sorted(QUANTIZED_DTYPES), default=16)
+    parser.add_argument('--exact', action='store_true', help='keep float64 leaf values')
+    parser.add_argument('--dry-run', action='store_true', help='report without writing artifacts')
+    args = parser.parse_args()
+
+    paths = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            paths.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith('.pkl'))
+        else:
+            paths.append(path)
+
+    for path in paths:
+        try:
+            report = compact_file(path, tolerance=args.tolerance, bits=None if args.exact else args.bits,
+                                  dry_run=args.dry_run)
+        except (OSError, ValueError) as e:
+            print(f"✗ {path}: {e}")
+            continue
+        print_report(os.path.basename(path), report)
+
+
+if __name__ == '__main__':
+    main()
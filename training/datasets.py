@@ -0,0 +1,329 @@
+"""
+Cached columnar datasets
+
+Each raw source (one or more CSV files) is parsed once with its real
+dialect and explicit dtypes, cleaned, and written as a cache directory
+holding one uncompressed `.npy` file per column plus a `meta.json`, under
+`<data_dir>/.cache/`. Later loads memory-map the columns instead of
+parsing text again.
+
+The cache records the size, mtime and SHA-1 of every source file. A file
+whose size or mtime changed is hashed again: identical contents only
+refresh the record, anything else rebuilds the cache.
+
+`iter_chunks` streams a source in chunks instead, for out-of-core
+training (see training/outofcore.py).
+
+Build the caches and compare cold and warm loads with:
+
+    python -m training.datasets [data_dir]
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = '.cache'
+FORMAT_VERSION = 1
+
+# Missing-value sentinel of the UCI air quality dataset
+AIR_QUALITY_MISSING = -200
+
+AIR_QUALITY_MEASUREMENTS = ['CO(GT)', 'PT08.S1(CO)', 'NMHC(GT)', 'C6H6(GT)', 'PT08.S2(NMHC)', 'NOx(GT)',
+                            'PT08.S3(NOx)', 'NO2(GT)', 'PT08.S4(NO2)', 'PT08.S5(O3)', 'T', 'RH', 'AH']
+TRAFFIC_COUNTS = ['CarCount', 'BikeCount', 'BusCount', 'TruckCount', 'Total']
+
+
+class DatasetError(ValueError):
+    """A dataset is missing or cannot be parsed"""
+
+
+AIR_QUALITY_CSV = {
+    'sep': ';', 'decimal': ',', 'usecols': ['Date', 'Time'] + AIR_QUALITY_MEASUREMENTS,
+    'dtype': {name: np.float32 for name in AIR_QUALITY_MEASUREMENTS} | {'Date': str, 'Time': str}
+}
+TRAFFIC_CSV = {
+    'dtype': {name: np.int32 for name in TRAFFIC_COUNTS}
+    | {'Time': str, 'Date': np.int8, 'Day of the week': 'category', 'Traffic Situation': 'category'}
+}
+ENERGY_CSV = {'dtype': {'TxnDate': str, 'TxnTime': str, 'Consumption': np.float32}}
+
+
+def air_quality_columns(df):
+    """
+    AirQuality.csv: `;`-separated with decimal commas, two empty trailing
+    columns, blank trailing rows and -200 for missing readings
+    """
+    df = df.dropna(subset=['Date', 'Time'])
+    columns = {'timestamp': pd.to_datetime(df['Date'] + ' ' + df['Time'], format='%d/%m/%Y %H.%M.%S')
+               .to_numpy(dtype='datetime64[s]')}
+    for name in AIR_QUALITY_MEASUREMENTS:
+        values = df[name].to_numpy(dtype=np.float32)
+        columns[name] = np.where(values == AIR_QUALITY_MISSING, np.float32(np.nan), values)
+    return columns, {}
+
+
+def traffic_columns(df):
+    """Traffic CSVs: 15-minute vehicle counts with a labelled situation"""
+    missing = [name for name in TRAFFIC_COUNTS if name not in df.columns]
+    if missing:
+        raise DatasetError(f"Missing traffic columns: {', '.join(missing)}")
+
+    minutes = pd.to_datetime(df['Time'], format='%I:%M:%S %p')
+    columns = {
+        'source': df['source'].to_numpy(dtype=np.int8),
+        'minute_of_day': (minutes.dt.hour * 60 + minutes.dt.minute).to_numpy(dtype=np.int16),
+        'day_of_month': df['Date'].to_numpy(dtype=np.int8)
+    }
+    columns.update({name: df[name].to_numpy(dtype=np.int32) for name in TRAFFIC_COUNTS})
+
+    categories = {}
+    for name, column in (('Day of the week', 'day_of_week'), ('Traffic Situation', 'situation')):
+        values = df[name].astype(str).astype('category')
+        columns[column] = values.cat.codes.to_numpy(dtype=np.int8)
+        categories[column] = values.cat.categories.tolist()
+    return columns, categories
+
+
+def energy_columns(df):
+    """Blower kWh CSVs: unnamed record id, date, time, consumption"""
+    df = df.dropna(subset=['TxnDate', 'TxnTime', 'Consumption'])
+    return {
+        'record_id': df[df.columns[0]].to_numpy(dtype=np.int64),
+        'timestamp': pd.to_datetime(df['TxnDate'] + ' ' + df['TxnTime'], format='%d %b %Y %H:%M:%S')
+                     .to_numpy(dtype='datetime64[s]'),
+        'Consumption': df['Consumption'].to_numpy(dtype=np.float32)
+    }, {}
+
+
+class DatasetSource:
+    """
+    Raw files (relative to the data directory), how to read them and how
+    to turn the frame read into columns
+
+    `read` holds the `pd.read_csv` arguments of the source's dialect;
+    `columns(df)` returns (columns, categories) for any run of rows, so a
+    source parses whole or in chunks alike.
+    """
+
+    def __init__(self, files, read, columns):
+        self.files = files
+        self.read = read
+        self.columns = columns
+
+    def parse(self, paths):
+        """(columns, categories) of all `paths`; `source` in the frame is the index of each row's file"""
+        frames = [pd.read_csv(path, **self.read).assign(source=np.int8(i)) for i, path in enumerate(paths)]
+        return self.columns(pd.concat(frames, ignore_index=True))
+
+
+SOURCES = {
+    'air_quality': DatasetSource(['air_quality/AirQuality.csv'], AIR_QUALITY_CSV, air_quality_columns),
+    'traffic': DatasetSource(['traffic/Traffic.csv', 'traffic/TrafficTwoMonth.csv'], TRAFFIC_CSV, traffic_columns),
+    'energy': DatasetSource(['energy/KwhConsumptionBlower78_1.csv', 'energy/KwhConsumptionBlower78_2.csv',
+                             'energy/KwhConsumptionBlower78_3.csv'], ENERGY_CSV, energy_columns)
+}
+
+
+class Dataset:
+    """
+    Named columns of equal length, usually memory-mapped from the cache
+
+    String columns are stored as integer codes; `categories[column]` holds
+    their labels.
+    """
+
+    def __init__(self, name, columns, categories=None, cache_hit=False, load_seconds=None):
+        self.name = name
+        self._columns = columns
+        self.categories = categories or {}
+        self.cache_hit = cache_hit
+        self.load_seconds = load_seconds
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    def __getitem__(self, column):
+        return self._columns[column]
+
+    def __contains__(self, column):
+        return column in self._columns
+
+    def __len__(self):
+        return len(next(iter(self._columns.values()))) if self._columns else 0
+
+    def matrix(self, columns, dtype=np.float32):
+        """Contiguous 2-D array of `columns`"""
+        return np.column_stack([np.asarray(self._columns[column], dtype=dtype) for column in columns])
+
+    def frame(self):
+        """Copy as a pandas DataFrame, with categorical columns restored"""
+        data = {}
+        for column, values in self._columns.items():
+            if column in self.categories:
+                data[column] = pd.Categorical.from_codes(values, self.categories[column])
+            else:
+                data[column] = np.asarray(values)
+        return pd.DataFrame(data)
+
+
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cache_path(data_dir, name, files, source):
+    if files == source.files:
+        return os.path.join(data_dir, CACHE_DIR, name)
+    # Custom file selections (e.g. per-zone variants) get their own cache
+    return os.path.join(data_dir, CACHE_DIR, f"{name}-{hashlib.sha1('|'.join(files).encode()).hexdigest()[:8]}")
+
+
+def _check(meta, paths):
+    """'fresh', 'touched' (same contents, new stat) or 'stale'"""
+    recorded = meta.get('sources', [])
+    if meta.get('format_version') != FORMAT_VERSION or [s['file'] for s in recorded] != paths:
+        return 'stale'
+
+    state = 'fresh'
+    for entry in recorded:
+        stat = os.stat(entry['file'])
+        if stat.st_size == entry['size'] and stat.st_mtime_ns == entry['mtime_ns']:
+            continue
+        if stat.st_size != entry['size'] or file_sha1(entry['file']) != entry['sha1']:
+            return 'stale'
+        state = 'touched'
+    return state
+
+
+def _signatures(paths):
+    return [{'file': path, 'size': os.stat(path).st_size, 'mtime_ns': os.stat(path).st_mtime_ns,
+             'sha1': file_sha1(path)} for path in paths]
+
+
+def _write_meta(cache, meta):
+    temporary = os.path.join(cache, f'meta.json.tmp-{os.getpid()}-{threading.get_ident()}')
+    with open(temporary, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(temporary, os.path.join(cache, 'meta.json'))
+
+
+def _build(cache, source, paths):
+    """Parse the sources and write the cache next to its final location, then rename it in"""
+    signatures = _signatures(paths)
+    columns, categories = source.parse(paths)
+
+    staging = f'{cache}.tmp-{os.getpid()}-{threading.get_ident()}'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    files = {}
+    for i, (column, values) in enumerate(columns.items()):
+        files[column] = f'{i}.npy'
+        np.save(os.path.join(staging, files[column]), np.ascontiguousarray(values), allow_pickle=False)
+    _write_meta(staging, {
+        'format_version': FORMAT_VERSION,
+        'sources': signatures,
+        'rows': len(next(iter(columns.values()))),
+        'columns': files,
+        'categories': categories
+    })
+
+    try:
+        if os.path.isdir(cache):
+            shutil.rmtree(cache)
+        os.rename(staging, cache)
+    except OSError:
+        # Another pipeline built the same cache meanwhile
+        shutil.rmtree(staging, ignore_errors=True)
+    return columns, categories
+
+
+def load_dataset(name, data_dir='datasets', files=None, refresh=False, mmap_mode='r'):
+    """
+    Load a dataset from its cache, parsing the raw files only when needed
+
+    `files` overrides the source files (relative to `data_dir`); missing
+    files are skipped. `refresh=True` rebuilds the cache regardless.
+    Raises DatasetError when no source file exists.
+    """
+    started = time.perf_counter()
+    source = SOURCES[name]
+    files = files or source.files
+    paths = [os.path.join(data_dir, file) for file in files if os.path.exists(os.path.join(data_dir, file))]
+    if not paths:
+        raise DatasetError(f"No dataset found (looked for {', '.join(files)} in {data_dir})")
+
+    cache = _cache_path(data_dir, name, files, source)
+    meta_path = os.path.join(cache, 'meta.json')
+    state = 'stale'
+    if not refresh and os.path.isfile(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        state = _check(meta, paths)
+
+    if state == 'stale':
+        columns, categories = _build(cache, source, paths)
+        return Dataset(name, columns, categories, cache_hit=False, load_seconds=time.perf_counter() - started)
+
+    if state == 'touched':
+        meta['sources'] = _signatures(paths)
+        _write_meta(cache, meta)
+
+    columns = {column: np.load(os.path.join(cache, file), mmap_mode=mmap_mode, allow_pickle=False)
+               for column, file in meta['columns'].items()}
+    return Dataset(name, columns, meta['categories'], cache_hit=True, load_seconds=time.perf_counter() - started)
+
+
+def iter_chunks(name, data_dir='datasets', files=None, chunk_rows=100_000):
+    """
+    Stream a dataset straight from its CSVs as Datasets of at most
+    `chunk_rows` rows, for sources too large to parse or cache whole
+
+    Only one chunk is in memory at a time. Category codes are per chunk:
+    compare labels through `categories`, not codes across chunks.
+    """
+    source = SOURCES[name]
+    files = files or source.files
+    paths = [os.path.join(data_dir, file) for file in files if os.path.exists(os.path.join(data_dir, file))]
+    if not paths:
+        raise DatasetError(f"No dataset found (looked for {', '.join(files)} in {data_dir})")
+
+    for i, path in enumerate(paths):
+        with pd.read_csv(path, chunksize=chunk_rows, **source.read) as reader:
+            for frame in reader:
+                columns, categories = source.columns(frame.assign(source=np.int8(i)))
+                yield Dataset(name, columns, categories)
+
+
+def clear_cache(data_dir='datasets'):
+    """Remove every cached dataset"""
+    shutil.rmtree(os.path.join(data_dir, CACHE_DIR), ignore_errors=True)
+
+
+if __name__ == '__main__':
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else 'datasets'
+    print(f"  {'dataset':<12} {'rows':>7} {'raw CSV':>9} {'cold':>9} {'warm':>9}")
+    for name, source in SOURCES.items():
+        try:
+            started = time.perf_counter()
+            source.parse([os.path.join(data_dir, file) for file in source.files
+                          if os.path.exists(os.path.join(data_dir, file))])
+            raw = time.perf_counter() - started
+            cold = load_dataset(name, data_dir, refresh=True)
+            warm = min(load_dataset(name, data_dir).load_seconds for _ in range(5))
+        except (DatasetError, ValueError) as e:
+            print(f"✗ {name}: {e}")
+            continue
+        print(f"  {name:<12} {len(cold):>7} {raw * 1000:>7.1f}ms {cold.load_seconds * 1000:>7.1f}ms "
+              f"{warm * 1000:>7.1f}ms")
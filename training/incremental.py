@@ -0,0 +1,229 @@
+"""
+Incremental forest updates
+
+Instead of retraining from scratch, an update fits `new_trees` extra
+trees on a window of new rows only (scikit-learn's `warm_start`) and
+appends them to the saved forest, optionally retiring the oldest trees so
+the forest never grows past `max_trees`. A daily window takes seconds
+where a full retrain refits every tree on all history.
+
+Every update is scored on a fixed holdout - the test split that
+`run_pipeline` saved as `<artifact>.holdout.npz`, or for models trained
+elsewhere a fifth of the first window, which is then never trained on -
+and appended to `<artifact>.updates.json` together with the drift from
+the holdout score before the first update. The log also keeps a watermark
+per data source, so the same rows are never added twice.
+
+Windows come from new CSV drops (`update_from_csv`, files placed in
+`<data_dir>/incoming/<dataset>/`) or, for the web application's models,
+from predictions with a recorded outcome (see website/updates.py).
+"""
+
+import glob
+import json
+import os
+import time
+from datetime import datetime
+
+import joblib
+import numpy as np
+from sklearn.base import is_classifier
+
+from inference.artifacts import ARTIFACT_SUFFIX, save_artifact
+from .datasets import SOURCES, DatasetError, file_sha1, load_dataset
+from .pipelines import PIPELINES, holdout_path, save_holdout, save_model, score_model
+
+INCOMING_DIR = 'incoming'
+
+# Share of the first window kept as holdout when the model has none
+HOLDOUT_FRACTION = 0.2
+
+
+def log_path(models_dir, artifact):
+    return os.path.join(models_dir, f'{artifact}.updates.json')
+
+
+def read_log(models_dir, artifact):
+    """The update log of `artifact` (empty when it was never updated)"""
+    try:
+        with open(log_path(models_dir, artifact)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'artifact': artifact, 'baseline': None, 'watermarks': {}, 'history': []}
+
+
+def _write_log(models_dir, artifact, log):
+    path = log_path(models_dir, artifact)
+    temporary = f'{path}.tmp-{os.getpid()}'
+    with open(temporary, 'w') as f:
+        json.dump(log, f, indent=2)
+    os.replace(temporary, path)
+
+
+def pad_classes(X, y, classes):
+    """
+    (X, y, sample_weight) with one zero-weight row for each of `classes`
+    missing from `y`, so a classifier fitted on them still has all
+    `classes` without the extra rows influencing its trees (sample_weight
+    is None when nothing is missing). Labels outside `classes` raise
+    ValueError.
+    """
+    y, classes = np.asarray(y), np.asarray(classes)
+    # Checked before the cast, which would truncate 1.5 to a known class 1
+    known = np.isin(y, classes)
+    if not known.all():
+        raise ValueError(f'Labels not known to the model: {np.unique(y[~known]).tolist()}')
+    y = y.astype(classes.dtype)
+    missing = np.setdiff1d(classes, y)
+    if not len(missing):
+        return X, y, None
+    X = np.concatenate([X, np.repeat(X[:1], len(missing), axis=0)])
+    return (X, np.concatenate([y, missing]),
+            np.concatenate([np.ones(len(y)), np.zeros(len(missing))]))
+
+
+def update_forest(model, X, y, new_trees=10, max_trees=None, n_jobs=1, random_state=None):
+    """
+    Append `new_trees` trees fitted on (X, y), then retire the oldest ones
+    beyond `max_trees`; returns (trees added, trees retired)
+
+    Classifier windows may lack some of the model's classes (a quiet day
+    has no "Very High" traffic); they are padded (see `pad_classes`) so
+    `classes_` - and the shape of every tree's output - is unchanged.
+    Labels the model has never seen raise ValueError.
+    """
+    if new_trees < 1:
+        raise ValueError('new_trees must be at least 1')
+    X = np.asarray(X)
+    y = np.asarray(y)
+    sample_weight = None
+
+    if is_classifier(model):
+        X, y, sample_weight = pad_classes(X, y, model.classes_)
+
+    if random_state is not None:
+        model.random_state = random_state
+    model.set_params(warm_start=True, n_estimators=len(model.estimators_) + new_trees, n_jobs=n_jobs)
+    try:
+        model.fit(X, y, sample_weight=sample_weight)
+    finally:
+        model.set_params(warm_start=False)
+
+    retired = 0
+    if max_trees is not None and len(model.estimators_) > max_trees:
+        retired = len(model.estimators_) - max_trees
+        model.estimators_ = model.estimators_[retired:]
+        model.n_estimators = len(model.estimators_)
+    return new_trees, retired
+
+
+def _metrics_delta(after, baseline):
+    return {name: after[name] - baseline[name] for name in after if name in (baseline or {})}
+
+
+def update_model(artifact, X, y, models_dir='models', new_trees=10, max_trees=None, n_jobs=1, source='manual',
+                 watermark=None, random_state=None):
+    """
+    Update the saved forest `<models_dir>/<artifact>.pkl` with one window
+
+    The model is saved atomically, so servers watching `models_dir` pick
+    it up with their usual hot reload. Servers prefer a `.forest` artifact
+    over the pickle (see inference/registry.py), so when the model was
+    exported or compacted that artifact is rewritten from the updated
+    forest too (uncompacted; compact it again to shrink it). `watermark`
+    is stored as the new position of `source` (see `read_log`). Returns
+    the log entry: rows,
+    trees added and retired, the holdout score before and after the update
+    and its drift from the baseline.
+    """
+    started = time.perf_counter()
+    path = os.path.join(models_dir, f'{artifact}.pkl')
+    if not os.path.exists(path):
+        raise FileNotFoundError(f'No model to update at {path} (train it first)')
+    model = joblib.load(path)
+    classifier = is_classifier(model)
+    X = np.asarray(X)
+    y = np.asarray(y)
+    if len(X) != len(y) or len(X) < 2:
+        raise ValueError('An update needs at least 2 rows with one label each')
+
+    holdout = holdout_path(models_dir, artifact)
+    if os.path.exists(holdout):
+        with np.load(holdout) as data:
+            X_holdout, y_holdout = data['X'], data['y']
+    else:
+        rows = np.random.default_rng(random_state).permutation(len(X))
+        cut = max(1, int(len(X) * HOLDOUT_FRACTION))
+        X_holdout, y_holdout = X[rows[:cut]], y[rows[:cut]]
+        X, y = X[rows[cut:]], y[rows[cut:]]
+        save_holdout(holdout, X_holdout, y_holdout)
+
+    log = read_log(models_dir, artifact)
+    before = score_model(model, X_holdout, y_holdout, classifier)
+    if log['baseline'] is None:
+        log['baseline'] = before
+    added, retired = update_forest(model, X, y, new_trees, max_trees, n_jobs, random_state)
+    after = score_model(model, X_holdout, y_holdout, classifier)
+    save_model(model, path)
+    artifact_path = os.path.join(models_dir, artifact + ARTIFACT_SUFFIX)
+    if os.path.isdir(artifact_path):
+        save_artifact(model, artifact_path)
+
+    entry = {
+        'time': datetime.utcnow().isoformat(timespec='seconds'),
+        'source': source,
+        'rows': len(X),
+        'trees_added': added,
+        'trees_retired': retired,
+        'n_estimators': model.n_estimators,
+        'holdout_rows': len(y_holdout),
+        'before': before,
+        'after': after,
+        'drift': _metrics_delta(after, log['baseline']),
+        'seconds': round(time.perf_counter() - started, 3)
+    }
+    log['history'].append(entry)
+    if watermark is not None:
+        log['watermarks'][source] = watermark
+    _write_log(models_dir, artifact, log)
+    return entry
+
+
+def incoming_files(data_dir, dataset):
+    """New CSV drops for `dataset`, relative to `data_dir`, oldest name first"""
+    pattern = os.path.join(data_dir, INCOMING_DIR, dataset, '*.csv')
+    return sorted(os.path.relpath(path, data_dir) for path in glob.glob(pattern))
+
+
+def _rows(pipeline, data_dir, files, random_state):
+    try:
+        return pipeline.load(load_dataset(pipeline.dataset, data_dir, files), random_state)
+    except DatasetError:
+        return None, np.empty(0)
+
+
+def update_from_csv(target, data_dir='datasets', models_dir='models', new_trees=10, max_trees=None, n_jobs=1,
+                    artifact=None, random_state=None):
+    """
+    Update a pipeline's model with the CSV drops it has not consumed yet
+
+    The window is labelled exactly as a full retrain over the base files,
+    the consumed drops and the new ones would label it (the traffic
+    levels, for one, are relative to the range of all counts), and then
+    cut down to the rows of the new files. Returns the log entry, or None
+    when there is nothing new.
+    """
+    pipeline = PIPELINES[target]
+    artifact = artifact or pipeline.artifact
+    consumed = read_log(models_dir, artifact)['watermarks'].get('csv', [])
+    seen = {entry['file'] for entry in consumed}
+    new = [file for file in incoming_files(data_dir, pipeline.dataset) if file not in seen]
+    if not new:
+        return None
+
+    previous = SOURCES[pipeline.dataset].files + [entry['file'] for entry in consumed]
+    _, y_previous = _rows(pipeline, data_dir, previous, random_state)
+    X, y = pipeline.load(load_dataset(pipeline.dataset, data_dir, previous + new), random_state)
+    watermark = consumed + [{'file': file, 'sha1': file_sha1(os.path.join(data_dir, file))} for file in new]
+    return update_model(artifact, X[len(y_previous):], y[len(y_previous):], models_dir, new_trees, max_trees,
+                        n_jobs, source='csv', watermark=watermark, random_state=random_state)
@@ -0,0 +1,111 @@
+"""
+Run several training pipelines concurrently under a core budget
+"""
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from threadpoolctl import threadpool_limits
+
+from .pipelines import PIPELINES, run_pipeline
+
+EXECUTORS = ('process', 'thread')
+
+# Native thread pools that would otherwise each start one thread per core
+_THREAD_LIMITS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')
+
+# The worker's threadpool_limits, held for the life of the process
+_limiter = None
+
+
+class TrainingTask:
+    """
+    One model to train
+
+    `target` names a pipeline in PIPELINES; `artifact`, `files` and
+    `params` override its defaults, so per-zone variants are extra tasks
+    with their own dataset files and artifact name.
+    """
+
+    def __init__(self, target, artifact=None, files=None, params=None):
+        if target not in PIPELINES:
+            raise ValueError(f'Unknown training target {target!r} (expected one of {sorted(PIPELINES)})')
+        self.target = target
+        self.artifact = artifact or PIPELINES[target].artifact
+        self.files = files
+        self.params = params
+
+    def __repr__(self):
+        return f'TrainingTask({self.target!r}, artifact={self.artifact!r})'
+
+
+def plan_cores(n_tasks, cores):
+    """
+    (parallel tasks, n_jobs per task) for `n_tasks` within `cores`
+
+    Tasks run side by side first - loading and evaluation are
+    single-threaded, so overlapping pipelines keeps every core busy - and
+    the cores left over are split between them as forest `n_jobs`.
+    """
+    parallel = max(1, min(n_tasks, cores))
+    return parallel, max(1, cores // parallel)
+
+
+def _init_worker(n_jobs):
+    """Worker initializer - keep native thread pools within the task's share"""
+    global _limiter
+    # A spawned worker has imported numpy and sklearn (through this module)
+    # before the initializer runs, so their BLAS/OpenMP pools are already
+    # sized: resize the loaded ones, and set the variables for any loaded later
+    _limiter = threadpool_limits(limits=n_jobs)
+    for name in _THREAD_LIMITS:
+        os.environ[name] = str(n_jobs)
+
+
+def train_all(tasks, cores=None, data_dir='datasets', models_dir='models', executor='process',
+              random_state=42, on_result=None):
+    """
+    Train `tasks` concurrently using at most `cores` cores (default: all)
+
+    With `executor='process'` every running task has its own process, so
+    pandas parsing and the Python parts of fitting overlap across
+    pipelines instead of holding one GIL. `on_result(result)` is called as
+    each task finishes. Returns the wall-clock seconds, the core plan and
+    the per-task results of `run_pipeline` in task order.
+    """
+    if executor not in EXECUTORS:
+        raise ValueError(f'Unknown training executor {executor!r} (expected one of {EXECUTORS})')
+
+    tasks = [task if isinstance(task, TrainingTask) else TrainingTask(task) for task in tasks]
+    cores = cores or os.cpu_count() or 1
+    parallel, n_jobs = plan_cores(len(tasks), cores)
+    started = time.perf_counter()
+
+    # A single pipeline at a time gains nothing from a worker process
+    if executor == 'process' and parallel > 1:
+        pool = ProcessPoolExecutor(parallel, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_init_worker, initargs=(n_jobs,))
+    else:
+        pool = ThreadPoolExecutor(parallel, thread_name_prefix='training')
+
+    results = [None] * len(tasks)
+    with pool:
+        futures = {
+            pool.submit(run_pipeline, task.target, data_dir, models_dir, n_jobs,
+                        task.artifact, task.files, task.params, random_state): i
+            for i, task in enumerate(tasks)
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            if on_result is not None:
+                on_result(results[futures[future]])
+
+    return {
+        'seconds': time.perf_counter() - started,
+        'cores': cores,
+        'parallel': parallel,
+        'n_jobs': n_jobs,
+        'results': results
+    }
@@ -0,0 +1,258 @@
+"""
+Out-of-core training
+
+`run_pipeline` parses a whole dataset into memory and splits it there,
+which stops working once the inputs are years of 15-minute counts for
+hundreds of intersections. `run_out_of_core` trains the same pipelines
+within a RAM ceiling instead:
+
+1. stream: the CSVs are read `chunk_rows` rows at a time (see
+   `iter_chunks`), turned into float32 features, and every row is sent to
+   the train or test spool file on disk by a seeded coin flip - the
+   split never needs the full frame.
+2. fit: the forest is grown in batches of `trees_per_batch` trees, each
+   batch fitted on its own random subsample of at most `max_samples`
+   training rows read from the memory-mapped spool, and appended to the
+   previous ones (as incremental updates do, see training/incremental.py).
+3. evaluate: the test spool is scored chunk by chunk with running sums.
+
+Chunk and subsample sizes are derived from the ceiling, and the process's
+anonymous memory is sampled throughout: the run fails with
+MemoryLimitExceeded rather than silently overrunning the ceiling, and
+reports its peak either way. File-backed pages of the spool are not
+counted; they are page cache the kernel can reclaim at any time.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+from sklearn.metrics import accuracy_score
+
+from .datasets import iter_chunks
+from .incremental import pad_classes, update_forest
+from .pipelines import PIPELINES, StageTimer, holdout_path, save_holdout, save_model
+
+MB = 1024 * 1024
+DEFAULT_MEMORY_LIMIT = 1024 * MB
+
+# Parsed CSV row in pandas, strings included, before it is cut to columns
+CSV_ROW_BYTES = 1024
+
+# Bytes per sampled row on top of its float32 features: the target, sample
+# weights and indices, and the tree builder's per-sample work arrays
+ROW_OVERHEAD = 64
+
+# Test rows kept as the holdout of later incremental updates
+HOLDOUT_MAX_ROWS = 100_000
+
+
+class MemoryLimitExceeded(MemoryError):
+    """The run's memory went over its ceiling"""
+
+
+def anonymous_memory():
+    """Resident anonymous memory of this process in bytes (heap, not mapped files; Linux)"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('RssAnon:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+class MemoryMonitor:
+    """
+    Peak anonymous memory of the process, sampled every `interval` seconds
+    in a background thread while used as a context manager
+    """
+
+    def __init__(self, limit=None, interval=0.005):
+        self.limit = limit
+        self.interval = interval
+        self.peak = anonymous_memory()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, anonymous_memory())
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._sample, name='memory-monitor', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, anonymous_memory())
+
+    def check(self):
+        """Raise MemoryLimitExceeded if the peak so far is over the limit"""
+        self.peak = max(self.peak, anonymous_memory())
+        if self.limit is not None and self.peak > self.limit:
+            raise MemoryLimitExceeded(f'Peak memory {self.peak / MB:.0f} MB is over the '
+                                      f'{self.limit / MB:.0f} MB limit')
+
+
+class _Spool:
+    """Rows appended to a raw file, read back as a memory map"""
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self._file = open(path, 'wb')
+        self._dtype = None
+        self._shape = ()
+
+    def write(self, values):
+        values = np.ascontiguousarray(values)
+        self._dtype, self._shape = values.dtype, values.shape[1:]
+        self._file.write(values.tobytes())
+        self.rows += len(values)
+
+    def read(self):
+        self._file.close()
+        if not self.rows:
+            return np.empty((0,) + self._shape, dtype=self._dtype or np.float32)
+        return np.memmap(self.path, dtype=self._dtype, mode='r', shape=(self.rows,) + self._shape)
+
+
+def _chunks(rows, chunk_rows):
+    for start in range(0, rows, chunk_rows):
+        yield slice(start, min(start + chunk_rows, rows))
+
+
+def run_out_of_core(target, data_dir='datasets', models_dir='models', memory_limit=DEFAULT_MEMORY_LIMIT,
+                    chunk_rows=None, max_samples=None, trees_per_batch=10, n_jobs=1, artifact=None, files=None,
+                    params=None, test_size=0.2, random_state=42, spool_dir=None):
+    """
+    Train one model within `memory_limit` bytes and save it to `models_dir`
+
+    `chunk_rows` (CSV rows parsed at a time) and `max_samples` (training
+    rows per batch of trees) default to what fits the memory left under
+    the limit. `spool_dir` holds the split rows while training (default:
+    the system temporary directory). Never raises: the result has the
+    same keys as `run_pipeline`'s plus the limit, the peak memory and the
+    sizes used, and a failure - including exceeding the limit - is
+    reported in it.
+    """
+    pipeline = PIPELINES[target]
+    artifact = artifact or pipeline.artifact
+    timer = StageTimer()
+    monitor = MemoryMonitor(memory_limit)
+    result = {'target': target, 'artifact': artifact, 'n_jobs': n_jobs, 'timings': timer.timings,
+              'memory_limit': memory_limit}
+    started = time.perf_counter()
+    spool = tempfile.mkdtemp(prefix=f'{artifact}-', dir=spool_dir)
+
+    try:
+        if not pipeline.shuffle:
+            # Chunks would cut the series (losing each chunk's warm-up rows) and
+            # rows are split by coin flip, which would train on the future
+            raise ValueError(f'{target} is a time series and cannot be trained out of core')
+        with monitor:
+            budget = memory_limit - anonymous_memory()
+            if budget <= 0:
+                raise MemoryLimitExceeded(f'{memory_limit / MB:.0f} MB limit is below the '
+                                          f'{anonymous_memory() / MB:.0f} MB already in use')
+            chunk_rows = chunk_rows or int(np.clip(budget // 4 // CSV_ROW_BYTES, 1000, 200_000))
+            rng = np.random.default_rng(random_state)
+
+            with timer.stage('stream'):
+                spools = {name: _Spool(os.path.join(spool, name))
+                          for name in ('X_train', 'y_train', 'X_test', 'y_test')}
+                low, high = np.inf, -np.inf
+                for data in iter_chunks(pipeline.dataset, data_dir, files, chunk_rows):
+                    X, y = pipeline.stream(data, random_state)
+                    if not len(y):
+                        continue
+                    low, high = min(low, y.min()), max(high, y.max())
+                    test = rng.random(len(y)) < test_size
+                    spools['X_train'].write(np.asarray(X[~test], dtype=np.float32))
+                    spools['y_train'].write(y[~test])
+                    spools['X_test'].write(np.asarray(X[test], dtype=np.float32))
+                    spools['y_test'].write(y[test])
+                    monitor.check()
+                X_train, y_train, X_test, y_test = (spools[name].read()
+                                                    for name in ('X_train', 'y_train', 'X_test', 'y_test'))
+            if not len(y_train):
+                raise ValueError('No training rows')
+
+            def labels(values):
+                values = np.asarray(values)
+                return pipeline.levels(values, low, high) if pipeline.levels else values
+
+            with timer.stage('fit'):
+                settings = {**pipeline.params, **(params or {})}
+                n_estimators = settings.pop('n_estimators', 100)
+                row_bytes = X_train.shape[1] * 4 + ROW_OVERHEAD
+                max_samples = min(max_samples or max(1, budget // 2 // row_bytes), len(y_train))
+                classes = None
+                if pipeline.classifier:
+                    classes = np.unique(np.concatenate([np.unique(labels(y_train[rows]))
+                                                        for rows in _chunks(len(y_train), chunk_rows)]))
+
+                model, batches = None, 0
+                while model is None or len(model.estimators_) < n_estimators:
+                    new_trees = min(trees_per_batch, n_estimators - (len(model.estimators_) if model else 0))
+                    rows = np.sort(rng.choice(len(y_train), max_samples, replace=False))
+                    X, y = np.asarray(X_train[rows]), labels(y_train[rows])
+                    if model is None:
+                        model = pipeline.estimator(**settings, n_estimators=new_trees, random_state=random_state,
+                                                   n_jobs=n_jobs)
+                        sample_weight = None
+                        if pipeline.classifier:
+                            X, y, sample_weight = pad_classes(X, y, classes)
+                        model.fit(X, y, sample_weight=sample_weight)
+                    else:
+                        update_forest(model, X, y, new_trees, n_jobs=n_jobs)
+                    del X, y
+                    batches += 1
+                    monitor.check()
+
+            with timer.stage('evaluate'):
+                correct, sse, total, total_sq = 0, 0.0, 0.0, 0.0
+                for rows in _chunks(len(y_test), chunk_rows):
+                    y_true = labels(y_test[rows])
+                    y_pred = model.predict(np.asarray(X_test[rows]))
+                    if pipeline.classifier:
+                        correct += accuracy_score(y_true, y_pred, normalize=False)
+                    else:
+                        # Per output, for multi-output regressors (e.g. the energy forecaster)
+                        sse = sse + np.sum((y_true - y_pred) ** 2, axis=0)
+                        total = total + np.sum(y_true, axis=0)
+                        total_sq = total_sq + np.sum(np.square(y_true), axis=0)
+                n = len(y_test)
+                if not n:
+                    metrics = {}
+                elif pipeline.classifier:
+                    metrics = {'accuracy': float(correct / n)}
+                else:
+                    # Averaged over outputs, as sklearn's metrics do
+                    variance = total_sq - total * total / n
+                    r2 = np.where(variance > 0, 1 - sse / np.where(variance > 0, variance, 1), 0.0)
+                    metrics = {'rmse': float(np.sqrt(np.mean(sse) / n)), 'r2': float(np.mean(r2))}
+                monitor.check()
+
+            with timer.stage('save'):
+                os.makedirs(models_dir, exist_ok=True)
+                path = os.path.join(models_dir, f'{artifact}.pkl')
+                save_model(model, path)
+                keep = slice(0, min(n, HOLDOUT_MAX_ROWS))
+                save_holdout(holdout_path(models_dir, artifact), np.asarray(X_test[keep]), labels(y_test[keep]))
+            del X_train, y_train, X_test, y_test
+
+        result.update(status='trained', metrics=metrics, path=path, train_samples=spools['y_train'].rows,
+                      test_samples=n, chunk_rows=chunk_rows, max_samples=max_samples, batches=batches)
+    except Exception as e:
+        result.update(status='failed', error=str(e))
+    finally:
+        shutil.rmtree(spool, ignore_errors=True)
+
+    result['peak_memory'] = monitor.peak
+    result['seconds'] = time.perf_counter() - started
+    return result
@@ -0,0 +1,228 @@
+"""
+Training pipelines for the Smart City models
+
+Every pipeline runs the same stages - load, split, fit, evaluate, save -
+and reports the wall-clock time of each, so the orchestrator can show
+where a training run spends its time. Features are built by the model's
+schema in inference/features.py, the same one serving uses.
+"""
+
+import contextlib
+import os
+import time
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.metrics import accuracy_score, mean_squared_error, r2_score
+from sklearn.model_selection import train_test_split
+
+from inference.features import SCHEMAS
+from inference.forecast import forecast_dataset
+from .datasets import load_dataset
+
+
+def load_air_quality(data, random_state=None):
+    """
+    Sensor readings -> CO(GT)
+
+    Hours without a CO(GT) reading are dropped; missing sensor readings
+    stay NaN, which the forests handle natively.
+    """
+    # Features: the other sensor readings (see inference/features.py)
+    # Target: CO(GT)
+    y = np.asarray(data['CO(GT)'], dtype=np.float64)
+    keep = ~np.isnan(y)
+    return SCHEMAS['air_quality_random_forest'].transform(data)[keep], y[keep]
+
+
+def traffic_levels(total, low, high):
+    """
+    Four equal-width levels of `total` over [low, high], drawn exactly as
+    `pd.cut(total, bins=4)` draws them when low and high are its extremes
+    """
+    edges = np.linspace(low, high, 5, dtype=np.float64)
+    if low == high:
+        edges = np.linspace(low - 0.001 * abs(low or 1), high + 0.001 * abs(high or 1), 5)
+    else:
+        edges[0] -= (high - low) * 0.001
+    return np.clip(np.searchsorted(edges, total, side='left') - 1, 0, 3)
+
+
+def traffic_counts(data, random_state=None):
+    """Vehicle counts and their total, before it is cut into levels"""
+    return SCHEMAS['traffic_random_forest'].transform(data), np.asarray(data['Total'], dtype=np.float64)
+
+
+def load_traffic(data, random_state=None):
+    """Vehicle counts -> traffic level (0=Low, 1=Medium, 2=High, 3=Very High)"""
+    X, total = traffic_counts(data)
+    return X, traffic_levels(total, total.min(), total.max())
+
+
+def load_energy(data, random_state=None):
+    """Record id -> consumption"""
+    return SCHEMAS['energy_random_forest'].transform(data), np.asarray(data['Consumption'], dtype=np.float64)
+
+
+def load_energy_forecast(data, random_state=None):
+    """
+    Consumption history -> the next readings (one output per step ahead)
+
+    Readings are put in time order and turned into the lag, rolling-mean
+    and time-of-day features the streaming forecaster keeps (see
+    inference/forecast.py).
+    """
+    order = np.argsort(data['timestamp'], kind='stable')
+    return forecast_dataset(np.asarray(data['timestamp'])[order], np.asarray(data['Consumption'])[order])
+
+
+class Pipeline:
+    """
+    How to load, fit and score one model
+
+    `load(dataset, random_state)` returns (X, y) from the cached dataset
+    named `dataset` (see training/datasets.py). When the labels depend on
+    the whole dataset, out-of-core training (training/outofcore.py) loads
+    each chunk with `stream` instead, which returns a raw target, and
+    labels it once its range is known with `levels(target, low, high)`.
+    Rows of time series pipelines (`shuffle=False`) are split in time
+    order, so the test split is the latest stretch of the series.
+    """
+
+    def __init__(self, load, estimator, params, artifact, dataset, classifier=False, stream=None, levels=None,
+                 shuffle=True):
+        self.load = load
+        self.estimator = estimator
+        self.params = params
+        self.artifact = artifact
+        self.dataset = dataset
+        self.classifier = classifier
+        self.stream = stream or load
+        self.levels = levels
+        self.shuffle = shuffle
+
+
+PIPELINES = {
+    'air_quality': Pipeline(
+        load_air_quality, RandomForestRegressor,
+        {'n_estimators': 100, 'max_depth': 15, 'min_samples_split': 5, 'min_samples_leaf': 2},
+        artifact='air_quality_random_forest',
+        dataset='air_quality'
+    ),
+    'traffic': Pipeline(
+        load_traffic, RandomForestClassifier,
+        {'n_estimators': 100, 'max_depth': 10, 'min_samples_split': 5},
+        artifact='traffic_random_forest',
+        dataset='traffic',
+        classifier=True,
+        stream=traffic_counts,
+        levels=traffic_levels
+    ),
+    'energy': Pipeline(
+        load_energy, RandomForestRegressor,
+        {'n_estimators': 100, 'max_depth': 15, 'min_samples_split': 5, 'min_samples_leaf': 2},
+        artifact='energy_random_forest',
+        dataset='energy'
+    ),
+    'energy_forecast': Pipeline(
+        load_energy_forecast, RandomForestRegressor,
+        {'n_estimators': 100, 'max_depth': 12, 'min_samples_leaf': 5},
+        artifact='energy_forecaster',
+        dataset='energy',
+        shuffle=False
+    )
+}
+
+
+class StageTimer:
+    """Wall-clock seconds per named stage"""
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - started
+
+
+def score_model(model, X, y, classifier):
+    """Accuracy for classifiers, RMSE and R² for regressors"""
+    y_pred = model.predict(X)
+    if classifier:
+        return {'accuracy': float(accuracy_score(y, y_pred))}
+    return {'rmse': float(np.sqrt(mean_squared_error(y, y_pred))), 'r2': float(r2_score(y, y_pred))}
+
+
+def holdout_path(models_dir, artifact):
+    return os.path.join(models_dir, f'{artifact}.holdout.npz')
+
+
+def save_holdout(path, X, y):
+    """Keep the test split next to the model, so later updates are scored on the same rows"""
+    temporary = f'{path}.tmp-{os.getpid()}'
+    with open(temporary, 'wb') as f:
+        np.savez(f, X=X, y=y)
+    os.replace(temporary, path)
+
+
+def save_model(model, path):
+    """Write atomically, so a watching server never loads a half-written file"""
+    temporary = f'{path}.tmp-{os.getpid()}'
+    joblib.dump(model, temporary)
+    os.replace(temporary, path)
+
+
+def run_pipeline(target, data_dir='datasets', models_dir='models', n_jobs=1, artifact=None, files=None,
+                 params=None, random_state=42):
+    """
+    Train one model and save it to `models_dir`
+
+    `artifact`, `files` (relative to `data_dir`) and `params` (estimator
+    keyword arguments) override the pipeline defaults, e.g. for per-zone
+    variants. The test split is kept as `<artifact>.holdout.npz` for
+    incremental updates (see training/incremental.py). Never raises:
+    failures are reported in the result, which also holds the metrics and
+    the seconds spent in each stage.
+    """
+    pipeline = PIPELINES[target]
+    artifact = artifact or pipeline.artifact
+    timer = StageTimer()
+    result = {'target': target, 'artifact': artifact, 'n_jobs': n_jobs, 'timings': timer.timings}
+    started = time.perf_counter()
+
+    try:
+        with timer.stage('load'):
+            data = load_dataset(pipeline.dataset, data_dir, files)
+            X, y = pipeline.load(data, random_state)
+        result['dataset_cache'] = 'hit' if data.cache_hit else 'miss'
+
+        with timer.stage('split'):
+            X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=random_state,
+                                                                shuffle=pipeline.shuffle)
+
+        with timer.stage('fit'):
+            model = pipeline.estimator(**{**pipeline.params, **(params or {})},
+                                       random_state=random_state, n_jobs=n_jobs)
+            model.fit(X_train, y_train)
+
+        with timer.stage('evaluate'):
+            metrics = score_model(model, X_test, y_test, pipeline.classifier)
+
+        with timer.stage('save'):
+            os.makedirs(models_dir, exist_ok=True)
+            path = os.path.join(models_dir, f'{artifact}.pkl')
+            save_model(model, path)
+            save_holdout(holdout_path(models_dir, artifact), X_test, y_test)
+
+        result.update(status='trained', metrics=metrics, path=path,
+                      train_samples=len(X_train), test_samples=len(X_test))
+    except Exception as e:
+        result.update(status='failed', error=str(e))
+
+    result['seconds'] = time.perf_counter() - started
+    return result
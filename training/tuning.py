@@ -0,0 +1,209 @@
+"""
+Latency-aware hyperparameter search
+
+Serving latency grows with the number and depth of trees, so candidates
+are judged on two objectives: the validation score (accuracy for
+classifiers, R² for regressors) and the measured latency of the compiled
+forest the servers run (see inference/forest.py) for one row and for a
+batch.
+
+The search is successive halving. Every candidate is first fitted on a
+small share of the training rows; each rung keeps the best 1/`factor` of
+them and fits the survivors on `factor` times more rows, up to all of
+them. "Best" is non-dominated sorting on (score, single-row latency), so
+fast-but-decent candidates survive next to accurate-but-slow ones instead
+of being halved away on accuracy alone. Fits within a rung run in
+parallel under a core budget (as in training/orchestrator.py); latencies
+are then measured one model at a time, so they do not compete for cores.
+
+The result holds the Pareto front of the last rung and the recommended
+candidate: the fastest single-row model whose score meets the floor.
+Candidates are scored on a validation split carved from the training
+rows; the test split of `run_pipeline` is only used to report the final
+candidates' test score.
+"""
+
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+from sklearn.model_selection import ParameterSampler, train_test_split
+
+from inference.forest import CompiledForest, compile_forest
+from .datasets import load_dataset
+from .orchestrator import _init_worker, plan_cores
+from .pipelines import PIPELINES, score_model
+
+SEARCH_SPACE = {
+    'n_estimators': [10, 25, 50, 100, 200],
+    'max_depth': [4, 6, 8, 10, 15, None],
+    'min_samples_leaf': [1, 2, 5, 10],
+    'max_features': ['sqrt', 0.5, 1.0]
+}
+
+# Fewest training rows any candidate is fitted on
+MIN_SAMPLES = 200
+
+# Per-process cache of split datasets, so each worker loads a target once
+_splits = {}
+
+
+def score_name(classifier):
+    return 'accuracy' if classifier else 'r2'
+
+
+def _split(target, data_dir, files, random_state):
+    """(X_train, y_train, X_val, y_val, X_test, y_test), the test split being run_pipeline's"""
+    key = (target, data_dir, tuple(files or ()), random_state)
+    if key not in _splits:
+        pipeline = PIPELINES[target]
+        X, y = pipeline.load(load_dataset(pipeline.dataset, data_dir, files), random_state)
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=random_state,
+                                                            shuffle=pipeline.shuffle)
+        X_train, X_val, y_train, y_val = train_test_split(X_train, y_train, test_size=0.25,
+                                                          random_state=random_state, shuffle=pipeline.shuffle)
+        _splits[key] = (X_train, y_train, X_val, y_val, X_test, y_test)
+    return _splits[key]
+
+
+def fit_candidate(target, params, n_samples, data_dir='datasets', files=None, random_state=42, n_jobs=1):
+    """
+    Fit one candidate on the first `n_samples` training rows (shuffled
+    unless the pipeline is a time series); returns (model, score, seconds)
+    """
+    pipeline = PIPELINES[target]
+    X_train, y_train, X_val, y_val, _, _ = _split(target, data_dir, files, random_state)
+    started = time.perf_counter()
+    model = pipeline.estimator(**{**pipeline.params, **params}, random_state=random_state, n_jobs=n_jobs)
+    model.fit(X_train[:n_samples], y_train[:n_samples])
+    seconds = time.perf_counter() - started
+    return model, score_model(model, X_val, y_val, pipeline.classifier)[score_name(pipeline.classifier)], seconds
+
+
+def measure_latency(model, X, batch_rows=1000, repeats=50):
+    """
+    Median seconds of the compiled forest for one row and for `batch_rows`
+    rows (rows of `X`, repeated as needed), plus its size in bytes
+
+    `model` is a fitted sklearn forest or an already compiled one.
+    """
+    forest = model if isinstance(model, CompiledForest) else compile_forest(model)
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    batch = np.resize(X, (batch_rows, X.shape[1]))
+    forest.predict(batch[:1])
+
+    single = []
+    for i in range(repeats):
+        row = X[i % len(X):i % len(X) + 1]
+        started = time.perf_counter()
+        forest.predict(row)
+        single.append(time.perf_counter() - started)
+
+    batched = []
+    for _ in range(max(3, repeats // 10)):
+        started = time.perf_counter()
+        forest.predict(batch)
+        batched.append(time.perf_counter() - started)
+    return float(np.median(single)), float(np.median(batched)), forest.nbytes
+
+
+def dominates(a, b):
+    """Whether candidate `a` is at least as good as `b` on both objectives and better on one"""
+    return (a['score'] >= b['score'] and a['latency_1row'] <= b['latency_1row']
+            and (a['score'] > b['score'] or a['latency_1row'] < b['latency_1row']))
+
+
+def pareto_front(candidates):
+    """Candidates no other candidate dominates, fastest first"""
+    front = [c for c in candidates if not any(dominates(other, c) for other in candidates)]
+    return sorted(front, key=lambda c: c['latency_1row'])
+
+
+def select(candidates, keep):
+    """The `keep` best candidates: whole Pareto fronts in turn, the last one cut by score"""
+    remaining, kept = list(candidates), []
+    while remaining and len(kept) < keep:
+        front = sorted(pareto_front(remaining), key=lambda c: -c['score'])
+        kept.extend(front[:keep - len(kept)])
+        remaining = [c for c in remaining if all(c is not f for f in front)]
+    return kept
+
+
+def search(target, data_dir='datasets', files=None, n_candidates=24, factor=3, final_candidates=8, cores=None,
+           floor=None, batch_rows=1000, space=None, executor='process', random_state=42, on_rung=None):
+    """
+    Successive-halving search for `target` (a pipeline in PIPELINES)
+
+    `n_candidates` settings are sampled from `space` (default
+    SEARCH_SPACE) and cut by `factor` per rung until at most
+    `final_candidates` remain, which are fitted on all training rows and
+    form the front. `floor` is the minimum validation score of the
+    recommendation (default: the best score found, i.e. the fastest of the
+    most accurate). `on_rung(summary)` is called after each rung. Returns the final candidates with their
+    scores, latencies and sizes, the Pareto front, the recommendation and
+    a per-rung summary.
+    """
+    pipeline = PIPELINES[target]
+    metric = score_name(pipeline.classifier)
+    started = time.perf_counter()
+    X_train, _, X_val, _, X_test, y_test = _split(target, data_dir, files, random_state)
+
+    candidates = [{'params': params} for params in ParameterSampler(space or SEARCH_SPACE, n_candidates,
+                                                                    random_state=random_state)]
+    counts = [len(candidates)]
+    while counts[-1] > final_candidates:
+        counts.append(max(final_candidates, math.ceil(counts[-1] / factor)))
+    rungs = len(counts)
+    cores = cores or os.cpu_count() or 1
+    history = []
+
+    for rung in range(rungs):
+        n_samples = max(min(MIN_SAMPLES, len(X_train)), len(X_train) // factor ** (rungs - 1 - rung))
+        parallel, n_jobs = plan_cores(len(candidates), cores)
+        if executor == 'process' and parallel > 1:
+            pool = ProcessPoolExecutor(parallel, mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=_init_worker, initargs=(n_jobs,))
+        else:
+            pool = ThreadPoolExecutor(parallel, thread_name_prefix='tuning')
+        with pool:
+            fits = list(pool.map(fit_candidate, [target] * len(candidates), [c['params'] for c in candidates],
+                                 [n_samples] * len(candidates), [data_dir] * len(candidates),
+                                 [files] * len(candidates), [random_state] * len(candidates),
+                                 [n_jobs] * len(candidates)))
+
+        for candidate, (model, score, seconds) in zip(candidates, fits):
+            single, batch, nbytes = measure_latency(model, X_val, batch_rows)
+            candidate.update(rung=rung, n_samples=n_samples, score=score, fit_seconds=seconds,
+                             latency_1row=single, latency_batch=batch, nbytes=nbytes, model=model)
+
+        keep = counts[min(rung + 1, rungs - 1)]
+        summary = {'rung': rung, 'n_samples': n_samples, 'candidates': len(candidates), 'kept': keep,
+                   'best_score': max(c['score'] for c in candidates)}
+        history.append(summary)
+        if on_rung is not None:
+            on_rung(summary)
+        if rung < rungs - 1:
+            candidates = select(candidates, keep)
+
+    for candidate in candidates:
+        model = candidate.pop('model')
+        candidate['test_score'] = score_model(model, X_test, y_test, pipeline.classifier)[metric]
+
+    front = pareto_front(candidates)
+    floor = max(c['score'] for c in candidates) if floor is None else floor
+    eligible = [c for c in candidates if c['score'] >= floor]
+    recommended = min(eligible, key=lambda c: (c['latency_1row'], c['latency_batch'])) if eligible else None
+
+    return {
+        'target': target,
+        'metric': metric,
+        'floor': floor,
+        'candidates': sorted(candidates, key=lambda c: c['latency_1row']),
+        'front': front,
+        'recommended': recommended,
+        'rungs': history,
+        'seconds': time.perf_counter() - started
+    }
@@ -0,0 +1,88 @@
+"""
+Hyperparameter tuning for the Smart City models
+
+Runs a successive-halving search over forest size, depth and leaf
+settings on the cached datasets (see training/tuning.py) and prints the
+final candidates with their validation score and compiled-forest latency,
+marking the Pareto front and the smallest model meeting the floor.
+
+Usage: python tune_models.py [air_quality traffic energy] [--floor X]
+                             [--candidates 24] [--factor 3] [--cores N]
+                             [--batch-rows 1000] [--output results.json]
+                             [--save] [--data-dir datasets] [--models-dir models]
+
+--floor is a minimum accuracy (traffic) or R² (air quality, energy).
+--save trains the recommended settings on the full dataset and saves them
+as the pipeline's model.
+"""
+
+import argparse
+import json
+import warnings
+
+from training import PIPELINES, run_pipeline
+from training.tuning import search
+
+warnings.filterwarnings('ignore')
+
+
+def params_label(params):
+    return ', '.join(f'{name}={value}' for name, value in sorted(params.items()))
+
+
+def report(result):
+    """Final candidates, fastest first"""
+    print(f"\n{result['target']}: {len(result['candidates'])} finalists in {result['seconds']:.1f}s "
+          f"(floor {result['metric']} >= {result['floor']:.4f})")
+    print(f"  {'':2}{result['metric']:>9} {'test':>7} {'1 row':>9} {'batch':>9} {'size':>8}  settings")
+    for candidate in result['candidates']:
+        mark = ('*' if candidate is result['recommended'] else
+                'P' if any(candidate is c for c in result['front']) else ' ')
+        print(f"  {mark:2}{candidate['score']:>9.4f} {candidate['test_score']:>7.4f} "
+              f"{candidate['latency_1row'] * 1000:>7.3f}ms {candidate['latency_batch'] * 1000:>7.2f}ms "
+              f"{candidate['nbytes'] / 1024:>6.0f}KB  {params_label(candidate['params'])}")
+    print("  (* recommended, P Pareto front)")
+    if result['recommended'] is None:
+        print("  ✗ No candidate meets the floor")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tune the Smart City models for accuracy and latency')
+    parser.add_argument('targets', nargs='*', help=f"pipelines to tune: {', '.join(PIPELINES)} (default: all)")
+    parser.add_argument('--floor', type=float, default=None,
+                        help='minimum validation score of the recommendation (default: best found)')
+    parser.add_argument('--candidates', type=int, default=24)
+    parser.add_argument('--factor', type=int, default=3)
+    parser.add_argument('--cores', type=int, default=None, help='core budget (default: all cores)')
+    parser.add_argument('--batch-rows', type=int, default=1000)
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--save', action='store_true', help='train and save the recommended settings')
+    parser.add_argument('--data-dir', default='datasets')
+    parser.add_argument('--models-dir', default='models')
+    args = parser.parse_args()
+
+    unknown = [target for target in args.targets if target not in PIPELINES]
+    if unknown:
+        parser.error(f"Unknown targets: {', '.join(unknown)} (expected {', '.join(PIPELINES)})")
+
+    results = []
+    for target in args.targets or PIPELINES:
+        result = search(target, args.data_dir, n_candidates=args.candidates, factor=args.factor, cores=args.cores,
+                        floor=args.floor, batch_rows=args.batch_rows,
+                        on_rung=lambda rung: print(f"  rung {rung['rung']}: {rung['candidates']} candidates on "
+                                                   f"{rung['n_samples']} rows, best {rung['best_score']:.4f}"))
+        report(result)
+        results.append(result)
+
+        if args.save and result['recommended'] is not None:
+            trained = run_pipeline(target, args.data_dir, args.models_dir,
+                                   params=result['recommended']['params'])
+            print(f"  ✓ Saved {trained['path']}: {trained.get('metrics', trained.get('error'))}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
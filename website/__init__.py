@@ -51,9 +51,27 @@ def create_app(config_name='development'):
     with app.app_context():
         db.create_all()
         
+        from website.models import Prediction, PredictionHistory
+        # create_all skips columns and indexes added to existing tables
+        added = Prediction.upgrade_schema()
+        if added:
+            app.logger.info(f"Added predictions columns: {', '.join(added)}")
+        for index in Prediction.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+        if PredictionHistory.upgrade_schema():
+            app.logger.info('Rebuilt prediction_history with per-user counters')
+        
         # Load ML models
         from website.ml_models import init_model_manager
-        init_model_manager(app.config['MODELS_DIR'])
+        init_model_manager(app.config['MODELS_DIR'], app.config)
+        
+        # Prediction persistence (write-behind unless configured otherwise)
+        from website.recorder import init_recorder
+        init_recorder(app)
+    
+    # Background scoring jobs (resumes jobs left unfinished by a restart)
+    from website.jobs import init_job_runner
+    init_job_runner(app)
     
     # User loader for Flask-Login
     @login_manager.user_loader
@@ -0,0 +1,165 @@
+"""
+Request coalescing - score concurrent single-row predictions together
+"""
+
+import collections
+import os
+import threading
+import time
+from concurrent.futures import Future
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the batch size histogram buckets
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512]
+
+
+class MicroBatcher:
+    """
+    Collects concurrent rows for one model and scores them in one call
+
+    The first row to arrive opens a window of `window_ms`; every row that
+    arrives before the window closes (or until `max_rows` are queued) is
+    stacked into one matrix and passed to `score_fn`, which must return one
+    result per row. Each caller blocks until its own result is ready, at
+    most `timeout` seconds.
+
+    The worker thread starts with the first row submitted in each process,
+    so batchers created before a fork (e.g. gunicorn --preload) work in
+    every worker.
+    """
+
+    def __init__(self, score_fn, window_ms=2.0, max_rows=64, name='model', sample_size=2048, timeout=10.0):
+        self.score_fn = score_fn
+        self.window = window_ms / 1000.0
+        self.max_rows = max_rows
+        self.name = name
+        self.timeout = timeout
+
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._start_lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+
+        # Statistics
+        self._batches = 0
+        self._rows = 0
+        self._max_batch = 0
+        self._histogram = collections.Counter()
+        self._delays = collections.deque(maxlen=sample_size)
+        self._score_time = 0.0
+
+    def _ensure_worker(self):
+        """Start the worker thread in this process if it has none (a fork copies no threads)"""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked: the parent's queue and condition belong to its thread
+                self._queue = collections.deque()
+                self._cond = threading.Condition()
+            self._thread = threading.Thread(target=self._run, name=f'microbatch-{self.name}', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def submit(self, row):
+        """Queue one feature row and wait for its result; TimeoutError after `timeout` seconds"""
+        if not self._closed:
+            self._ensure_worker()
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f'Micro-batcher for {self.name} is closed')
+            self._queue.append((row, future, time.perf_counter()))
+            self._cond.notify()
+        return future.result(timeout=self.timeout)
+
+    def close(self):
+        """Stop the worker thread after draining queued rows"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._pid == os.getpid():
+            self._thread.join()
+
+    def _next_batch(self):
+        """Wait for a full batch or for the window to close"""
+        with self._cond:
+            while not self._queue:
+                if self._closed:
+                    return None
+                self._cond.wait()
+
+            deadline = self._queue[0][2] + self.window
+            while len(self._queue) < self.max_rows and not self._closed:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            count = min(len(self._queue), self.max_rows)
+            return [self._queue.popleft() for _ in range(count)]
+
+    def _run(self):
+        """Worker loop - one vectorized model call per batch"""
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            started = time.perf_counter()
+            try:
+                results = self.score_fn(np.vstack([row for row, _, _ in batch]))
+                if len(results) != len(batch):
+                    raise ValueError(f'{len(results)} results for a batch of {len(batch)} rows')
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                logger.error(f"Error in micro-batch for {self.name}: {str(e)}")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+            finished = time.perf_counter()
+
+            with self._cond:
+                size = len(batch)
+                self._batches += 1
+                self._rows += size
+                self._max_batch = max(self._max_batch, size)
+                self._histogram[next((b for b in BATCH_SIZE_BUCKETS if size <= b), None)] += 1
+                self._delays.extend(started - enqueued for _, _, enqueued in batch)
+                self._score_time += finished - started
+
+    def stats(self):
+        """Achieved batch sizes and queueing delay"""
+        with self._cond:
+            delays = np.array(self._delays) * 1000.0
+            batches = self._batches
+
+            histogram = {f'<={b}': self._histogram[b] for b in BATCH_SIZE_BUCKETS if self._histogram[b]}
+            if self._histogram[None]:
+                histogram[f'>{BATCH_SIZE_BUCKETS[-1]}'] = self._histogram[None]
+
+            return {
+                'window_ms': self.window * 1000.0,
+                'max_rows': self.max_rows,
+                'batches': batches,
+                'rows': self._rows,
+                'mean_batch_size': self._rows / batches if batches else 0.0,
+                'max_batch_size': self._max_batch,
+                'batch_size_histogram': histogram,
+                'mean_score_ms': self._score_time * 1000.0 / batches if batches else 0.0,
+                'queue_delay_ms': {
+                    'samples': len(delays),
+                    'mean': float(delays.mean()) if len(delays) else 0.0,
+                    'p50': float(np.percentile(delays, 50)) if len(delays) else 0.0,
+                    'p99': float(np.percentile(delays, 99)) if len(delays) else 0.0,
+                    'max': float(delays.max()) if len(delays) else 0.0
+                }
+            }
@@ -30,6 +30,59 @@ class Config:
     # Upload settings
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
     UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), '..', 'uploads')
+    
+    # Bulk CSV scoring (/api/score/<type>)
+    SCORING_CHUNK_SIZE = 5000  # rows per vectorized model call
+    SCORING_TRACE_MEMORY = False  # exact peak via tracemalloc (much slower) instead of RSS sampling
+    SCORING_RESULT_TTL = 24 * 60 * 60  # seconds a scored CSV is kept for download
+    
+    # Background scoring jobs (/api/jobs)
+    JOBS_EXECUTOR = os.environ.get('JOBS_EXECUTOR', 'process')  # or 'thread'
+    JOBS_MAX_WORKERS = int(os.environ.get('JOBS_MAX_WORKERS', 2))  # jobs running at once
+    JOBS_NICE = 10  # worker process priority, below interactive requests
+    JOBS_MAX_ACTIVE_PER_USER = 5  # queued + running
+    
+    # Batch prediction settings
+    MAX_BATCH_SIZE = 10000  # rows per /api/predict/batch request
+    
+    # History pagination
+    HISTORY_PAGE_SIZE = 50  # default rows per page
+    HISTORY_MAX_PAGE_SIZE = 500  # largest ?limit= accepted
+    HISTORY_STREAM_CHUNK = 1000  # rows per query when streaming NDJSON
+    
+    # Compiled forest inference (see inference/forest.py)
+    COMPILED_MODELS = True
+    COMPILED_MAX_ROWS = 1024  # larger inputs use sklearn's own predict
+    
+    # Models are loaded on first use; least recently used ones are evicted
+    # once their estimated size exceeds this budget (None = unlimited)
+    MODEL_MEMORY_BUDGET = (int(os.environ['MODEL_MEMORY_BUDGET_MB']) * 1024 * 1024
+                           if os.environ.get('MODEL_MEMORY_BUDGET_MB') else None)
+    
+    # Seconds between checks of MODELS_DIR for new or changed artifacts (0 = off)
+    MODEL_RELOAD_INTERVAL = float(os.environ.get('MODEL_RELOAD_INTERVAL', 5.0))
+    
+    # POST /api/models/reload forces a reload for operators (off: the watcher covers hot reload)
+    MODEL_RELOAD_API_ENABLED = os.environ.get('MODEL_RELOAD_API_ENABLED', 'false').lower() == 'true'
+    
+    # Single-row prediction result cache, cleared whenever a model is reloaded
+    PREDICTION_CACHE_ENABLED = os.environ.get('PREDICTION_CACHE_ENABLED', 'true').lower() == 'true'
+    PREDICTION_CACHE_SIZE = 10000  # entries per model
+    PREDICTION_CACHE_TTL = {'traffic': 300, 'air_quality': 60, 'energy': 60}  # seconds
+    # Round inputs before lookup, e.g. {'traffic': {'avg_speed': 1.0, 'vehicle_count': 5}}
+    PREDICTION_CACHE_QUANTIZE = {}
+    
+    # Prediction persistence: 'sync' commits before responding, 'async' writes
+    # behind in bulk (up to PREDICTION_WRITE_INTERVAL seconds of rows at risk)
+    PREDICTION_WRITE_MODE = os.environ.get('PREDICTION_WRITE_MODE', 'async')
+    PREDICTION_WRITE_BATCH_SIZE = 500  # rows per bulk insert
+    PREDICTION_WRITE_INTERVAL = 0.5  # seconds
+    PREDICTION_WRITE_QUEUE_SIZE = 10000  # queued rows before requests write inline
+    
+    # Micro-batching of concurrent single-row predictions (opt-in)
+    MICROBATCH_ENABLED = os.environ.get('MICROBATCH_ENABLED', 'false').lower() == 'true'
+    MICROBATCH_WINDOW_MS = float(os.environ.get('MICROBATCH_WINDOW_MS', 2.0))
+    MICROBATCH_MAX_ROWS = int(os.environ.get('MICROBATCH_MAX_ROWS', 64))
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -47,6 +100,10 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    MODEL_RELOAD_INTERVAL = 0
+    PREDICTION_CACHE_ENABLED = False
+    PREDICTION_WRITE_MODE = 'sync'
+    JOBS_EXECUTOR = 'thread'
 
 # Config dictionary
 config = {
@@ -0,0 +1,275 @@
+"""
+Background bulk scoring jobs
+
+Jobs are rows of the `scoring_jobs` table; the web process only queues
+them. Each job runs `run_job` in a pool of worker processes (or threads)
+that talks to the database directly, so progress, cancellation and results
+survive independently of any request. Worker processes build their own
+ModelManager over the same MODELS_DIR: memory-mapped `.forest` artifacts
+(see inference/artifacts.py) are then shared through the page cache rather
+than copied into each worker.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from flask import current_app
+
+from inference.core import get_core
+from . import db
+from . import ml_models
+from .models import ScoringJob
+from .scoring import score_csv, count_rows
+
+logger = logging.getLogger(__name__)
+
+EXECUTORS = ('process', 'thread')
+
+# Per-process caches of database engines and model managers for run_job
+_engines = {}
+_managers = {}
+
+
+class JobCancelled(Exception):
+    """Raised from the progress callback when a job was cancelled"""
+
+
+def _init_worker(nice, database_uri=None, models_dir=None):
+    """
+    Worker process initializer - yield the CPU to interactive requests and
+    build only what run_job needs: a database engine and a ModelManager
+    (no Flask app, watcher, recorder or batchers)
+    """
+    if nice and hasattr(os, 'nice'):
+        os.nice(nice)
+    if database_uri is not None:
+        _engine(database_uri)
+    if models_dir is not None:
+        _manager(models_dir)
+
+
+def importing_main():
+    """
+    True while a spawned worker re-imports the parent's main module (e.g.
+    app.py), as multiprocessing itself checks; entry points skip create_app then
+    """
+    return getattr(multiprocessing.current_process(), '_inheriting', False)
+
+
+def _engine(database_uri):
+    if database_uri not in _engines:
+        _engines[database_uri] = sa.create_engine(database_uri)
+    return _engines[database_uri]
+
+
+def _manager(models_dir):
+    """The app's ModelManager in thread mode, a per-process one in worker processes"""
+    shared = ml_models.get_model_manager()
+    if shared is not None and shared.models_dir == models_dir:
+        return shared
+    if models_dir not in _managers:
+        _managers[models_dir] = ml_models.ModelManager(models_dir, core=get_core(models_dir))
+    return _managers[models_dir]
+
+
+def _remove(path):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+def run_job(job_id, database_uri, models_dir, chunk_size=5000, progress_interval=0.5):
+    """
+    Execute one queued job
+
+    The job is claimed with a conditional UPDATE, so a job submitted twice
+    (e.g. resumed by two web workers) still runs once. Progress is written
+    at most every `progress_interval` seconds, which is also when a
+    cancellation request is noticed.
+    """
+    engine = _engine(database_uri)
+    jobs = ScoringJob.__table__
+
+    def finish(status, **values):
+        with engine.begin() as conn:
+            conn.execute(sa.update(jobs).where(jobs.c.id == job_id)
+                         .values(status=status, finished_at=datetime.utcnow(), **values))
+
+    with engine.begin() as conn:
+        job = conn.execute(sa.select(jobs).where(jobs.c.id == job_id)).mappings().one_or_none()
+        if job is None:
+            return
+        claimed = conn.execute(sa.update(jobs)
+                               .where(jobs.c.id == job_id, jobs.c.status == 'queued',
+                                      jobs.c.cancel_requested == sa.false())
+                               .values(status='running', started_at=datetime.utcnow(),
+                                       heartbeat_at=datetime.utcnow(), rows_done=0)).rowcount
+    if not claimed:
+        if job['status'] == 'queued' and job['cancel_requested']:
+            finish('cancelled')
+            _remove(job['input_path'])
+        return
+
+    last_update = time.monotonic()
+
+    def progress(rows_done):
+        nonlocal last_update
+        if time.monotonic() - last_update < progress_interval:
+            return
+        last_update = time.monotonic()
+        with engine.begin() as conn:
+            conn.execute(sa.update(jobs).where(jobs.c.id == job_id)
+                         .values(rows_done=rows_done, heartbeat_at=datetime.utcnow()))
+            cancelled = conn.execute(sa.select(jobs.c.cancel_requested).where(jobs.c.id == job_id)).scalar()
+        if cancelled:
+            raise JobCancelled()
+
+    try:
+        with engine.begin() as conn:
+            conn.execute(sa.update(jobs).where(jobs.c.id == job_id)
+                         .values(rows_total=count_rows(job['input_path'])))
+        stats = score_csv(_manager(models_dir), job['prediction_type'], job['input_path'],
+                          job['result_path'], chunk_size=chunk_size, progress=progress)
+    except JobCancelled:
+        finish('cancelled')
+        _remove(job['result_path'])
+        logger.info(f"Scoring job {job_id} cancelled")
+    except Exception as e:
+        finish('failed', error=str(e))
+        _remove(job['result_path'])
+        logger.error(f"Scoring job {job_id} failed: {str(e)}")
+    else:
+        finish('completed', rows_done=stats['rows'], stats=stats)
+        logger.info(f"Scoring job {job_id} completed ({stats['rows']} rows)")
+    finally:
+        _remove(job['input_path'])
+
+
+class JobRunner:
+    """
+    Runs queued scoring jobs on a bounded local pool
+
+    At most `max_workers` jobs run at once. With `executor='process'` (the
+    default) they run in spawned worker processes at nice level `nice`, so
+    a busy job pool neither holds the web process' GIL nor competes with
+    interactive predictions at equal priority. `executor='thread'` runs them
+    in the web process (useful for tests and single-core hosts). The pool
+    is created on first use.
+    """
+
+    def __init__(self, app, max_workers=2, executor='process', nice=10, chunk_size=5000,
+                 progress_interval=0.5, stale_after=60):
+        if executor not in EXECUTORS:
+            raise ValueError(f'Unknown job executor {executor!r} (expected one of {EXECUTORS})')
+
+        self.app = app
+        self.max_workers = max_workers
+        self.executor = executor
+        self.nice = nice
+        self.chunk_size = chunk_size
+        self.progress_interval = progress_interval
+        self.stale_after = stale_after
+
+        with app.app_context():
+            self.database_uri = db.engine.url.render_as_string(hide_password=False)
+            if executor == 'thread':
+                # Share the app's engine (and its pool) with the job threads
+                _engines[self.database_uri] = db.engine
+        self.models_dir = app.config['MODELS_DIR']
+
+        self._pool = None
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                if self.executor == 'process':
+                    self._pool = ProcessPoolExecutor(self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'),
+                                                     initializer=_init_worker,
+                                                     initargs=(self.nice, self.database_uri, self.models_dir))
+                else:
+                    self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix='scoring-job')
+            return self._pool
+
+    def submit(self, job_id):
+        """Schedule a queued job"""
+        future = self._get_pool().submit(run_job, job_id, self.database_uri, self.models_dir,
+                                         self.chunk_size, self.progress_interval)
+        with self._lock:
+            self._futures[job_id] = future
+        future.add_done_callback(lambda f: self._done(job_id, f))
+        return future
+
+    def _done(self, job_id, future):
+        with self._lock:
+            if self._futures.get(job_id) is future:
+                del self._futures[job_id]
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Scoring job {job_id} crashed: {future.exception()}")
+
+    def cancel(self, job_id):
+        """Drop a job that has not started; returns True if it never will"""
+        with self._lock:
+            future = self._futures.get(job_id)
+        return future is not None and future.cancel()
+
+    def active(self):
+        """Jobs submitted by this process that have not finished"""
+        with self._lock:
+            return len(self._futures)
+
+    def resume(self):
+        """
+        Resubmit unfinished jobs, e.g. after a restart
+
+        Running jobs whose heartbeat is older than `stale_after` seconds
+        lost their worker and are queued again from the start.
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_after)
+        with self.app.app_context():
+            db.session.execute(db.update(ScoringJob)
+                               .where(ScoringJob.status == 'running', ScoringJob.heartbeat_at < cutoff)
+                               .values(status='queued'))
+            db.session.commit()
+            queued = db.session.scalars(db.select(ScoringJob.id).where(ScoringJob.status == 'queued')
+                                        .order_by(ScoringJob.id)).all()
+        for job_id in queued:
+            self.submit(job_id)
+        return queued
+
+    def shutdown(self, wait=True):
+        """Stop the pool; unfinished jobs resume on the next start"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=True)
+
+
+def init_job_runner(app):
+    """Create the app's job runner from JOBS_* settings and resume unfinished jobs"""
+    runner = JobRunner(app,
+                       max_workers=app.config.get('JOBS_MAX_WORKERS', 2),
+                       executor=app.config.get('JOBS_EXECUTOR', 'process'),
+                       nice=app.config.get('JOBS_NICE', 10),
+                       chunk_size=app.config.get('SCORING_CHUNK_SIZE', 5000))
+    app.extensions['job_runner'] = runner
+    
+    # Only the web process owns the queue, never a spawned worker that
+    # re-imported a main module calling create_app
+    if not importing_main():
+        resumed = runner.resume()
+        if resumed:
+            logger.info(f"Resumed {len(resumed)} scoring jobs")
+    return runner
+
+
+def get_job_runner():
+    """Job runner of the current app"""
+    return current_app.extensions['job_runner']
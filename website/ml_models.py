@@ -2,90 +2,209 @@
 ML Model Management - Load and use trained models
 """
 
-import joblib
-import os
-import numpy as np
-from sklearn.preprocessing import StandardScaler
 import logging
 
+from inference.cache import PredictionCache
+from inference.core import MODEL_SPECS, InferenceCore, get_core
+from .batching import MicroBatcher
+
 logger = logging.getLogger(__name__)
 
+# Feature order expected by each model
+TRAFFIC_FEATURES = MODEL_SPECS['traffic_model'].features
+AIR_QUALITY_FEATURES = MODEL_SPECS['air_quality_model'].features
+ENERGY_FEATURES = MODEL_SPECS['energy_model'].features
+
+TRAFFIC_LABELS = MODEL_SPECS['traffic_model'].labels
+
+# Artifact (file name without extension) in MODELS_DIR serving each model
+MODEL_ARTIFACTS = {
+    'traffic': 'traffic_model',
+    'air_quality': 'air_quality_model',
+    'energy': 'energy_model'
+}
+
+# Feature order of each model
+MODEL_FEATURES = {
+    'traffic': TRAFFIC_FEATURES,
+    'air_quality': AIR_QUALITY_FEATURES,
+    'energy': ENERGY_FEATURES
+}
+
+
 class ModelManager:
-    """Manages loading and using ML models"""
+    """
+    Manages loading and using ML models
     
-    def __init__(self, models_dir='./models'):
+    Models are loaded and scored by an InferenceCore (inference/core.py);
+    pass `core` to share one with other frontends in the process.
+    """
+    
+    def __init__(self, models_dir='./models', compile_models=True, compiled_max_rows=1024,
+                 memory_budget=None, core=None):
         self.models_dir = models_dir
-        self.models = {}
+        self.batchers = {}
+        self.caches = {}
+        self.core = core or InferenceCore(models_dir, compile_models, compiled_max_rows, memory_budget)
+        self.registry = self.core.registry
+        self.registry.add_listener(self._model_changed)
         self.load_all_models()
     
     def load_all_models(self):
-        """Load all trained models"""
-        try:
-            # Load traffic model
-            traffic_model_path = os.path.join(self.models_dir, 'traffic_model.pkl')
-            if os.path.exists(traffic_model_path):
-                self.models['traffic'] = joblib.load(traffic_model_path)
-                logger.info("✓ Traffic model loaded")
-            else:
-                logger.warning(f"Traffic model not found at {traffic_model_path}")
-                self.models['traffic'] = None
-            
-            # Load air quality model
-            air_model_path = os.path.join(self.models_dir, 'air_quality_model.pkl')
-            if os.path.exists(air_model_path):
-                self.models['air_quality'] = joblib.load(air_model_path)
-                logger.info("✓ Air quality model loaded")
-            else:
-                logger.warning(f"Air quality model not found at {air_model_path}")
-                self.models['air_quality'] = None
-            
-            # Load energy model
-            energy_model_path = os.path.join(self.models_dir, 'energy_model.pkl')
-            if os.path.exists(energy_model_path):
-                self.models['energy'] = joblib.load(energy_model_path)
-                logger.info("✓ Energy model loaded")
+        """Discover model artifacts - each model is loaded on first use"""
+        available = self.registry.discover()
+        
+        for name, artifact in MODEL_ARTIFACTS.items():
+            label = name.replace('_', ' ').capitalize()
+            if artifact in available:
+                logger.info(f"✓ {label} model found")
             else:
-                logger.warning(f"Energy model not found at {energy_model_path}")
-                self.models['energy'] = None
+                logger.warning(f"{label} model not found in {self.models_dir}")
+    
+    def start_watching(self, interval=5.0):
+        """Reload changed artifacts from MODELS_DIR every `interval` seconds"""
+        self.registry.start_watcher(interval)
+    
+    def stop_watching(self):
+        """Stop watching MODELS_DIR"""
+        self.registry.stop_watcher()
+    
+    def reload_models(self):
+        """Check MODELS_DIR for changed artifacts now; returns the models reloaded"""
+        return self.registry.refresh()
+    
+    def model_versions(self):
+        """Active version and reload latency per model"""
+        return self.registry.versions()
+    
+    def _model_changed(self, artifact):
+        """Registry listener - cached results of a replaced model are stale"""
+        for name, cache in self.caches.items():
+            if MODEL_ARTIFACTS[name] == artifact:
+                cache.clear()
+                logger.info(f"Cleared {name} prediction cache after a model change")
+    
+    def enable_cache(self, ttl=None, max_entries=10000, quantize=None):
+        """
+        Cache single-row results per model
         
-        except Exception as e:
-            logger.error(f"Error loading models: {str(e)}")
+        `ttl` is seconds (None = until evicted) or a {model: seconds} dict;
+        models missing from the dict are not cached. `quantize` maps a model
+        to {feature: step} rounding rules, e.g.
+        {'traffic': {'avg_speed': 1.0, 'vehicle_count': 5}}.
+        """
+        quantize = quantize or {}
+        caches = {}
+        for name, features in MODEL_FEATURES.items():
+            if isinstance(ttl, dict) and name not in ttl:
+                continue
+            rules = quantize.get(name, {})
+            unknown = set(rules) - set(features)
+            if unknown:
+                raise ValueError(f"Unknown {name} features in quantization rules: {sorted(unknown)}")
+            caches[name] = PredictionCache(
+                max_entries=max_entries,
+                ttl=ttl.get(name) if isinstance(ttl, dict) else ttl,
+                quantize={features.index(feature): step for feature, step in rules.items()}
+            )
+        self.caches = caches
+        logger.info(f"✓ Prediction cache enabled for {', '.join(caches) or 'no models'}")
+    
+    def disable_cache(self):
+        """Stop caching results"""
+        self.caches = {}
+    
+    def cache_stats(self):
+        """Hit/miss/eviction counters per model"""
+        return {name: cache.stats() for name, cache in self.caches.items()}
+    
+    def is_available(self, name):
+        """Whether an artifact exists for the model, without loading it"""
+        return MODEL_ARTIFACTS[name] in self.registry
+    
+    def model_stats(self):
+        """Registry memory use and per-model load/evict/hit counters"""
+        return self.registry.stats()
+    
+    def enable_micro_batching(self, window_ms=2.0, max_rows=64):
+        """
+        Coalesce concurrent single-row predictions per model
+        
+        Rows arriving within `window_ms` of each other (up to `max_rows`)
+        are scored together in one vectorized call.
+        """
+        self.disable_micro_batching()
+        self.batchers = {
+            'traffic': MicroBatcher(self._score_traffic, window_ms, max_rows, name='traffic'),
+            'air_quality': MicroBatcher(self._score_air_quality, window_ms, max_rows, name='air_quality'),
+            'energy': MicroBatcher(self._score_energy, window_ms, max_rows, name='energy')
+        }
+        logger.info(f"✓ Micro-batching enabled ({window_ms} ms / {max_rows} rows)")
+    
+    def close(self):
+        """Stop background work and detach from the (possibly shared) core"""
+        self.disable_micro_batching()
+        self.stop_watching()
+        self.registry.remove_listener(self._model_changed)
+    
+    def disable_micro_batching(self):
+        """Stop micro-batching and score every request directly"""
+        batchers, self.batchers = self.batchers, {}
+        for batcher in batchers.values():
+            batcher.close()
+    
+    def batching_stats(self):
+        """Achieved batch sizes and queueing delay per model"""
+        return {name: batcher.stats() for name, batcher in self.batchers.items()}
+    
+    def _score_one(self, model_name, score_fn, features):
+        """
+        Score a single-row matrix
+        
+        Served from the result cache when possible, otherwise through the
+        micro-batcher when enabled. Returns a fresh dict the caller may modify.
+        """
+        cache = self.caches.get(model_name)
+        if cache is not None:
+            features = cache.prepare(features)
+            key = cache.key(features[0])
+            generation = cache.generation
+            cached = cache.get(key)
+            if cached is not None:
+                return dict(cached)
+        
+        batcher = self.batchers.get(model_name)
+        if batcher is not None:
+            result = batcher.submit(features[0])
+        else:
+            result = score_fn(features)[0]
+        
+        if cache is not None:
+            cache.put(key, dict(result), generation)
+        return result
     
     def predict_traffic(self, features_dict):
         """
         Predict traffic congestion
         
         Features required:
-        - hour: 0-23
+        - hour: 0-23 (or minute_of_day)
         - day_of_week: 0-6
-        - vehicle_count: int
+        - vehicle_count: int (or CarCount, BikeCount, BusCount, TruckCount)
         - avg_speed: float
         - weather: 0=sunny, 1=rainy, 2=foggy
+        
+        `features_dict` may also be a row of values in TRAFFIC_FEATURES
+        order, e.g. decoded and validated by inference/payloads.py.
         """
         try:
-            if self.models['traffic'] is None:
+            if not self.is_available('traffic'):
                 return {'error': 'Traffic model not loaded', 'status': 'error'}
             
-            # Prepare features
-            features = np.array([[
-                features_dict.get('hour', 0),
-                features_dict.get('day_of_week', 0),
-                features_dict.get('vehicle_count', 0),
-                features_dict.get('avg_speed', 0),
-                features_dict.get('weather', 0)
-            ]])
-            
-            prediction = self.models['traffic'].predict(features)[0]
-            probability = self.models['traffic'].predict_proba(features)[0]
-            
-            labels = ['Low', 'Medium', 'High']
-            
-            return {
-                'prediction': int(prediction),
-                'label': labels[int(prediction)],
-                'confidence': float(max(probability)),
-                'status': 'success'
-            }
+            features = self.core.matrix(MODEL_ARTIFACTS['traffic'], [features_dict])
+            result = self._score_one('traffic', self._score_traffic, features)
+            result['status'] = 'success'
+            return result
         
         except Exception as e:
             logger.error(f"Error in traffic prediction: {str(e)}")
@@ -98,16 +217,13 @@ class ModelManager:
         Features: various sensor readings
         """
         try:
-            if self.models['air_quality'] is None:
+            if not self.is_available('air_quality'):
                 return {'error': 'Air quality model not loaded', 'status': 'error'}
             
-            features = np.array([[features_dict.get(f'feature_{i}', 0) for i in range(10)]])
-            prediction = self.models['air_quality'].predict(features)[0]
-            
-            return {
-                'aqi': float(prediction),
-                'status': 'success'
-            }
+            features = self.core.matrix(MODEL_ARTIFACTS['air_quality'], [features_dict])
+            result = self._score_one('air_quality', self._score_air_quality, features)
+            result['status'] = 'success'
+            return result
         
         except Exception as e:
             logger.error(f"Error in air quality prediction: {str(e)}")
@@ -120,28 +236,129 @@ class ModelManager:
         Features: various consumption-related inputs
         """
         try:
-            if self.models['energy'] is None:
+            if not self.is_available('energy'):
                 return {'error': 'Energy model not loaded', 'status': 'error'}
             
-            features = np.array([[features_dict.get(f'feature_{i}', 0) for i in range(5)]])
-            prediction = self.models['energy'].predict(features)[0]
+            features = self.core.matrix(MODEL_ARTIFACTS['energy'], [features_dict])
+            result = self._score_one('energy', self._score_energy, features)
+            result['status'] = 'success'
+            return result
+        
+        except Exception as e:
+            logger.error(f"Error in energy prediction: {str(e)}")
+            return {'error': str(e), 'status': 'error'}
+    
+    def predict_traffic_batch(self, records):
+        """
+        Predict traffic congestion for many rows in one model call
+        
+        `records` is a list of feature dicts (see `predict_traffic`), a
+        DataFrame or a 2-D array with columns in TRAFFIC_FEATURES order.
+        """
+        try:
+            if not self.is_available('traffic'):
+                return {'error': 'Traffic model not loaded', 'status': 'error'}
+            
+            features = self.core.matrix(MODEL_ARTIFACTS['traffic'], records)
+            predictions = self._score_traffic(features)
             
             return {
-                'consumption_kwh': float(prediction),
+                'predictions': predictions,
+                'count': len(predictions),
                 'status': 'success'
             }
         
         except Exception as e:
-            logger.error(f"Error in energy prediction: {str(e)}")
+            logger.error(f"Error in batch traffic prediction: {str(e)}")
+            return {'error': str(e), 'status': 'error'}
+    
+    def predict_air_quality_batch(self, records):
+        """Predict air quality index for many rows in one model call"""
+        try:
+            if not self.is_available('air_quality'):
+                return {'error': 'Air quality model not loaded', 'status': 'error'}
+            
+            features = self.core.matrix(MODEL_ARTIFACTS['air_quality'], records)
+            predictions = self._score_air_quality(features)
+            
+            return {
+                'predictions': predictions,
+                'count': len(predictions),
+                'status': 'success'
+            }
+        
+        except Exception as e:
+            logger.error(f"Error in batch air quality prediction: {str(e)}")
             return {'error': str(e), 'status': 'error'}
+    
+    def predict_energy_batch(self, records):
+        """Predict energy consumption for many rows in one model call"""
+        try:
+            if not self.is_available('energy'):
+                return {'error': 'Energy model not loaded', 'status': 'error'}
+            
+            features = self.core.matrix(MODEL_ARTIFACTS['energy'], records)
+            predictions = self._score_energy(features)
+            
+            return {
+                'predictions': predictions,
+                'count': len(predictions),
+                'status': 'success'
+            }
+        
+        except Exception as e:
+            logger.error(f"Error in batch energy prediction: {str(e)}")
+            return {'error': str(e), 'status': 'error'}
+    
+    def _score_traffic(self, features):
+        """Score a feature matrix with a single predict_proba call"""
+        predictions, confidence = self.core.classify(MODEL_ARTIFACTS['traffic'], features)
+        
+        return [{
+            'prediction': int(prediction),
+            'label': TRAFFIC_LABELS[int(prediction)],
+            'confidence': float(conf)
+        } for prediction, conf in zip(predictions, confidence)]
+    
+    def _score_air_quality(self, features):
+        """Score a feature matrix with a single predict call"""
+        predictions = self.core.predict(MODEL_ARTIFACTS['air_quality'], features)
+        return [{'aqi': float(prediction)} for prediction in predictions]
+    
+    def _score_energy(self, features):
+        """Score a feature matrix with a single predict call"""
+        predictions = self.core.predict(MODEL_ARTIFACTS['energy'], features)
+        return [{'consumption_kwh': float(prediction)} for prediction in predictions]
 
 # Create global model manager instance
 model_manager = None
 
-def init_model_manager(models_dir):
-    """Initialize model manager"""
+def init_model_manager(models_dir, config=None):
+    """Initialize model manager, applying optional settings from `config`"""
     global model_manager
-    model_manager = ModelManager(models_dir)
+    config = config or {}
+    
+    if model_manager is not None:
+        model_manager.close()
+    
+    # Shared with any other frontend in this process using the same settings
+    core = get_core(models_dir,
+                    compile_models=config.get('COMPILED_MODELS', True),
+                    compiled_max_rows=config.get('COMPILED_MAX_ROWS', 1024),
+                    memory_budget=config.get('MODEL_MEMORY_BUDGET'))
+    model_manager = ModelManager(models_dir, core=core)
+    
+    if config.get('MICROBATCH_ENABLED'):
+        model_manager.enable_micro_batching(config.get('MICROBATCH_WINDOW_MS', 2.0),
+                                            config.get('MICROBATCH_MAX_ROWS', 64))
+    
+    if config.get('PREDICTION_CACHE_ENABLED'):
+        model_manager.enable_cache(ttl=config.get('PREDICTION_CACHE_TTL'),
+                                   max_entries=config.get('PREDICTION_CACHE_SIZE', 10000),
+                                   quantize=config.get('PREDICTION_CACHE_QUANTIZE'))
+    
+    if config.get('MODEL_RELOAD_INTERVAL'):
+        model_manager.start_watching(config['MODEL_RELOAD_INTERVAL'])
     return model_manager
 
 def get_model_manager():
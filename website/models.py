@@ -3,10 +3,14 @@ Database models for Smart City application
 """
 
 from datetime import datetime
+from sqlalchemy.dialects import postgresql, sqlite
 from . import db
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 
+# INSERT ... ON CONFLICT DO UPDATE per database dialect
+UPSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
 class User(UserMixin, db.Model):
     """User model for authentication"""
     __tablename__ = 'users'
@@ -19,6 +23,9 @@ class User(UserMixin, db.Model):
     
     # Relationships
     predictions = db.relationship('Prediction', backref='user', lazy=True, cascade='all, delete-orphan')
+    prediction_stats = db.relationship('PredictionHistory', backref='user', lazy=True,
+                                       cascade='all, delete-orphan')
+    scoring_jobs = db.relationship('ScoringJob', backref='user', lazy=True, cascade='all, delete-orphan')
     
     def set_password(self, password):
         """Hash and set password"""
@@ -35,6 +42,13 @@ class User(UserMixin, db.Model):
 class Prediction(db.Model):
     """Model to store prediction history"""
     __tablename__ = 'predictions'
+    __table_args__ = (
+        # Keyset pagination of a user's history, per type and overall (newest first)
+        db.Index('ix_predictions_user_type_created', 'user_id', 'prediction_type', 'created_at'),
+        db.Index('ix_predictions_user_created', 'user_id', 'created_at'),
+        # Incremental model updates read outcomes recorded since their watermark
+        db.Index('ix_predictions_type_observed', 'prediction_type', 'observed_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
@@ -43,20 +57,163 @@ class Prediction(db.Model):
     prediction_result = db.Column(db.Float, nullable=False)
     confidence = db.Column(db.Float, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    observed = db.Column(db.Float, nullable=True)  # actual outcome, reported after the fact
+    observed_at = db.Column(db.DateTime, nullable=True)
+    
+    @classmethod
+    def upgrade_schema(cls):
+        """Add columns missing from a predictions table created by an older version"""
+        existing = {column['name'] for column in db.inspect(db.engine).get_columns(cls.__tablename__)}
+        added = []
+        for column in cls.__table__.columns:
+            if column.name not in existing:
+                db.session.execute(db.text(
+                    f'ALTER TABLE {cls.__tablename__} ADD COLUMN {column.name} '
+                    f'{column.type.compile(db.engine.dialect)}'
+                ))
+                added.append(column.name)
+        db.session.commit()
+        return added
     
     def __repr__(self):
         return f'<Prediction {self.prediction_type} - {self.prediction_result}>'
 
 
+class ScoringJob(db.Model):
+    """Background bulk scoring job (see website/jobs.py)"""
+    __tablename__ = 'scoring_jobs'
+    
+    STATUSES = ('queued', 'running', 'completed', 'failed', 'cancelled')
+    FINISHED = ('completed', 'failed', 'cancelled')
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    prediction_type = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)
+    input_path = db.Column(db.String(500), nullable=False)
+    result_path = db.Column(db.String(500), nullable=False)
+    rows_total = db.Column(db.Integer, nullable=True)
+    rows_done = db.Column(db.Integer, nullable=False, default=0)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    error = db.Column(db.Text, nullable=True)
+    stats = db.Column(db.JSON, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)  # last progress update while running
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def to_dict(self):
+        """API representation"""
+        return {
+            'id': self.id,
+            'prediction_type': self.prediction_type,
+            'status': self.status,
+            'rows_total': self.rows_total,
+            'rows_done': self.rows_done,
+            'progress': self.rows_done / self.rows_total if self.rows_total else None,
+            'cancel_requested': self.cancel_requested,
+            'error': self.error,
+            'stats': self.stats,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+    
+    def __repr__(self):
+        return f'<ScoringJob {self.id} {self.prediction_type} - {self.status}>'
+
+
 class PredictionHistory(db.Model):
-    """Store statistics about predictions"""
+    """
+    Running prediction statistics per user and prediction type
+    
+    Updated in the same transaction as every Prediction insert (see
+    `increment`), so dashboards read at most one row per type instead of
+    counting the predictions table. `date` is the day of the latest
+    prediction. `rebuild` recomputes everything from the predictions table.
+    """
     __tablename__ = 'prediction_history'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'prediction_type', name='uq_prediction_history_user_type'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     prediction_type = db.Column(db.String(50), nullable=False, index=True)
     average_value = db.Column(db.Float, nullable=False)
     total_predictions = db.Column(db.Integer, default=1)
     date = db.Column(db.Date, default=datetime.utcnow, index=True)
     
+    @classmethod
+    def increment(cls, rows):
+        """Fold new Prediction rows (dicts of column values) into the counters"""
+        totals = {}
+        for row in rows:
+            key = (row['user_id'], row['prediction_type'])
+            count, value_sum = totals.get(key, (0, 0.0))
+            totals[key] = (count + 1, value_sum + row['prediction_result'])
+        
+        if not totals:
+            return
+        
+        # One upsert: concurrent first predictions of a (user, type) cannot
+        # both insert and fail the unique constraint
+        today = datetime.utcnow().date()
+        insert = UPSERTS[db.session.get_bind().dialect.name]
+        statement = insert(cls).values([
+            {'user_id': user_id, 'prediction_type': prediction_type, 'average_value': value_sum / count,
+             'total_predictions': count, 'date': today}
+            for (user_id, prediction_type), (count, value_sum) in totals.items()
+        ])
+        new = statement.excluded
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=[cls.user_id, cls.prediction_type],
+            set_={'average_value': (cls.average_value * cls.total_predictions
+                                    + new.average_value * new.total_predictions)
+                                   / (cls.total_predictions + new.total_predictions),
+                  'total_predictions': cls.total_predictions + new.total_predictions,
+                  'date': new.date}
+        ))
+    
+    @classmethod
+    def counts_for(cls, user_id):
+        """Prediction counts of one user: {'total': n, '<type>': n, ...}"""
+        counts = dict(db.session.execute(
+            db.select(cls.prediction_type, cls.total_predictions).where(cls.user_id == user_id)
+        ).all())
+        counts['total'] = sum(counts.values())
+        return counts
+    
+    @classmethod
+    def rebuild(cls):
+        """Recompute every counter from the predictions table; returns the row count"""
+        db.session.execute(db.delete(cls))
+        db.session.execute(db.insert(cls).from_select(
+            ['user_id', 'prediction_type', 'average_value', 'total_predictions', 'date'],
+            db.select(Prediction.user_id, Prediction.prediction_type,
+                      db.func.avg(Prediction.prediction_result), db.func.count(Prediction.id),
+                      db.func.date(db.func.max(Prediction.created_at)))
+            .group_by(Prediction.user_id, Prediction.prediction_type)
+        ))
+        db.session.commit()
+        return db.session.scalar(db.select(db.func.count(cls.id)))
+    
+    @classmethod
+    def upgrade_schema(cls):
+        """
+        Replace the pre-aggregate prediction_history table (no user_id)
+        
+        The old table was never written by the application, so it is
+        dropped, recreated and rebuilt from the predictions table.
+        """
+        columns = {column['name'] for column in db.inspect(db.engine).get_columns(cls.__tablename__)}
+        if 'user_id' in columns:
+            return False
+        
+        cls.__table__.drop(db.engine)
+        cls.__table__.create(db.engine)
+        cls.rebuild()
+        return True
+    
     def __repr__(self):
         return f'<PredictionHistory {self.prediction_type} - {self.date}>'
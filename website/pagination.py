@@ -0,0 +1,71 @@
+"""
+Keyset pagination over predictions, newest first
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from . import db
+from .models import Prediction
+
+
+def encode_cursor(prediction):
+    """Opaque cursor pointing just past `prediction`"""
+    created_at = prediction.created_at.isoformat() if prediction.created_at else None
+    key = json.dumps([created_at, prediction.id])
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """(created_at or None, id) from a cursor; ValueError if it is malformed"""
+    try:
+        created_at, prediction_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at) if created_at is not None else None, int(prediction_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f'Invalid cursor: {cursor!r}') from e
+
+
+def keyset_page(query, cursor=None, limit=50):
+    """
+    One page of `query` ordered by (created_at, id) descending
+
+    Seeks directly to the rows after `cursor` through the (user_id,
+    [prediction_type,] created_at) indexes, so every page costs the same
+    however deep it is. Rows without a created_at come after the dated
+    ones, newest id first, as a second seek on `created_at IS NULL`.
+    Returns (predictions, next_cursor); next_cursor is None on the last page.
+    """
+    created_at, prediction_id = decode_cursor(cursor) if cursor else (None, None)
+    predictions = []
+    if not cursor or created_at is not None:
+        # Dated rows: a plain row-value range, which the index can seek to
+        dated = query.filter(Prediction.created_at.isnot(None))
+        if cursor:
+            dated = dated.filter(db.tuple_(Prediction.created_at, Prediction.id) < (created_at, prediction_id))
+        predictions = dated.order_by(Prediction.created_at.desc(), Prediction.id.desc()).limit(limit + 1).all()
+        prediction_id = None
+
+    if len(predictions) <= limit:
+        # Undated rows, once the dated ones have run out
+        undated = query.filter(Prediction.created_at.is_(None))
+        if prediction_id is not None:
+            undated = undated.filter(Prediction.id < prediction_id)
+        predictions += undated.order_by(Prediction.id.desc()).limit(limit + 1 - len(predictions)).all()
+
+    if len(predictions) <= limit:
+        return predictions, None
+    predictions = predictions[:limit]
+    return predictions, encode_cursor(predictions[-1])
+
+
+def iter_keyset(query, chunk_size=1000):
+    """Yield every row of `query`, newest first, one keyset page at a time"""
+    cursor = None
+    while True:
+        predictions, cursor = keyset_page(query, cursor, chunk_size)
+        yield from predictions
+        if cursor is None:
+            return
+        # Release the identity map between chunks to keep memory flat
+        db.session.expunge_all()
@@ -0,0 +1,201 @@
+"""
+Write-behind persistence of predictions
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+import logging
+from datetime import datetime
+
+from flask import current_app
+
+from . import db
+from .models import Prediction, PredictionHistory
+
+logger = logging.getLogger(__name__)
+
+WRITE_MODES = ('sync', 'async')
+
+# Queue markers: write the current batch now / write it and stop
+_FLUSH = object()
+_STOP = object()
+
+
+class PredictionRecorder:
+    """
+    Stores Prediction rows for the API endpoints
+
+    `mode='sync'` inserts and commits before the request returns (a
+    prediction is durable once the client sees it). `mode='async'` queues the
+    rows and a background thread writes them with one bulk insert per
+    `batch_size` rows or every `flush_interval` seconds, whichever comes
+    first; up to one interval of predictions is lost if the process dies.
+    The queue holds at most `max_queue` rows - when it is full the caller
+    writes its rows inline instead of dropping them. Queued rows are
+    flushed at interpreter exit.
+
+    The writer thread starts with the first rows queued in each process,
+    so a recorder created before a fork (e.g. gunicorn --preload) writes
+    the rows of every worker.
+    """
+
+    def __init__(self, app, mode='async', batch_size=500, flush_interval=0.5, max_queue=10000):
+        if mode not in WRITE_MODES:
+            raise ValueError(f'Unknown prediction write mode {mode!r} (expected one of {WRITE_MODES})')
+
+        self.app = app
+        self.mode = mode
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._start_lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+
+        # Statistics
+        self._written = 0
+        self._flushes = 0
+        self._inline_writes = 0
+        self._failed = 0
+        self._flush_time = 0.0
+
+        if mode == 'async':
+            atexit.register(self.close)
+
+    def _ensure_writer(self):
+        """Start the writer thread in this process if it has none (a fork copies no threads)"""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked: rows in the copied queue are the parent's to write
+                self._queue = queue.Queue(maxsize=self.max_queue)
+            self._thread = threading.Thread(target=self._run, name='prediction-recorder', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def record(self, rows):
+        """Store Prediction rows given as dicts of column values"""
+        now = datetime.utcnow()
+        rows = [dict(row, created_at=row.get('created_at') or now) for row in rows]
+
+        if self.mode == 'sync' or self._closed:
+            self._write(rows)
+            return
+
+        self._ensure_writer()
+        for i, row in enumerate(rows):
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                # Backpressure: write the overflow on the request thread
+                with self._lock:
+                    self._inline_writes += 1
+                self._write(rows[i:])
+                return
+
+    def flush(self):
+        """Block until every queued row has been written"""
+        if self._pid == os.getpid() and not self._closed:
+            self._queue.put(_FLUSH)
+            self._queue.join()
+
+    def close(self):
+        """Flush queued rows and stop the background thread"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._pid == os.getpid():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    def _write(self, rows):
+        """One bulk insert, the matching counter updates and one commit"""
+        started = time.perf_counter()
+        try:
+            db.session.execute(db.insert(Prediction), rows)
+            PredictionHistory.increment(rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            with self._lock:
+                self._failed += len(rows)
+            raise
+
+        with self._lock:
+            self._written += len(rows)
+            self._flushes += 1
+            self._flush_time += time.perf_counter() - started
+
+    def _run(self):
+        """Background loop - collect rows until the batch is full or the interval ends"""
+        with self.app.app_context():
+            stopping = False
+            while not stopping:
+                batch = []
+                markers = 0
+                deadline = None
+
+                while len(batch) < self.batch_size:
+                    timeout = None if deadline is None else deadline - time.monotonic()
+                    if timeout is not None and timeout <= 0:
+                        break
+                    try:
+                        row = self._queue.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                    if row is _FLUSH or row is _STOP:
+                        markers += 1
+                        stopping = row is _STOP
+                        break
+                    batch.append(row)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+
+                try:
+                    if batch:
+                        self._write(batch)
+                except Exception as e:
+                    logger.error(f"Failed to store {len(batch)} predictions: {str(e)}")
+                finally:
+                    for _ in range(len(batch) + markers):
+                        self._queue.task_done()
+                    db.session.remove()
+
+    def stats(self):
+        """Queue depth and write counters"""
+        with self._lock:
+            return {
+                'mode': self.mode,
+                'queued': self._queue.qsize(),
+                'written': self._written,
+                'flushes': self._flushes,
+                'mean_rows_per_flush': self._written / self._flushes if self._flushes else 0.0,
+                'mean_flush_ms': self._flush_time * 1000.0 / self._flushes if self._flushes else 0.0,
+                'inline_writes': self._inline_writes,
+                'failed': self._failed
+            }
+
+
+def init_recorder(app):
+    """Create the app's recorder from PREDICTION_WRITE_* settings"""
+    recorder = PredictionRecorder(app,
+                                  mode=app.config.get('PREDICTION_WRITE_MODE', 'sync'),
+                                  batch_size=app.config.get('PREDICTION_WRITE_BATCH_SIZE', 500),
+                                  flush_interval=app.config.get('PREDICTION_WRITE_INTERVAL', 0.5),
+                                  max_queue=app.config.get('PREDICTION_WRITE_QUEUE_SIZE', 10000))
+    app.extensions['prediction_recorder'] = recorder
+    return recorder
+
+
+def get_recorder():
+    """Recorder of the current app"""
+    return current_app.extensions['prediction_recorder']
@@ -2,16 +2,57 @@
 Application routes - Main, Auth, and API endpoints
 """
 
-from flask import Blueprint, render_template, request, jsonify, session, redirect, url_for
+from flask import (Blueprint, render_template, request, jsonify, session, redirect, url_for, current_app,
+                   Response, stream_with_context, send_from_directory, abort)
 from flask_login import login_user, logout_user, login_required, current_user
 from . import db
-from .models import User, Prediction
-from .ml_models import get_model_manager
+from .models import User, Prediction, PredictionHistory, ScoringJob
+from .ml_models import get_model_manager, MODEL_ARTIFACTS, TRAFFIC_FEATURES
+from inference.features import SCHEMAS
+from inference.payloads import PayloadError, RecordDecoder, dumps, loads
+from .recorder import get_recorder
+from .pagination import keyset_page, iter_keyset
+from .scoring import score_csv, remove_stale_results, ScoringError, RESULT_SUFFIX
+from .jobs import get_job_runner
+import json
 import logging
+import os
+import uuid
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Batch endpoints: URL type -> (ModelManager method, stored type, result field)
+BATCH_PREDICTORS = {
+    'traffic': ('predict_traffic_batch', 'traffic', 'prediction'),
+    'air-quality': ('predict_air_quality_batch', 'air_quality', 'aqi'),
+    'energy': ('predict_energy_batch', 'energy', 'consumption_kwh')
+}
+
+# Stored type -> validating decoder of request records (traffic requires every feature)
+DECODERS = {
+    'traffic': RecordDecoder(SCHEMAS[MODEL_ARTIFACTS['traffic']], TRAFFIC_FEATURES),
+    'air_quality': RecordDecoder(SCHEMAS[MODEL_ARTIFACTS['air_quality']]),
+    'energy': RecordDecoder(SCHEMAS[MODEL_ARTIFACTS['energy']])
+}
+
+
+def request_payload():
+    """The parsed JSON body (orjson when installed); PayloadError if it is not JSON"""
+    return loads(request.get_data())
+
+
+def json_response(payload, status=200):
+    """JSON response encoded in one call, NumPy values included (for large result sets)"""
+    return Response(dumps(payload), status=status, mimetype='application/json')
+
+
+def row_errors_response(errors, error='Invalid records'):
+    """400 listing the rejected rows (at most 100) and why each was rejected"""
+    rows = list(errors)[:100]
+    return jsonify({'error': error, 'invalid_rows': rows,
+                    'row_errors': [{'row': i, 'error': errors[i]} for i in rows]}), 400
+
 # Create blueprints
 main_bp = Blueprint('main', __name__)
 auth_bp = Blueprint('auth', __name__)
@@ -30,27 +71,19 @@ def index():
 @login_required
 def dashboard():
     """Main dashboard"""
-    # Get user statistics
-    total_predictions = Prediction.query.filter_by(user_id=current_user.id).count()
+    # Get user statistics (maintained counters, one indexed read)
+    counts = PredictionHistory.counts_for(current_user.id)
     
     # Get recent predictions
     recent_predictions = Prediction.query.filter_by(user_id=current_user.id)\
         .order_by(Prediction.created_at.desc()).limit(5).all()
     
-    # Get prediction breakdown
-    traffic_count = Prediction.query.filter_by(user_id=current_user.id, 
-                                              prediction_type='traffic').count()
-    air_count = Prediction.query.filter_by(user_id=current_user.id, 
-                                          prediction_type='air_quality').count()
-    energy_count = Prediction.query.filter_by(user_id=current_user.id, 
-                                             prediction_type='energy').count()
-    
     return render_template('dashboard.html',
-                         total_predictions=total_predictions,
+                         total_predictions=counts['total'],
                          recent_predictions=recent_predictions,
-                         traffic_count=traffic_count,
-                         air_count=air_count,
-                         energy_count=energy_count)
+                         traffic_count=counts.get('traffic', 0),
+                         air_count=counts.get('air_quality', 0),
+                         energy_count=counts.get('energy', 0))
 
 @main_bp.route('/traffic')
 @login_required
@@ -74,9 +107,13 @@ def energy():
 @login_required
 def history():
     """Prediction history page"""
-    predictions = Prediction.query.filter_by(user_id=current_user.id)\
-        .order_by(Prediction.created_at.desc()).all()
-    return render_template('history.html', predictions=predictions)
+    try:
+        predictions, next_cursor = keyset_page(Prediction.query.filter_by(user_id=current_user.id),
+                                               request.args.get('cursor'),
+                                               current_app.config.get('HISTORY_PAGE_SIZE', 50))
+    except ValueError:
+        return redirect(url_for('main.history'))
+    return render_template('history.html', predictions=predictions, next_cursor=next_cursor)
 
 # ==================== AUTHENTICATION ROUTES ====================
 
@@ -154,36 +191,35 @@ def logout():
 def predict_traffic():
     """Traffic prediction API"""
     try:
-        data = request.get_json()
+        data = request_payload()
         model_manager = get_model_manager()
         
         if not model_manager:
             return jsonify({'error': 'Model manager not initialized'}), 500
         
-        # Validate input
-        required_fields = ['hour', 'day_of_week', 'vehicle_count', 'avg_speed', 'weather']
-        if not all(field in data for field in required_fields):
-            return jsonify({'error': 'Missing required fields'}), 400
+        # Validate input (required fields, types and ranges) into a feature row
+        features = DECODERS['traffic'].decode_one(data)
         
         # Make prediction
-        result = model_manager.predict_traffic(data)
+        result = model_manager.predict_traffic(features)
         
         if result.get('status') == 'error':
             return jsonify(result), 400
         
         # Store prediction in database
-        prediction = Prediction(
-            user_id=current_user.id,
-            prediction_type='traffic',
-            input_data=data,
-            prediction_result=result['prediction'],
-            confidence=result['confidence']
-        )
-        db.session.add(prediction)
-        db.session.commit()
+        get_recorder().record([{
+            'user_id': current_user.id,
+            'prediction_type': 'traffic',
+            'input_data': data,
+            'prediction_result': result['prediction'],
+            'confidence': result['confidence']
+        }])
         
         return jsonify(result)
     
+    except PayloadError as e:
+        return jsonify({'error': str(e)}), 400
+    
     except Exception as e:
         logger.error(f'Error in traffic prediction: {str(e)}')
         return jsonify({'error': str(e)}), 500
@@ -193,30 +229,34 @@ def predict_traffic():
 def predict_air_quality():
     """Air quality prediction API"""
     try:
-        data = request.get_json()
+        data = request_payload()
         model_manager = get_model_manager()
         
         if not model_manager:
             return jsonify({'error': 'Model manager not initialized'}), 500
         
+        # Validate input into a feature row
+        features = DECODERS['air_quality'].decode_one(data)
+        
         # Make prediction
-        result = model_manager.predict_air_quality(data)
+        result = model_manager.predict_air_quality(features)
         
         if result.get('status') == 'error':
             return jsonify(result), 400
         
         # Store prediction in database
-        prediction = Prediction(
-            user_id=current_user.id,
-            prediction_type='air_quality',
-            input_data=data,
-            prediction_result=result['aqi']
-        )
-        db.session.add(prediction)
-        db.session.commit()
+        get_recorder().record([{
+            'user_id': current_user.id,
+            'prediction_type': 'air_quality',
+            'input_data': data,
+            'prediction_result': result['aqi']
+        }])
         
         return jsonify(result)
     
+    except PayloadError as e:
+        return jsonify({'error': str(e)}), 400
+    
     except Exception as e:
         logger.error(f'Error in air quality prediction: {str(e)}')
         return jsonify({'error': str(e)}), 500
@@ -226,67 +266,388 @@ def predict_air_quality():
 def predict_energy():
     """Energy prediction API"""
     try:
-        data = request.get_json()
+        data = request_payload()
         model_manager = get_model_manager()
         
         if not model_manager:
             return jsonify({'error': 'Model manager not initialized'}), 500
         
+        # Validate input into a feature row
+        features = DECODERS['energy'].decode_one(data)
+        
         # Make prediction
-        result = model_manager.predict_energy(data)
+        result = model_manager.predict_energy(features)
         
         if result.get('status') == 'error':
             return jsonify(result), 400
         
         # Store prediction in database
-        prediction = Prediction(
-            user_id=current_user.id,
-            prediction_type='energy',
-            input_data=data,
-            prediction_result=result['consumption_kwh']
-        )
-        db.session.add(prediction)
-        db.session.commit()
+        get_recorder().record([{
+            'user_id': current_user.id,
+            'prediction_type': 'energy',
+            'input_data': data,
+            'prediction_result': result['consumption_kwh']
+        }])
         
         return jsonify(result)
     
+    except PayloadError as e:
+        return jsonify({'error': str(e)}), 400
+    
     except Exception as e:
         logger.error(f'Error in energy prediction: {str(e)}')
         return jsonify({'error': str(e)}), 500
 
+@api_bp.route('/predict/batch/<prediction_type>', methods=['POST'])
+@login_required
+def predict_batch(prediction_type):
+    """Batch prediction API - scores all rows with one model call"""
+    try:
+        if prediction_type not in BATCH_PREDICTORS:
+            return jsonify({'error': f'Unknown prediction type: {prediction_type}'}), 404
+        
+        method_name, stored_type, result_field = BATCH_PREDICTORS[prediction_type]
+        
+        data = request_payload()
+        model_manager = get_model_manager()
+        
+        if not model_manager:
+            return jsonify({'error': 'Model manager not initialized'}), 500
+        
+        # Accept either a bare list of rows or {"records": [...]}
+        records = data.get('records') if isinstance(data, dict) else data
+        
+        # Validate input
+        if not isinstance(records, list) or not records:
+            return jsonify({'error': 'Expected a non-empty list of records'}), 400
+        
+        max_rows = current_app.config.get('MAX_BATCH_SIZE', 10000)
+        if len(records) > max_rows:
+            return jsonify({'error': f'Batch too large (max {max_rows} rows)'}), 413
+        
+        # Decode and validate every row at once; any bad row rejects the batch
+        features, errors = DECODERS[stored_type].decode(records)
+        if errors:
+            return row_errors_response(errors)
+        
+        # Make predictions
+        result = getattr(model_manager, method_name)(features)
+        
+        if result.get('status') == 'error':
+            return jsonify(result), 400
+        
+        # Store predictions in database with one bulk insert
+        get_recorder().record([{
+            'user_id': current_user.id,
+            'prediction_type': stored_type,
+            'input_data': record,
+            'prediction_result': row[result_field],
+            'confidence': row.get('confidence')
+        } for record, row in zip(records, result['predictions'])])
+        
+        return json_response(result)
+    
+    except PayloadError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    except Exception as e:
+        logger.error(f'Error in batch prediction: {str(e)}')
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/score/<prediction_type>', methods=['POST'])
+@login_required
+def score_upload(prediction_type):
+    """
+    Bulk CSV scoring - upload a CSV (form field `file`) of feature rows
+    
+    The file is scored chunk by chunk and the results are written to the
+    upload folder; download them from the returned `result_url` within
+    SCORING_RESULT_TTL seconds, after which they are deleted.
+    """
+    if prediction_type not in BATCH_PREDICTORS:
+        return jsonify({'error': f'Unknown prediction type: {prediction_type}'}), 404
+    
+    stored_type = BATCH_PREDICTORS[prediction_type][1]
+    
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        return jsonify({'error': 'Expected a CSV file in the "file" field'}), 400
+    
+    model_manager = get_model_manager()
+    if not model_manager:
+        return jsonify({'error': 'Model manager not initialized'}), 500
+    
+    # Files are private to their owner: <user id>-<random>.csv
+    name = f'{current_user.id}-{uuid.uuid4().hex}'
+    folder = current_app.config['UPLOAD_FOLDER']
+    source = os.path.join(folder, f'{name}-input.csv')
+    result_name = f'{name}{RESULT_SUFFIX}'
+    destination = os.path.join(folder, result_name)
+
+    try:
+        remove_stale_results(folder, current_app.config.get('SCORING_RESULT_TTL', 24 * 60 * 60))
+        upload.save(source)
+        stats = score_csv(model_manager, stored_type, source, destination,
+                          chunk_size=current_app.config.get('SCORING_CHUNK_SIZE', 5000),
+                          trace_memory=current_app.config.get('SCORING_TRACE_MEMORY', False))
+    except Exception as e:
+        if os.path.exists(destination):
+            os.remove(destination)
+        if isinstance(e, ScoringError):
+            return jsonify({'error': str(e)}), 400
+        logger.error(f'Error in CSV scoring: {str(e)}')
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if os.path.exists(source):
+            os.remove(source)
+    
+    return jsonify({
+        'status': 'success',
+        'result_url': url_for('api.score_result', filename=result_name),
+        **stats
+    })
+
+@api_bp.route('/score/results/<filename>')
+@login_required
+def score_result(filename):
+    """Download a scored CSV"""
+    if not filename.startswith(f'{current_user.id}-'):
+        abort(404)
+    return send_from_directory(current_app.config['UPLOAD_FOLDER'], filename,
+                               mimetype='text/csv', as_attachment=True)
+
+@api_bp.route('/jobs/<prediction_type>', methods=['POST'])
+@login_required
+def submit_job(prediction_type):
+    """Queue a background scoring job for an uploaded CSV (form field `file`)"""
+    if prediction_type not in BATCH_PREDICTORS:
+        return jsonify({'error': f'Unknown prediction type: {prediction_type}'}), 404
+    
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        return jsonify({'error': 'Expected a CSV file in the "file" field'}), 400
+    
+    max_active = current_app.config.get('JOBS_MAX_ACTIVE_PER_USER', 5)
+    active = ScoringJob.query.filter(ScoringJob.user_id == current_user.id,
+                                     ScoringJob.status.in_(['queued', 'running'])).count()
+    if active >= max_active:
+        return jsonify({'error': f'Too many unfinished jobs (max {max_active})'}), 429
+    
+    name = f'{current_user.id}-{uuid.uuid4().hex}'
+    folder = current_app.config['UPLOAD_FOLDER']
+    job = ScoringJob(user_id=current_user.id,
+                     prediction_type=BATCH_PREDICTORS[prediction_type][1],
+                     input_path=os.path.join(folder, f'{name}-input.csv'),
+                     result_path=os.path.join(folder, f'{name}.csv'))
+    upload.save(job.input_path)
+    db.session.add(job)
+    db.session.commit()
+    
+    get_job_runner().submit(job.id)
+    return jsonify(job.to_dict()), 202
+
+@api_bp.route('/jobs')
+@login_required
+def list_jobs():
+    """Most recent scoring jobs of the current user"""
+    jobs = ScoringJob.query.filter_by(user_id=current_user.id)\
+        .order_by(ScoringJob.id.desc()).limit(50).all()
+    return jsonify({'data': [job.to_dict() for job in jobs]})
+
+@api_bp.route('/jobs/<int:job_id>')
+@login_required
+def get_job(job_id):
+    """Status and progress of a scoring job"""
+    job = ScoringJob.query.filter_by(id=job_id, user_id=current_user.id).first_or_404()
+    return jsonify(job.to_dict())
+
+@api_bp.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_job(job_id):
+    """Cancel a queued or running job"""
+    job = ScoringJob.query.filter_by(id=job_id, user_id=current_user.id).first_or_404()
+    if job.status in ScoringJob.FINISHED:
+        return jsonify({'error': f'Job already {job.status}'}), 409
+    
+    job.cancel_requested = True
+    if job.status == 'queued' and get_job_runner().cancel(job.id):
+        job.status = 'cancelled'
+        job.finished_at = datetime.utcnow()
+        if os.path.exists(job.input_path):
+            os.remove(job.input_path)
+    db.session.commit()
+    return jsonify(job.to_dict())
+
+@api_bp.route('/jobs/<int:job_id>/result')
+@login_required
+def job_result(job_id):
+    """Download the scored CSV of a completed job"""
+    job = ScoringJob.query.filter_by(id=job_id, user_id=current_user.id).first_or_404()
+    if job.status != 'completed':
+        return jsonify({'error': f'Job is {job.status}'}), 409
+    return send_from_directory(os.path.dirname(job.result_path), os.path.basename(job.result_path),
+                               mimetype='text/csv', as_attachment=True,
+                               download_name=f'{job.prediction_type}-job-{job.id}.csv')
+
+@api_bp.route('/stats/jobs')
+@login_required
+def stats_jobs():
+    """Get scoring job pool statistics and the current user's job counts"""
+    runner = get_job_runner()
+    counts = dict(db.session.execute(
+        db.select(ScoringJob.status, db.func.count(ScoringJob.id))
+        .where(ScoringJob.user_id == current_user.id).group_by(ScoringJob.status)
+    ).all())
+    return jsonify({
+        'executor': runner.executor,
+        'max_workers': runner.max_workers,
+        'active_in_this_process': runner.active(),
+        'jobs': counts
+    })
+
 @api_bp.route('/history/<prediction_type>')
 @login_required
 def get_history(prediction_type):
-    """Get prediction history for a type"""
-    predictions = Prediction.query.filter_by(
+    """
+    Get prediction history for a type, newest first
+    
+    Pages of `limit` rows; pass the returned `next_cursor` as `cursor` for
+    the next page. `format=ndjson` streams the whole history instead, one
+    JSON object per line.
+    """
+    query = Prediction.query.filter_by(
         user_id=current_user.id,
         prediction_type=prediction_type
-    ).order_by(Prediction.created_at.desc()).all()
+    )
+    
+    if request.args.get('format') == 'ndjson':
+        def generate():
+            for p in iter_keyset(query, current_app.config.get('HISTORY_STREAM_CHUNK', 1000)):
+                yield json.dumps(serialize_prediction(p)) + '\n'
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    
+    try:
+        limit = int(request.args.get('limit', current_app.config.get('HISTORY_PAGE_SIZE', 50)))
+        limit = max(1, min(limit, current_app.config.get('HISTORY_MAX_PAGE_SIZE', 500)))
+        predictions, next_cursor = keyset_page(query, request.args.get('cursor'), limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     return jsonify({
-        'data': [{
-            'id': p.id,
-            'result': p.prediction_result,
-            'confidence': p.confidence,
-            'created_at': p.created_at.isoformat()
-        } for p in predictions]
+        'data': [serialize_prediction(p) for p in predictions],
+        'next_cursor': next_cursor
     })
 
+def serialize_prediction(p):
+    """History entry as returned by the API"""
+    return {
+        'id': p.id,
+        'result': p.prediction_result,
+        'confidence': p.confidence,
+        'created_at': p.created_at.isoformat() if p.created_at else None,
+        'observed': p.observed
+    }
+
+@api_bp.route('/predictions/<int:prediction_id>/observed', methods=['POST'])
+@login_required
+def record_observed(prediction_id):
+    """
+    Record the actual outcome of a prediction
+    
+    Body: {"value": number}, in the units of the prediction (the level for
+    traffic). Outcomes feed incremental model updates (`flask update-models`).
+    """
+    prediction = Prediction.query.filter_by(id=prediction_id, user_id=current_user.id).first_or_404()
+    value = (request.get_json(silent=True) or {}).get('value')
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return jsonify({'error': 'Expected a numeric "value"'}), 400
+    
+    prediction.observed = float(value)
+    prediction.observed_at = datetime.utcnow()
+    db.session.commit()
+    return jsonify(serialize_prediction(prediction))
+
+@api_bp.route('/stats/batching')
+@login_required
+def stats_batching():
+    """Get micro-batching statistics"""
+    model_manager = get_model_manager()
+    
+    if not model_manager:
+        return jsonify({'error': 'Model manager not initialized'}), 500
+    
+    return jsonify({
+        'enabled': bool(model_manager.batchers),
+        'models': model_manager.batching_stats()
+    })
+
+@api_bp.route('/stats/models')
+@login_required
+def stats_models():
+    """Get model registry statistics"""
+    model_manager = get_model_manager()
+    
+    if not model_manager:
+        return jsonify({'error': 'Model manager not initialized'}), 500
+    
+    return jsonify(model_manager.model_stats())
+
+@api_bp.route('/stats/cache')
+@login_required
+def stats_cache():
+    """Get prediction cache statistics"""
+    model_manager = get_model_manager()
+
+    if not model_manager:
+        return jsonify({'error': 'Model manager not initialized'}), 500
+
+    return jsonify({
+        'enabled': bool(model_manager.caches),
+        'models': model_manager.cache_stats()
+    })
+
+@api_bp.route('/stats/recorder')
+@login_required
+def stats_recorder():
+    """Get prediction write-behind statistics"""
+    return jsonify(get_recorder().stats())
+
+@api_bp.route('/models/status')
+@login_required
+def models_status():
+    """Get the active version and reload latency of each model"""
+    model_manager = get_model_manager()
+
+    if not model_manager:
+        return jsonify({'error': 'Model manager not initialized'}), 500
+
+    return jsonify(model_manager.model_versions())
+
+@api_bp.route('/models/reload', methods=['POST'])
+@login_required
+def models_reload():
+    """Reload models whose artifacts changed, without waiting for the watcher (MODEL_RELOAD_API_ENABLED)"""
+    if not current_app.config.get('MODEL_RELOAD_API_ENABLED'):
+        return jsonify({'error': 'Forced model reloads are disabled'}), 403
+    
+    model_manager = get_model_manager()
+
+    if not model_manager:
+        return jsonify({'error': 'Model manager not initialized'}), 500
+
+    reloaded = model_manager.reload_models()
+    return jsonify({'reloaded': reloaded, **model_manager.model_versions()})
+
 @api_bp.route('/stats/dashboard')
 @login_required
 def stats_dashboard():
     """Get dashboard statistics"""
-    total = Prediction.query.filter_by(user_id=current_user.id).count()
-    traffic = Prediction.query.filter_by(user_id=current_user.id, 
-                                        prediction_type='traffic').count()
-    air = Prediction.query.filter_by(user_id=current_user.id, 
-                                    prediction_type='air_quality').count()
-    energy = Prediction.query.filter_by(user_id=current_user.id, 
-                                       prediction_type='energy').count()
+    counts = PredictionHistory.counts_for(current_user.id)
     
     return jsonify({
-        'total': total,
-        'traffic': traffic,
-        'air_quality': air,
-        'energy': energy
+        'total': counts['total'],
+        'traffic': counts.get('traffic', 0),
+        'air_quality': counts.get('air_quality', 0),
+        'energy': counts.get('energy', 0)
     })
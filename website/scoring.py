@@ -0,0 +1,242 @@
+"""
+Bulk CSV scoring - stream a file through a model in fixed-size chunks
+"""
+
+import csv
+import itertools
+import os
+import threading
+import time
+import tracemalloc
+import logging
+
+import numpy as np
+
+from inference.features import SCHEMAS
+from .ml_models import MODEL_ARTIFACTS, TRAFFIC_FEATURES
+
+logger = logging.getLogger(__name__)
+
+# Model -> (ModelManager batch method, result columns, required input columns)
+CSV_SCORERS = {
+    'traffic': ('predict_traffic_batch', ['prediction', 'label', 'confidence'], TRAFFIC_FEATURES),
+    'air_quality': ('predict_air_quality_batch', ['aqi'], []),
+    'energy': ('predict_energy_batch', ['consumption_kwh'], [])
+}
+
+
+# Suffix of the results of /api/score uploads, which expire (see remove_stale_results)
+RESULT_SUFFIX = '.scored.csv'
+
+
+def remove_stale_results(folder, max_age):
+    """Delete scored CSVs (RESULT_SUFFIX) in `folder` last written over `max_age` seconds ago; returns how many"""
+    cutoff = time.time() - max_age
+    removed = 0
+    try:
+        entries = list(os.scandir(folder))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        if not entry.name.endswith(RESULT_SUFFIX):
+            continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass  # removed concurrently by another worker
+    return removed
+
+
+def count_rows(path):
+    """Data rows in a CSV file (lines after the header), without parsing it"""
+    lines = 0
+    last = b'\n'
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            lines += block.count(b'\n')
+            last = block[-1:]
+    if last != b'\n':
+        lines += 1
+    return max(lines - 1, 0)
+
+
+class ScoringError(ValueError):
+    """The input file cannot be scored"""
+
+
+class PeakMemory:
+    """
+    Peak memory while the block runs
+
+    By default a background thread samples the process RSS from
+    /proc/self/statm every `interval` seconds (Linux; `peak` stays None
+    elsewhere) - cheap, but it also counts other threads. `trace=True`
+    uses tracemalloc instead, which counts exactly the Python and NumPy
+    allocations made meanwhile but slows allocation-heavy code several
+    times over.
+    """
+
+    PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+    def __init__(self, trace=False, interval=0.005):
+        self.trace = trace
+        self.interval = interval
+        self.start = None
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._was_tracing = False
+
+    @classmethod
+    def rss(cls):
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * cls.PAGE_SIZE
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def __enter__(self):
+        if self.trace:
+            self._was_tracing = tracemalloc.is_tracing()
+            if not self._was_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            self.start = tracemalloc.get_traced_memory()[0]
+        else:
+            self.start = self.peak = self.rss()
+            if self.start is not None:
+                self._thread = threading.Thread(target=self._sample, daemon=True)
+                self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.rss() or 0)
+
+    def __exit__(self, *exc):
+        if self.trace:
+            self.peak = tracemalloc.get_traced_memory()[1]
+            if not self._was_tracing:
+                tracemalloc.stop()
+        elif self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self.peak = max(self.peak, self.rss() or 0)
+        return False
+
+    @property
+    def growth(self):
+        """Peak above the level when the block started"""
+        return None if self.peak is None else self.peak - self.start
+
+
+def parse_chunk(rows, columns):
+    """
+    Feature matrix for a chunk of CSV rows
+
+    `columns` holds the CSV column index of each model feature (None =
+    absent, scored as 0). Returns (matrix, bad) where `bad` lists the
+    positions of rows with missing or non-numeric values; their matrix rows
+    are zeros.
+    """
+    values = [['0' if i is None else row[i] if i < len(row) else '' for i in columns] for row in rows]
+    try:
+        return np.array(values, dtype=np.float32), []
+    except ValueError:
+        pass
+
+    # Slow path: find the offending rows
+    features = np.zeros((len(values), len(columns)), dtype=np.float32)
+    bad = []
+    for i, row in enumerate(values):
+        try:
+            features[i] = [float(value) for value in row]
+        except ValueError:
+            bad.append(i)
+    return features, bad
+
+
+def score_csv(model_manager, model_name, source, destination, chunk_size=5000,
+              progress=None, trace_memory=False):
+    """
+    Score every row of the CSV file `source` and write `destination`
+
+    Rows are read `chunk_size` at a time and each chunk is scored with one
+    vectorized model call, so memory stays bounded by the chunk size rather
+    than the file size. The output repeats the input columns followed by
+    the result columns and an `error` column for rows that could not be
+    parsed; rows shorter or longer than the header are padded or cut to it
+    so the result columns stay aligned. Model features missing from the header score as 0 unless the
+    model requires them (see CSV_SCORERS).
+
+    `progress(rows_done)` is called after every chunk; raising from it stops
+    the job. Returns row counts, rows/second and peak memory (see
+    PeakMemory; `trace_memory` selects tracemalloc).
+    """
+    method_name, result_columns, required = CSV_SCORERS[model_name]
+    schema = SCHEMAS[MODEL_ARTIFACTS[model_name]]
+
+    started = time.perf_counter()
+    rows_done = 0
+    errors = 0
+    chunks = 0
+
+    with PeakMemory(trace=trace_memory) as memory:
+        with open(source, newline='', encoding='utf-8-sig') as infile, \
+                open(destination, 'w', newline='', encoding='utf-8') as outfile:
+            reader = csv.reader(infile)
+            writer = csv.writer(outfile)
+
+            header = next(reader, None)
+            if not header:
+                raise ScoringError('The CSV file is empty')
+            header = [name.strip() for name in header]
+            missing = [name for name in required if name not in header]
+            if missing:
+                raise ScoringError(f"Missing required columns: {', '.join(missing)}")
+
+            columns = schema.positions(header)
+            width = len(header)
+            writer.writerow(header + result_columns + ['error'])
+
+            while True:
+                rows = list(itertools.islice(reader, chunk_size))
+                if not rows:
+                    break
+
+                matrix, bad = parse_chunk(rows, columns)
+                result = getattr(model_manager, method_name)(matrix)
+                if result.get('status') == 'error':
+                    raise ScoringError(result['error'])
+
+                bad = set(bad)
+                for i, (row, prediction) in enumerate(zip(rows, result['predictions'])):
+                    row = row[:width] + [''] * (width - len(row))
+                    if i in bad:
+                        writer.writerow(row + [''] * len(result_columns) + ['invalid value'])
+                    else:
+                        writer.writerow(row + [prediction[name] for name in result_columns] + [''])
+
+                rows_done += len(rows)
+                errors += len(bad)
+                chunks += 1
+                if progress is not None:
+                    progress(rows_done)
+
+    seconds = time.perf_counter() - started
+
+    logger.info(f"Scored {rows_done} {model_name} rows in {seconds:.2f}s "
+                f"({rows_done / seconds if seconds else 0:.0f} rows/s, "
+                f"peak memory +{(memory.growth or 0) / 1e6:.1f} MB)")
+    return {
+        'rows': rows_done,
+        'errors': errors,
+        'chunks': chunks,
+        'seconds': seconds,
+        'rows_per_second': rows_done / seconds if seconds else 0.0,
+        'peak_memory_bytes': memory.peak,
+        'peak_memory_growth_bytes': memory.growth,
+        'memory_measure': 'tracemalloc' if trace_memory else 'rss'
+    }
@@ -0,0 +1,53 @@
+"""
+Incremental model updates from recorded outcomes
+
+Predictions whose actual outcome was reported (`Prediction.observed`, see
+POST /api/predictions/<id>/observed) form the training window of the
+served model of their type. The position reached is kept as the
+'predictions' watermark in the model's update log, so every run only adds
+the outcomes recorded since the previous one (see training/incremental.py).
+"""
+
+from datetime import datetime
+
+from inference.features import SCHEMAS
+from training.incremental import read_log, update_model
+from . import db
+from .ml_models import MODEL_ARTIFACTS
+from .models import Prediction
+
+SOURCE = 'predictions'
+
+
+def observed_window(prediction_type, watermark=None):
+    """(X, y, new watermark) of the outcomes recorded after `watermark`"""
+    query = (db.select(Prediction.id, Prediction.input_data, Prediction.observed, Prediction.observed_at)
+             .where(Prediction.prediction_type == prediction_type, Prediction.observed.is_not(None))
+             .order_by(Prediction.observed_at, Prediction.id))
+    if watermark:
+        query = query.where(db.tuple_(Prediction.observed_at, Prediction.id)
+                            > (datetime.fromisoformat(watermark['observed_at']), watermark['id']))
+
+    rows = db.session.execute(query).all()
+    if not rows:
+        return None, None, watermark
+    X = SCHEMAS[MODEL_ARTIFACTS[prediction_type]].transform([row.input_data for row in rows])
+    y = [row.observed for row in rows]
+    return X, y, {'observed_at': rows[-1].observed_at.isoformat(), 'id': rows[-1].id}
+
+
+def update_from_predictions(prediction_type, models_dir, new_trees=10, max_trees=None, min_rows=10,
+                            random_state=None):
+    """
+    Update the served model of `prediction_type` with its new outcomes
+
+    Returns the log entry, or None when fewer than `min_rows` outcomes
+    were recorded since the last update (they wait for the next run).
+    """
+    artifact = MODEL_ARTIFACTS[prediction_type]
+    watermark = read_log(models_dir, artifact)['watermarks'].get(SOURCE)
+    X, y, new_watermark = observed_window(prediction_type, watermark)
+    if X is None or len(X) < min_rows:
+        return None
+    return update_model(artifact, X, y, models_dir, new_trees, max_trees, source=SOURCE,
+                        watermark=new_watermark, random_state=random_state)